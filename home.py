@@ -10,7 +10,7 @@ st.set_page_config(
 
 import pandas as pd
 import base64
-from utils.supabase_db import init_db, get_branding_settings
+from utils.backend import init_db, get_branding_settings, get_icone, get_logo
 from utils.auth import init_auth, check_auth, login, logout
 
 # Initialize session state variables
@@ -255,7 +255,8 @@ st.markdown("""
 
 # Get branding settings
 try:
-    logo_bytes, welcome_message = get_branding_settings()
+    # Variante a 160px per .logo-container: None se non è stata generata
+    logo_bytes, welcome_message = get_branding_settings(variant=160)
 except Exception as e:
     st.error(f"Errore nel caricamento delle impostazioni: {str(e)}")
     logo_bytes, welcome_message = None, None
@@ -288,13 +289,33 @@ else:
     # Logo centrato
     if logo_bytes:
         try:
-            st.markdown('<div class="logo-container">', unsafe_allow_html=True)
-            st.image(logo_bytes, use_container_width=True)
-            st.markdown('</div>', unsafe_allow_html=True)
+            # Variante a 160px per .logo-container, a 320px per gli schermi HiDPI se generata
+            logo_1x = base64.b64encode(logo_bytes).decode() if isinstance(logo_bytes, bytes) else logo_bytes
+            logo_2x = get_logo(variant=320)
+            if isinstance(logo_2x, bytes):
+                logo_2x = base64.b64encode(logo_2x).decode()
+            srcset = f' srcset="data:image/png;base64,{logo_2x} 2x"' if logo_2x else ''
+            st.markdown(f"""
+            <div class="logo-container">
+                <img src="data:image/png;base64,{logo_1x}"{srcset} alt="Logo"/>
+            </div>
+            """, unsafe_allow_html=True)
         except:
             st.markdown("<div class='emoji-header'>📚 💬 🎓</div>", unsafe_allow_html=True)
     else:
-        st.markdown("<div class='emoji-header'>📚 💬 🎓</div>", unsafe_allow_html=True)
+        # Logo senza varianti: st.image lo serve come file, senza incorporarlo nella pagina
+        try:
+            logo_original = get_logo()
+            if isinstance(logo_original, str):
+                logo_original = base64.b64decode(logo_original)
+        except Exception:
+            logo_original = None
+        if logo_original:
+            st.markdown('<div class="logo-container">', unsafe_allow_html=True)
+            st.image(logo_original, use_container_width=True)
+            st.markdown('</div>', unsafe_allow_html=True)
+        else:
+            st.markdown("<div class='emoji-header'>📚 💬 🎓</div>", unsafe_allow_html=True)
 
     # Layout principale (responsive)
     st.markdown('<div class="main-content">', unsafe_allow_html=True)
@@ -348,15 +369,18 @@ else:
         st.markdown('<div class="link-grid">', unsafe_allow_html=True)
         
         ordered_links = st.session_state.custom_links.sort_values('ordine')
+        # Le icone non sono in sessione: vengono lette (e tenute in cache) solo qui
+        icone = get_icone(ordered_links)
         for _, link in ordered_links.iterrows():
-            if link.icona:
+            icona = icone.get(link.id)
+            if icona:
                 try:
                     # Gestisce diversi formati di icona
-                    if isinstance(link.icona, bytes):
-                        encoded_image = base64.b64encode(link.icona).decode()
-                    elif isinstance(link.icona, str):
+                    if isinstance(icona, bytes):
+                        encoded_image = base64.b64encode(icona).decode()
+                    elif isinstance(icona, str):
                         # Se è già una stringa base64, usala direttamente
-                        encoded_image = link.icona
+                        encoded_image = icona
                     else:
                         raise ValueError("Formato icona non supportato")
 
@@ -1,8 +1,11 @@
 import streamlit as st
 import pandas as pd
 from datetime import datetime
-from utils.supabase_db import add_studente, add_progresso, update_studente, delete_studente
-from utils.helpers import filter_dataframe
+from utils.backend import add_studente, add_progresso, update_studente, delete_studente, report_writes
+from utils.helpers import filter_dataframe, formatta_data, pagina_dataframe
+from utils.indici import cerca_studenti, etichette, record_per_id, righe_studente
+from utils.export import EXPORT_FORMATS, export_studenti
+from utils.table_types import TABLE_TYPES, memory_report
 
 st.set_page_config(page_title="Gestione Studenti", page_icon="👥")
 
@@ -14,8 +17,32 @@ if not st.session_state["authenticated"]:
     st.warning("Effettua il login per accedere a questa pagina")
     st.stop()
 
+# Colonne della lista studenti e relative intestazioni
+COLONNE_LISTA_STUDENTI = {
+    'nome': "Nome",
+    'cognome': "Cognome",
+    'canale': "Canale",
+    'livello': "Livello",
+    'durata_lezione': "Durata (min)",
+    'prezzo_lezione': st.column_config.NumberColumn("Prezzo", format="€%.2f"),
+    'data_iscrizione': st.column_config.DateColumn("Iscrizione", format="DD/MM/YYYY"),
+}
+
+# Colonne per cui si può ordinare la lista studenti
+ORDINAMENTO_STUDENTI = {
+    'cognome': "Cognome",
+    'nome': "Nome",
+    'livello': "Livello",
+    'canale': "Canale",
+    'data_iscrizione': "Data iscrizione",
+    'prezzo_lezione': "Prezzo a lezione",
+}
+
 st.title("👥 Gestione Studenti")
 
+# Esito dei salvataggi fatti in background nelle esecuzioni precedenti
+report_writes()
+
 # Pulsante per mostrare/nascondere il pannello di debug
 if st.checkbox("Mostra pannello di debug", value=False, key="show_debug"):
     with st.expander("Debug", expanded=True):
@@ -28,6 +55,68 @@ if st.checkbox("Mostra pannello di debug", value=False, key="show_debug"):
             except Exception as e:
                 st.error(f"❌ Errore di connessione a Supabase: {str(e)}")
 
+        from utils import backend
+        st.write(f"Modalità dati: {backend.DATA_BACKEND}")
+
+        # Esito della verifica dello schema (eseguita una volta per processo)
+        if hasattr(backend, 'get_schema_status'):
+            schema_status = backend.get_schema_status()
+            if schema_status['missing']:
+                st.write(f"Verifica tabelle: ❌ mancanti {', '.join(schema_status['missing'])}")
+            elif schema_status['checked_at']:
+                st.write("Verifica tabelle: ✅ tutte presenti")
+
+        # Righe e pagine scaricate nell'ultimo caricamento
+        if hasattr(backend, 'get_fetch_report'):
+            fetch_report = backend.get_fetch_report()
+            if fetch_report:
+                st.write("Ultimo caricamento da Supabase (righe e pagine per tabella):")
+                st.dataframe(pd.DataFrame.from_dict(fetch_report, orient='index'))
+
+        # Richieste a Supabase: tentativi ripetuti, latenza e stato del circuit breaker
+        client_stats = backend.get_client_stats() if hasattr(backend, 'get_client_stats') else None
+        if client_stats is not None:
+            st.write(f"Client Supabase: {client_stats['requests']} richieste, {client_stats['retries']} ripetute, "
+                     f"{client_stats['failures']} fallite, {client_stats['rejected']} rifiutate a circuito aperto "
+                     f"(circuito {client_stats['breaker']}, aperto {client_stats['breaker_trips']} volte)")
+            if client_stats['p50_ms'] is not None:
+                st.write(f"Latenza: mediana {client_stats['p50_ms']} ms, p95 {client_stats['p95_ms']} ms, "
+                         f"massima {client_stats['max_ms']} ms")
+
+        # Riepilogo mensile dei pagamenti: confronto con i pagamenti e ricalcolo completo
+        if hasattr(backend, 'verifica_pagamenti_mensili'):
+            col1, col2 = st.columns(2)
+            with col1:
+                if st.button("Verifica riepilogo pagamenti"):
+                    differenze = backend.verifica_pagamenti_mensili()
+                    if differenze is None:
+                        st.info("Riepilogo mensile non installato nel database")
+                    elif differenze.empty:
+                        st.success("✅ Riepilogo mensile coerente con i pagamenti")
+                    else:
+                        st.warning(f"❌ {len(differenze)} righe del riepilogo non corrispondono ai pagamenti")
+                        st.dataframe(differenze, hide_index=True)
+            with col2:
+                if st.button("Ricostruisci riepilogo pagamenti"):
+                    righe = backend.ricostruisci_pagamenti_mensili()
+                    if righe is None:
+                        st.info("Riepilogo mensile non installato nel database")
+                    else:
+                        st.success(f"✅ Riepilogo ricostruito ({righe} righe)")
+
+        # Memoria delle tabelle in sessione con i tipi compatti e come arrivano dal caricamento
+        st.write("Memoria delle tabelle in sessione (byte):")
+        st.dataframe(memory_report({table_name: st.session_state[table_name]
+                                    for table_name in TABLE_TYPES if table_name in st.session_state}))
+
+        # Stato della replica locale: scritture in attesa e ultima sincronizzazione
+        if hasattr(backend, 'get_sync_status'):
+            sync_status = backend.get_sync_status()
+            st.write(f"Replica: ultima sincronizzazione {sync_status['last_sync'] or 'mai'}, "
+                     f"{sync_status['pending']} scritture in attesa ({sync_status['failed']} in errore)")
+            if sync_status['last_error']:
+                st.write(f"Ultimo errore di sincronizzazione: {sync_status['last_error']}")
+
 # Tabs per le diverse funzionalità
 tab1, tab2, tab3 = st.tabs(["Registrazione Nuovo Studente", "Lista Studenti", "Registrazione Progresso"])
 
@@ -132,9 +221,50 @@ with tab2:
             }
         )
 
-        # Visualizza studenti
-        for _, studente in filtered_df.iterrows():
-            with st.expander(f"{studente['nome']} {studente['cognome']} - {studente['livello']}"):
+        # Ricerca tollerante agli errori di battitura, dal risultato più simile
+        ricerca = st.text_input("Cerca studente", placeholder="Nome, cognome o note")
+        trovati = cerca_studenti(st.session_state.studenti, ricerca) if ricerca else None
+        if ricerca:
+            posizione = {id: i for i, id in enumerate(trovati)}
+            filtered_df = filtered_df[filtered_df['id'].isin(posizione)].sort_values(
+                'id', key=lambda ids: ids.map(posizione)
+            )
+
+        # Ordinamento e paginazione: la tabella mostra solo la pagina corrente
+        col1, col2, col3 = st.columns([2, 1, 1])
+        with col1:
+            ordina_per = st.selectbox(
+                "Ordina per",
+                options=([None] if ricerca else []) + list(ORDINAMENTO_STUDENTI),
+                format_func=lambda colonna: ORDINAMENTO_STUDENTI.get(colonna, "Pertinenza")
+            )
+        with col2:
+            crescente = st.radio("Ordine", ["Crescente", "Decrescente"], horizontal=True) == "Crescente"
+        with col3:
+            righe_per_pagina = st.selectbox("Studenti per pagina", [10, 25, 50, 100])
+        n_pagine = max(1, -(-len(filtered_df) // righe_per_pagina))
+        pagina = st.number_input(f"Pagina (di {n_pagine})", min_value=1, max_value=n_pagine, value=1, step=1)
+        pagina_df = pagina_dataframe(filtered_df, ordina_per, crescente, pagina, righe_per_pagina)
+
+        # La chiave cambia con le righe della pagina: cambiando pagina, ordine o
+        # filtri la selezione non punta a uno studente diverso
+        selezione = st.dataframe(
+            pagina_df[list(COLONNE_LISTA_STUDENTI)],
+            column_config=COLONNE_LISTA_STUDENTI,
+            hide_index=True,
+            on_select="rerun",
+            selection_mode="single-row",
+            key=f"lista_studenti_{hash(tuple(pagina_df['id']))}"
+        )
+        righe_selezionate = selezione.selection.rows
+
+        # Dettagli, modifica, progressi e pagamenti solo per lo studente selezionato
+        if not righe_selezionate:
+            st.info("Seleziona uno studente nella tabella per modificarlo e vedere progressi e pagamenti")
+        else:
+            # Come dizionario: valori Python, non scalari numpy, per le scritture
+            studente = pagina_df.iloc[[righe_selezionate[0]]].to_dict('records')[0]
+            with st.expander(f"{studente['nome']} {studente['cognome']} - {studente['livello']}", expanded=True):
                 col1, col2, col3 = st.columns([2,2,1])
                 with col1:
                     nuovo_nome = st.text_input("Nome", value=studente['nome'], key=f"nome_{studente['id']}")
@@ -218,19 +348,18 @@ with tab2:
 
                 # Mostra progressi dello studente
                 st.subheader("📈 Progressi")
-                progressi_studente = st.session_state.progressi[
-                    st.session_state.progressi['studente_id'] == studente['id']
-                ].sort_values('data', ascending=False)
+                progressi_studente = righe_studente(st.session_state.progressi, studente['id'])
 
                 if progressi_studente.empty:
                     st.info("Non ci sono ancora progressi registrati per questo studente.")
                 else:
                     st.write("### Progressi registrati")
+                    contenuti = record_per_id(st.session_state.libreria)
                     for _, row in progressi_studente.iterrows():
                         # Recupera i dettagli del contenuto
-                        if not st.session_state.libreria.empty and row['contenuto_id'] in st.session_state.libreria['id'].values:
-                            contenuto = st.session_state.libreria[st.session_state.libreria['id'] == row['contenuto_id']].iloc[0]
-                            with st.expander(f"{row['data']} - {contenuto['titolo']}"):
+                        if row['contenuto_id'] in contenuti:
+                            contenuto = contenuti[row['contenuto_id']]
+                            with st.expander(f"{formatta_data(row['data'])} - {contenuto['titolo']}"):
                                 st.write(f"**Contenuto:** {contenuto['titolo']}")
                                 st.write(f"**Categoria:** {contenuto['categoria']}")
                                 st.write(f"**Livello:** {contenuto['livello']}")
@@ -240,24 +369,22 @@ with tab2:
                                     st.markdown(f"[Vedi materiale]({contenuto['url']})")
                                 with col2:
                                     if st.button("🗑️ Elimina", key=f"del_progress_{row['id']}"):
-                                        from utils.supabase_db import delete_progresso
-                                        delete_progresso(row['id'])
+                                        from utils.backend import delete_progresso
+                                        delete_progresso(row['id'], in_background=True)
                                         st.success("Progresso eliminato con successo!")
                                         st.rerun()
                         else:
-                            with st.expander(f"{row['data']} - Contenuto non disponibile"):
+                            with st.expander(f"{formatta_data(row['data'])} - Contenuto non disponibile"):
                                 st.write(f"**Note:** {row['descrizione']}")
                                 if st.button("🗑️ Elimina", key=f"del_progress_{row['id']}"):
-                                    from utils.supabase_db import delete_progresso
-                                    delete_progresso(row['id'])
+                                    from utils.backend import delete_progresso
+                                    delete_progresso(row['id'], in_background=True)
                                     st.success("Progresso eliminato con successo!")
                                     st.rerun()
 
                 # Mostra pagamenti dello studente
                 st.subheader("💶 Pagamenti")
-                pagamenti_studente = st.session_state.pagamenti[
-                    st.session_state.pagamenti['studente_id'] == studente['id']
-                ].sort_values('data', ascending=False)
+                pagamenti_studente = righe_studente(st.session_state.pagamenti, studente['id'])
 
                 if not pagamenti_studente.empty:
                     for _, pagamento in pagamenti_studente.iterrows():
@@ -267,14 +394,16 @@ with tab2:
                 else:
                     st.info("Nessun pagamento registrato")
 
-        # Export CSV
-        if st.button("Esporta CSV"):
-            csv = filtered_df.to_csv(index=False)
+        # Export: le righe arrivano a blocchi dal database, non dalla tabella in sessione.
+        # Filtri e ricerca valgono anche per l'export
+        formato = st.radio("Formato export", list(EXPORT_FORMATS), horizontal=True, key="formato_export_studenti")
+        if st.button("Esporta"):
+            estensione, mime = EXPORT_FORMATS[formato]
             st.download_button(
-                "Download CSV",
-                csv,
-                "studenti.csv",
-                "text/csv"
+                f"Download {formato}",
+                export_studenti(formato, canale=canale_filter, livello=livello_filter, ids=trovati),
+                f"studenti.{estensione}",
+                mime
             )
 
 with tab3:
@@ -284,10 +413,12 @@ with tab3:
         st.info("Non ci sono ancora studenti registrati")
     else:
         # Form per registrare il progresso
+        ricerca_studente = st.text_input("Cerca studente", key="cerca_studente_progresso")
         studente = st.selectbox(
             "Seleziona Studente",
-            options=st.session_state.studenti['id'].tolist(),
-            format_func=lambda x: f"{st.session_state.studenti[st.session_state.studenti['id']==x]['nome'].iloc[0]} {st.session_state.studenti[st.session_state.studenti['id']==x]['cognome'].iloc[0]}"
+            options=cerca_studenti(st.session_state.studenti, ricerca_studente) if ricerca_studente
+            else st.session_state.studenti['id'].tolist(),
+            format_func=etichette(st.session_state.studenti, "{nome} {cognome}").get
         )
 
         # Seleziona contenuto dalla libreria
@@ -295,7 +426,7 @@ with tab3:
             contenuto = st.selectbox(
                 "Contenuto dalla libreria",
                 options=st.session_state.libreria['id'].tolist(),
-                format_func=lambda x: f"{st.session_state.libreria[st.session_state.libreria['id']==x]['titolo'].iloc[0]}"
+                format_func=etichette(st.session_state.libreria, "{titolo}").get
             )
         else:
             st.warning("Non ci sono contenuti disponibili nella libreria")
@@ -309,8 +440,10 @@ with tab3:
             descrizione = st.text_area("Note sul progresso")
 
         if st.button("Salva Progresso"):
-            if descrizione:
-                add_progresso(studente, data, contenuto, descrizione)
-                st.success("Progresso registrato!")
+            if studente is None:
+                st.error("Nessuno studente corrisponde alla ricerca")
+            elif descrizione:
+                add_progresso(studente, data, contenuto, descrizione, in_background=True)
+                st.success("Progresso registrato, salvataggio in corso...")
             else:
                 st.error("Inserisci una descrizione del progresso")
@@ -1,7 +1,10 @@
 import streamlit as st
 import pandas as pd
 from datetime import datetime
-from utils.supabase_db import add_pagamento, delete_pagamento
+from utils.backend import add_pagamento, delete_pagamento, report_writes, get_statistiche_pagamenti
+from utils.helpers import formatta_data
+from utils.export import EXPORT_FORMATS, export_storico_pagamenti
+from utils.indici import cerca_studenti, etichette
 import plotly.express as px
 
 st.set_page_config(page_title="Gestione Pagamenti", page_icon="💶")
@@ -16,6 +19,9 @@ if not st.session_state["authenticated"]:
 
 st.title("💶 Gestione Pagamenti")
 
+# Esito dei salvataggi fatti in background nelle esecuzioni precedenti
+report_writes()
+
 tab1, tab2, tab3 = st.tabs(["Registrazione Pagamento", "Statistiche", "Storico Pagamenti"])
 
 with tab1:
@@ -25,10 +31,12 @@ with tab1:
         st.info("Aggiungi prima uno studente per registrare un pagamento")
     else:
         # Form per nuovo pagamento
+        ricerca_studente = st.text_input("Cerca studente")
         studente = st.selectbox(
             "Seleziona Studente",
-            options=st.session_state.studenti['id'].tolist(),
-            format_func=lambda x: f"{st.session_state.studenti[st.session_state.studenti['id']==x]['nome'].iloc[0]} {st.session_state.studenti[st.session_state.studenti['id']==x]['cognome'].iloc[0]}"
+            options=cerca_studenti(st.session_state.studenti, ricerca_studente) if ricerca_studente
+            else st.session_state.studenti['id'].tolist(),
+            format_func=etichette(st.session_state.studenti, "{nome} {cognome}").get
         )
 
         col1, col2 = st.columns(2)
@@ -44,10 +52,12 @@ with tab1:
             anno = datetime.now().year
 
         if st.button("Registra Pagamento"):
-            if importo > 0:
+            if studente is None:
+                st.error("Nessuno studente corrisponde alla ricerca")
+            elif importo > 0:
                 commenti_pagamento = st.text_area("Note sul pagamento")
-                add_pagamento(studente, data_pagamento, importo, mese, anno, commenti_pagamento)
-                st.success("Pagamento registrato con successo!")
+                add_pagamento(studente, data_pagamento, importo, mese, anno, commenti_pagamento, in_background=True)
+                st.success("Pagamento registrato, salvataggio in corso...")
             else:
                 st.error("L'importo deve essere maggiore di zero")
 
@@ -61,8 +71,8 @@ with tab2:
         vista = st.radio("Visualizza statistiche per:", ["Mensili", "Per Studente"])
 
         if vista == "Mensili":
-            # Statistiche mensili
-            stats_mensili = st.session_state.pagamenti.groupby(['anno', 'mese'])['importo'].agg(['sum', 'count']).reset_index()
+            # Statistiche mensili (calcolate dal database: una riga per mese)
+            stats_mensili = get_statistiche_pagamenti('mensili')
             stats_mensili.columns = ['Anno', 'Mese', 'Totale Incassato', 'Numero Pagamenti']
 
             # Calcola media mensile
@@ -97,25 +107,32 @@ with tab2:
                 hide_index=True
             )
 
+            # Incassi mensili divisi per canale degli studenti
+            stats_canali = get_statistiche_pagamenti('canali')
+            if not stats_canali.empty:
+                stats_canali['Periodo'] = stats_canali['mese'] + ' ' + stats_canali['anno'].astype(str)
+                fig = px.bar(stats_canali,
+                            x='Periodo',
+                            y='totale',
+                            color='canale',
+                            labels={'totale': 'Totale Incassato', 'canale': 'Canale'},
+                            title='Incassi Mensili per Canale')
+                st.plotly_chart(fig, use_container_width=True)
+
         else:
-            # Statistiche per studente
-            stats_studenti = pd.merge(
-                st.session_state.pagamenti.groupby('studente_id')['importo'].agg(['sum', 'count', 'mean']).reset_index(),
-                st.session_state.studenti[['id', 'nome', 'cognome']],
-                left_on='studente_id',
-                right_on='id'
-            )
+            # Statistiche per studente (calcolate dal database: una riga per studente)
+            stats_studenti = get_statistiche_pagamenti('studenti')
             stats_studenti['nome_completo'] = stats_studenti['nome'] + ' ' + stats_studenti['cognome']
 
             # Grafico per studente
             fig = px.bar(stats_studenti, 
                         x='nome_completo', 
-                        y='sum',
+                        y='totale',
                         title='Pagamenti Totali per Studente')
             st.plotly_chart(fig, use_container_width=True)
 
             # Tabella dettagliata - prima rinominiamo le colonne, poi applichiamo lo stile
-            df_display = stats_studenti[['nome_completo', 'sum', 'mean', 'count']].copy()
+            df_display = stats_studenti[['nome_completo', 'totale', 'media', 'n_pagamenti']].copy()
             df_display.columns = ['Studente', 'Totale Pagato', 'Media Pagamenti', 'Numero Pagamenti']
 
             # Ora applichiamo lo stile alle colonne rinominate
@@ -138,10 +155,11 @@ with tab3:
         col1, col2, col3 = st.columns(3)
         with col1:
             # Filtro per studente
+            nomi_studenti = etichette(st.session_state.studenti, "{nome} {cognome}")
             studente_filtro = st.selectbox(
                 "Filtra per Studente",
                 options=["Tutti"] + st.session_state.studenti['id'].tolist(),
-                format_func=lambda x: "Tutti" if x == "Tutti" else f"{st.session_state.studenti[st.session_state.studenti['id']==x]['nome'].iloc[0]} {st.session_state.studenti[st.session_state.studenti['id']==x]['cognome'].iloc[0]}"
+                format_func=lambda x: "Tutti" if x == "Tutti" else nomi_studenti[x]
             )
 
         with col2:
@@ -190,7 +208,7 @@ with tab3:
         st.dataframe(
             storico_display.style.format({
                 'Importo': '€{:.2f}',
-                'Data': lambda x: x.split('T')[0] if 'T' in str(x) else x  # Formatta la data ISO
+                'Data': formatta_data
             }),
             hide_index=True
         )
@@ -203,7 +221,7 @@ with tab3:
             pagamento_da_eliminare = st.selectbox(
                 "Seleziona pagamento da eliminare",
                 options=storico_completo['id'].tolist(),
-                format_func=lambda x: f"{storico_completo[storico_completo['id']==x]['studente'].iloc[0]} - {storico_completo[storico_completo['id']==x]['mese'].iloc[0]} {storico_completo[storico_completo['id']==x]['anno'].iloc[0]} - €{storico_completo[storico_completo['id']==x]['importo'].iloc[0]:.2f}"
+                format_func=etichette(storico_completo, "{studente} - {mese} {anno} - €{importo:.2f}").get
             )
 
             # Bottone di eliminazione con conferma
@@ -212,12 +230,9 @@ with tab3:
                 col1, col2 = st.columns(2)
                 with col1:
                     if st.button("Conferma Eliminazione"):
-                        from utils.supabase_db import delete_pagamento
+                        from utils.backend import delete_pagamento
                         if delete_pagamento(pagamento_da_eliminare):
                             st.success("Pagamento eliminato con successo!")
-                            # Forza il ricaricamento dei dati prima di rerun
-                            from utils.supabase_db import load_data
-                            load_data()
                             st.rerun()
                 with col2:
                     if st.button("Annulla"):
@@ -225,12 +240,17 @@ with tab3:
         else:
             st.info("Nessun pagamento corrisponde ai filtri selezionati")
 
-        # Opzione per esportare i dati filtrati
+        # Opzione per esportare i dati filtrati, letti a blocchi dal database solo su richiesta
         if not storico_completo.empty:
-            csv = storico_display.to_csv(index=False)
-            st.download_button(
-                label="📥 Esporta dati filtrati (CSV)",
-                data=csv,
-                file_name=f"storico_pagamenti_{datetime.now().strftime('%Y%m%d')}.csv",
-                mime="text/csv"
-            )
+            formato = st.radio("Formato export", list(EXPORT_FORMATS), horizontal=True, key="formato_export_storico")
+            if st.button("📥 Esporta dati filtrati"):
+                estensione, mime = EXPORT_FORMATS[formato]
+                st.download_button(
+                    label=f"Download {formato}",
+                    data=export_storico_pagamenti(
+                        st.session_state.studenti, formato,
+                        studente_id=studente_filtro, anno=anno_filtro, mese=mese_filtro
+                    ),
+                    file_name=f"storico_pagamenti_{datetime.now().strftime('%Y%m%d')}.{estensione}",
+                    mime=mime
+                )
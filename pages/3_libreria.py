@@ -1,5 +1,5 @@
 import streamlit as st
-from utils.supabase_db import add_risorsa, delete_risorsa
+from utils.backend import add_risorsa, delete_risorsa, cerca_risorse
 
 st.set_page_config(page_title="Libreria Contenuti", page_icon="📚")
 
@@ -19,7 +19,7 @@ tab1, tab2, tab3 = st.tabs(["Registrazione Materiale", "Libreria Materiale", "Ge
 with tab1:
     st.header("Registrazione Nuovo Materiale")
 
-    from utils.supabase_db import get_libri_disponibili
+    from utils.backend import get_libri_disponibili
     
     libro = st.selectbox(
         "Seleziona libro",
@@ -69,7 +69,7 @@ with tab2:
                 options=sorted(st.session_state.libreria['livello'].unique())
             )
 
-        search = st.text_input("Cerca per titolo o descrizione")
+        search = st.text_input("Cerca per titolo o descrizione", help="Maiuscole e accenti non contano; \"gramm\" trova anche \"grammatica\"")
 
         # Filtra risultati
         filtered_df = st.session_state.libreria.copy()
@@ -84,11 +84,11 @@ with tab2:
             filtered_df = filtered_df[filtered_df['livello'].isin(livello_filter)]
 
         if search:
-            search = search.lower()
-            filtered_df = filtered_df[
-                filtered_df['titolo'].str.lower().str.contains(search) |
-                filtered_df['descrizione'].str.lower().str.contains(search)
-            ]
+            # Risultati dal più pertinente: l'ordine resta dentro ogni categoria
+            posizione = {id: i for i, id in enumerate(cerca_risorse(search))}
+            filtered_df = filtered_df[filtered_df['id'].isin(posizione)].sort_values(
+                'id', key=lambda ids: ids.map(posizione)
+            )
 
         # Raggruppa per categoria
         for categoria in sorted(filtered_df['categoria'].unique()):
@@ -111,7 +111,7 @@ with tab3:
     st.header("📖 Gestione Libri")
 
     # Ottieni la lista dei libri dal database
-    from utils.supabase_db import add_libro_disponibile, get_libri_disponibili, delete_libro_disponibile
+    from utils.backend import add_libro_disponibile, get_libri_disponibili, delete_libro_disponibile
     
     # Form per aggiungere nuovo libro
     col1, col2 = st.columns([2,1])
@@ -1,7 +1,7 @@
 import streamlit as st
 import base64
-from utils.supabase_db import (save_branding_settings, add_custom_link, update_custom_link, delete_custom_link,
-                          get_branding_settings)
+from utils.backend import (save_branding_settings, add_custom_link, update_custom_link, delete_custom_link,
+                          get_branding_settings, get_icone)
 from utils.image_processor import process_upload_image
 
 st.set_page_config(page_title="Impostazioni", page_icon="⚙️")
@@ -103,13 +103,15 @@ if st.button("➕ Aggiungi Link") and titolo and url:
 # Lista dei link esistenti
 if not st.session_state.custom_links.empty:
     st.subheader("Link Esistenti")
+    icone = get_icone(st.session_state.custom_links)
     for _, link in st.session_state.custom_links.iterrows():
+        icona_attuale = icone.get(link['id'])
         cols = st.columns([3, 1, 1])
         with cols[0]:
             st.write(f"**{link['titolo']}** - {link['url']}")
-            if link['icona']:
+            if icona_attuale:
                 try:
-                    st.image(base64.b64decode(link['icona']), width=48) # Decode base64 image for display
+                    st.image(base64.b64decode(icona_attuale), width=48) # Decode base64 image for display
                 except:
                     st.warning("⚠️ Icona non visualizzabile")
         with cols[1]:
@@ -141,7 +143,7 @@ if not st.session_state.custom_links.empty:
                     try:
                         # Encode the image as base64 before updating
                         import base64
-                        image_base64 = base64.b64encode(processed_image).decode('utf-8') if nuova_icona else link['icona']
+                        image_base64 = base64.b64encode(processed_image).decode('utf-8') if nuova_icona else icona_attuale
                         update_custom_link(
                             link['id'],
                             nuovo_titolo,
@@ -0,0 +1,66 @@
+import streamlit as st
+from utils.importer import (IMPORT_COLUMNS, IMPORT_FILE_TYPES, read_import_file, file_checksum,
+                            validate_import, imported_rows, run_import, import_template)
+
+st.set_page_config(page_title="Importa Dati", page_icon="📥")
+
+# Inizializza la variabile se non esiste
+if "authenticated" not in st.session_state:
+    st.session_state["authenticated"] = False
+
+if not st.session_state["authenticated"]:
+    st.warning("Effettua il login per accedere a questa pagina")
+    st.stop()
+
+st.title("📥 Importa Dati")
+
+tipi = {"Studenti": "studenti", "Pagamenti": "pagamenti", "Progressi": "progressi"}
+tipo = st.selectbox("Cosa vuoi importare?", list(tipi))
+table_name = tipi[tipo]
+
+spec = IMPORT_COLUMNS[table_name]
+st.write(f"**Colonne obbligatorie:** {', '.join(spec['required'])}")
+st.write(f"**Colonne facoltative:** {', '.join(spec['optional'])}")
+if table_name != 'studenti':
+    st.caption("Lo studente si indica come \"Nome Cognome\", oppure con una colonna studente_id al posto di studente.")
+st.download_button(
+    label="📄 Scarica modello CSV",
+    data=import_template(table_name),
+    file_name=f"modello_{table_name}.csv",
+    mime="text/csv"
+)
+
+file = st.file_uploader("Carica un file CSV o Excel" if len(IMPORT_FILE_TYPES) > 1 else "Carica un file CSV",
+                        type=IMPORT_FILE_TYPES)
+if file is not None:
+    try:
+        df = read_import_file(file)
+    except Exception as e:
+        st.error(f"Errore nella lettura del file: {str(e)}")
+        st.stop()
+
+    valid, errors = validate_import(table_name, df)
+    st.write(f"Righe nel file: {len(df)} — valide: {len(valid)} — con errori: {errors['riga'].nunique()}")
+    if not errors.empty:
+        st.subheader("Errori")
+        st.dataframe(errors, hide_index=True)
+        st.info("Le righe con errori vengono saltate: correggile nel file e importalo di nuovo per aggiungerle.")
+
+    if not valid.empty:
+        with st.expander("Anteprima delle righe da importare"):
+            st.dataframe(valid.head(50))
+
+        # Il checkpoint permette di riprendere un'importazione interrotta dallo stesso punto
+        checkpoint_key = f"{table_name}:{file_checksum(file)}"
+        importate = valid.index.isin(imported_rows(checkpoint_key)).sum()
+        if importate >= len(valid):
+            st.success(f"✅ File già importato ({importate} righe)")
+            if st.button("Importa di nuovo"):
+                st.session_state['import_checkpoints'].pop(checkpoint_key)
+                st.rerun()
+        else:
+            etichetta = f"Riprendi importazione ({len(valid) - importate} righe da importare su {len(valid)})" \
+                if importate else f"Importa {len(valid)} righe"
+            if st.button(etichetta, type="primary"):
+                if run_import(table_name, valid, checkpoint_key):
+                    st.success(f"🌞 Importate {len(valid)} righe ✅")
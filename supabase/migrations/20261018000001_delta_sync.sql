@@ -0,0 +1,71 @@
+-- Sincronizzazione incrementale (delta sync) per utils/supabase_db.load_data
+--
+-- Ogni tabella caricata in sessione riceve una colonna updated_at aggiornata
+-- da trigger, e ogni DELETE viene registrato in public.eliminazioni, così
+-- il client può scaricare solo le righe modificate dall'ultima sincronizzazione.
+
+create table if not exists public.eliminazioni (
+    id bigint generated always as identity primary key,
+    tabella text not null,
+    record_id text not null,
+    deleted_at timestamptz not null default now()
+);
+
+create index if not exists eliminazioni_deleted_at_idx on public.eliminazioni (deleted_at);
+
+grant select on public.eliminazioni to anon, authenticated;
+
+create or replace function public.imposta_updated_at()
+returns trigger
+language plpgsql
+as $$
+begin
+    new.updated_at = now();
+    return new;
+end;
+$$;
+
+create or replace function public.registra_eliminazione()
+returns trigger
+language plpgsql
+security definer
+set search_path = public
+as $$
+begin
+    insert into public.eliminazioni (tabella, record_id) values (tg_table_name, old.id::text);
+    return old;
+end;
+$$;
+
+do $$
+declare
+    t text;
+begin
+    foreach t in array array[
+        'studenti', 'progressi', 'libreria', 'pagamenti',
+        'custom_links', 'giorni_lezione', 'branding_settings'
+    ]
+    loop
+        execute format('alter table public.%I add column if not exists updated_at timestamptz not null default now()', t);
+        execute format('create index if not exists %I on public.%I (updated_at)', t || '_updated_at_idx', t);
+
+        execute format('drop trigger if exists %I on public.%I', t || '_updated_at', t);
+        execute format('create trigger %I before update on public.%I for each row execute function public.imposta_updated_at()',
+                       t || '_updated_at', t);
+
+        execute format('drop trigger if exists %I on public.%I', t || '_eliminazione', t);
+        execute format('create trigger %I after delete on public.%I for each row execute function public.registra_eliminazione()',
+                       t || '_eliminazione', t);
+    end loop;
+end;
+$$;
+
+-- Le eliminazioni più vecchie di 30 giorni non servono più: una sessione
+-- che non sincronizza da più di un giorno rifà comunque un caricamento completo
+-- (DELTA_SYNC_MAX_AGE in utils/supabase_db.py).
+create or replace function public.pulisci_eliminazioni()
+returns void
+language sql
+as $$
+    delete from public.eliminazioni where deleted_at < now() - interval '30 days';
+$$;
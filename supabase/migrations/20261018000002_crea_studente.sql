@@ -0,0 +1,32 @@
+-- Creazione atomica di uno studente con i suoi giorni di lezione
+--
+-- Usata da utils/supabase_db.add_studente: una sola richiesta e una sola
+-- transazione al posto di un INSERT per lo studente più uno per ogni giorno.
+
+create or replace function public.crea_studente(studente jsonb, giorni text[] default '{}')
+returns jsonb
+language plpgsql
+as $$
+declare
+    nuovo public.studenti;
+    giorni_inseriti jsonb;
+begin
+    insert into public.studenti (
+        nome, cognome, canale, livello, metodologia, durata_lezione, prezzo_lezione,
+        commenti, data_iscrizione, slides_url, classroom_url, meet_url
+    )
+    select nome, cognome, canale, livello, metodologia, durata_lezione, prezzo_lezione,
+           commenti, data_iscrizione, slides_url, classroom_url, meet_url
+    from jsonb_populate_record(null::public.studenti, studente)
+    returning * into nuovo;
+
+    insert into public.giorni_lezione (studente_id, giorno)
+    select nuovo.id, giorno from unnest(giorni) as giorno;
+
+    select coalesce(jsonb_agg(to_jsonb(g)), '[]'::jsonb) into giorni_inseriti
+    from public.giorni_lezione g
+    where g.studente_id = nuovo.id;
+
+    return jsonb_build_object('studente', to_jsonb(nuovo), 'giorni_lezione', giorni_inseriti);
+end;
+$$;
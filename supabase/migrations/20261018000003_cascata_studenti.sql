@@ -0,0 +1,33 @@
+-- Eliminazione a cascata dei dati collegati a uno studente
+--
+-- Con ON DELETE CASCADE, utils/supabase_db.delete_studente/delete_studenti
+-- eliminano studente, progressi, pagamenti e giorni di lezione con una sola
+-- richiesta e in una sola transazione. I trigger di public.eliminazioni
+-- registrano anche le righe eliminate a cascata.
+
+do $$
+declare
+    t text;
+    vincolo text;
+begin
+    foreach t in array array['progressi', 'pagamenti', 'giorni_lezione']
+    loop
+        -- Rimuove le foreign key esistenti su studente_id, qualunque sia il loro nome
+        for vincolo in
+            select con.conname
+            from pg_constraint con
+            join pg_attribute att on att.attrelid = con.conrelid and att.attnum = any(con.conkey)
+            where con.contype = 'f'
+              and con.conrelid = format('public.%I', t)::regclass
+              and att.attname = 'studente_id'
+        loop
+            execute format('alter table public.%I drop constraint %I', t, vincolo);
+        end loop;
+
+        execute format(
+            'alter table public.%I add constraint %I foreign key (studente_id) references public.studenti (id) on delete cascade',
+            t, t || '_studente_id_fkey'
+        );
+    end loop;
+end;
+$$;
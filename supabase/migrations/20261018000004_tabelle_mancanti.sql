@@ -0,0 +1,14 @@
+-- Verifica dello schema con una sola richiesta
+--
+-- Usata da utils/supabase_db.create_tables al posto di una SELECT di prova
+-- per ciascuna tabella: restituisce i nomi delle tabelle che non esistono.
+
+create or replace function public.tabelle_mancanti(nomi text[])
+returns text[]
+language sql
+stable
+as $$
+    select coalesce(array_agg(nome), '{}')
+    from unnest(nomi) as nome
+    where to_regclass(format('public.%I', nome)) is null;
+$$;
@@ -0,0 +1,11 @@
+-- Hash del contenuto di logo e icone
+--
+-- utils/supabase_db.load_data scarica custom_links e branding_settings senza
+-- le colonne blob: le pagine che mostrano logo e icone li leggono a parte,
+-- tenendoli in cache finché l'hash non cambia.
+
+alter table public.custom_links
+    add column if not exists icona_hash text generated always as (md5(icona)) stored;
+
+alter table public.branding_settings
+    add column if not exists logo_hash text generated always as (md5(logo)) stored;
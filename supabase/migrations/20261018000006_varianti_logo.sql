@@ -0,0 +1,9 @@
+-- Varianti ridimensionate del logo
+--
+-- utils/supabase_db.save_branding_settings salva, insieme al logo originale,
+-- due copie PNG (in base64) larghe 160px (.logo-container) e 320px (HiDPI):
+-- la home scarica solo queste, una volta per ogni nuovo logo_hash.
+
+alter table public.branding_settings
+    add column if not exists logo_160 text,
+    add column if not exists logo_320 text;
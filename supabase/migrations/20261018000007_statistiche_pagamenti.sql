@@ -0,0 +1,28 @@
+-- Statistiche dei pagamenti calcolate nel database
+--
+-- Usate da utils/supabase_db.get_statistiche_pagamenti per la scheda
+-- "Statistiche" di pages/2_pagamenti.py: la pagina scarica una riga per mese
+-- o per studente invece di tutti i pagamenti.
+
+create or replace view public.statistiche_pagamenti_mensili as
+select anno,
+       mese,
+       sum(importo) as totale,
+       count(*) as n_pagamenti
+from public.pagamenti
+group by anno, mese;
+
+create or replace view public.statistiche_pagamenti_studenti as
+select p.studente_id,
+       s.nome,
+       s.cognome,
+       sum(p.importo) as totale,
+       avg(p.importo) as media,
+       count(*) as n_pagamenti
+from public.pagamenti p
+join public.studenti s on s.id = p.studente_id
+group by p.studente_id, s.nome, s.cognome;
+
+-- Le viste leggono con i permessi di chi interroga, come le tabelle
+alter view public.statistiche_pagamenti_mensili set (security_invoker = true);
+alter view public.statistiche_pagamenti_studenti set (security_invoker = true);
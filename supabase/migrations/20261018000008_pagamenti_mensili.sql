@@ -0,0 +1,157 @@
+-- Riepilogo mensile dei pagamenti per canale
+--
+-- Letto da utils/supabase_db.get_statistiche_pagamenti: le statistiche mensili
+-- scaricano una riga per mese e canale invece di aggregare tutti i pagamenti.
+-- I trigger lo aggiornano a ogni scrittura su pagamenti e studenti (anche
+-- importazioni e cancellazioni a cascata). Contiene i pagamenti di studenti
+-- esistenti, attribuiti al canale attuale dello studente.
+
+create table if not exists public.pagamenti_mensili (
+    anno integer not null,
+    mese text not null,
+    canale text not null,
+    totale numeric not null default 0,
+    n_pagamenti integer not null default 0,
+    primary key (anno, mese, canale)
+);
+
+-- Somma (o sottrae, con valori negativi) un importo al riepilogo.
+-- I cast espliciti servono se anno e importo sono bigint o double precision
+create or replace function public.aggiungi_pagamento_mensile(
+    p_anno integer, p_mese text, p_canale text, p_totale numeric, p_n integer
+)
+returns void
+language plpgsql
+as $$
+begin
+    -- Senza canale lo studente non esiste: il pagamento non è nel riepilogo
+    if p_canale is null then
+        return;
+    end if;
+    insert into public.pagamenti_mensili as r (anno, mese, canale, totale, n_pagamenti)
+    values (p_anno, p_mese, p_canale, p_totale, p_n)
+    on conflict (anno, mese, canale) do update
+        set totale = r.totale + excluded.totale,
+            n_pagamenti = r.n_pagamenti + excluded.n_pagamenti;
+    delete from public.pagamenti_mensili
+    where anno = p_anno and mese = p_mese and canale = p_canale and n_pagamenti <= 0;
+end;
+$$;
+
+create or replace function public.pagamenti_mensili_da_pagamenti()
+returns trigger
+language plpgsql
+as $$
+begin
+    if tg_op in ('DELETE', 'UPDATE') then
+        perform public.aggiungi_pagamento_mensile(
+            old.anno::integer, old.mese, (select canale from public.studenti where id = old.studente_id),
+            -old.importo::numeric, -1);
+    end if;
+    if tg_op in ('INSERT', 'UPDATE') then
+        perform public.aggiungi_pagamento_mensile(
+            new.anno::integer, new.mese, (select canale from public.studenti where id = new.studente_id),
+            new.importo::numeric, 1);
+    end if;
+    return null;
+end;
+$$;
+
+create or replace trigger pagamenti_mensili_pagamenti
+after insert or delete or update of studente_id, importo, anno, mese on public.pagamenti
+for each row execute function public.pagamenti_mensili_da_pagamenti();
+
+-- Sposta i pagamenti di uno studente: tolti dal canale precedente (delete,
+-- update) e aggiunti al nuovo (insert, update)
+create or replace function public.pagamenti_mensili_da_studenti()
+returns trigger
+language plpgsql
+as $$
+declare
+    mese_studente record;
+begin
+    if tg_op in ('DELETE', 'UPDATE') then
+        for mese_studente in
+            select anno::integer as anno, mese, sum(importo::numeric) as totale, count(*)::integer as n
+            from public.pagamenti where studente_id = old.id group by anno, mese
+        loop
+            perform public.aggiungi_pagamento_mensile(
+                mese_studente.anno, mese_studente.mese, old.canale, -mese_studente.totale, -mese_studente.n);
+        end loop;
+    end if;
+    if tg_op in ('INSERT', 'UPDATE') then
+        for mese_studente in
+            select anno::integer as anno, mese, sum(importo::numeric) as totale, count(*)::integer as n
+            from public.pagamenti where studente_id = new.id group by anno, mese
+        loop
+            perform public.aggiungi_pagamento_mensile(
+                mese_studente.anno, mese_studente.mese, new.canale, mese_studente.totale, mese_studente.n);
+        end loop;
+    end if;
+    return coalesce(new, old);
+end;
+$$;
+
+-- before delete: durante la cancellazione a cascata lo studente non esiste già
+-- più e il trigger sui pagamenti non trova il canale da aggiornare
+create or replace trigger pagamenti_mensili_studenti_delete
+before delete on public.studenti
+for each row execute function public.pagamenti_mensili_da_studenti();
+
+create or replace trigger pagamenti_mensili_studenti_insert
+after insert on public.studenti
+for each row execute function public.pagamenti_mensili_da_studenti();
+
+create or replace trigger pagamenti_mensili_studenti_update
+after update of id, canale on public.studenti
+for each row
+when (old.canale is distinct from new.canale or old.id is distinct from new.id)
+execute function public.pagamenti_mensili_da_studenti();
+
+-- Ricalcolo completo, da usare dopo modifiche fatte con i trigger disattivati
+create or replace function public.ricostruisci_pagamenti_mensili()
+returns integer
+language plpgsql
+as $$
+declare
+    righe integer;
+begin
+    -- Nessuna scrittura sui pagamenti durante il ricalcolo
+    lock table public.pagamenti, public.studenti in share mode;
+    delete from public.pagamenti_mensili;
+    insert into public.pagamenti_mensili (anno, mese, canale, totale, n_pagamenti)
+    select p.anno, p.mese, s.canale, sum(p.importo::numeric), count(*)
+    from public.pagamenti p
+    join public.studenti s on s.id = p.studente_id
+    group by p.anno, p.mese, s.canale;
+    get diagnostics righe = row_count;
+    return righe;
+end;
+$$;
+
+-- Righe del riepilogo che non corrispondono ai pagamenti (vuoto se coerente)
+create or replace function public.verifica_pagamenti_mensili()
+returns table (
+    anno integer, mese text, canale text,
+    totale_riepilogo numeric, totale_pagamenti numeric,
+    n_riepilogo integer, n_pagamenti integer
+)
+language sql
+stable
+as $$
+    with calcolati as (
+        select p.anno::integer as anno, p.mese::text as mese, s.canale::text as canale,
+               sum(p.importo::numeric) as totale, count(*)::integer as n
+        from public.pagamenti p
+        join public.studenti s on s.id = p.studente_id
+        group by p.anno, p.mese, s.canale
+    )
+    select coalesce(r.anno, c.anno), coalesce(r.mese, c.mese), coalesce(r.canale, c.canale),
+           r.totale, c.totale, r.n_pagamenti, c.n
+    from public.pagamenti_mensili r
+    full join calcolati c on c.anno = r.anno and c.mese = r.mese and c.canale = r.canale
+    where r.n_pagamenti is distinct from c.n
+       or abs(coalesce(r.totale, 0) - coalesce(c.totale, 0)) > 0.005;
+$$;
+
+select public.ricostruisci_pagamenti_mensili();
@@ -0,0 +1,42 @@
+-- Ricerca full-text nella libreria
+--
+-- Usata da utils/supabase_db.cerca_risorse per la ricerca di
+-- pages/3_libreria.py: titolo e descrizione senza distinguere maiuscole e
+-- accenti, con ricerca per prefisso e risultati ordinati per pertinenza.
+
+create extension if not exists unaccent with schema extensions;
+
+-- Documento indicizzato: il titolo pesa più della descrizione.
+-- Il dizionario esplicito rende unaccent utilizzabile in una funzione immutable
+create or replace function public.libreria_documento(titolo text, descrizione text)
+returns tsvector
+language sql
+immutable
+parallel safe
+as $$
+    select setweight(to_tsvector('simple', extensions.unaccent('extensions.unaccent'::regdictionary, coalesce(titolo, ''))), 'A')
+        || setweight(to_tsvector('simple', extensions.unaccent('extensions.unaccent'::regdictionary, coalesce(descrizione, ''))), 'B');
+$$;
+
+create index if not exists libreria_ricerca_idx
+    on public.libreria using gin (public.libreria_documento(titolo, descrizione));
+
+-- Ogni parola della ricerca diventa un prefisso ('gramm':*) e devono esserci
+-- tutte; ricerche senza parole non restituiscono righe
+create or replace function public.cerca_libreria(query text)
+returns table (id public.libreria.id%type, rank real)
+language sql
+stable
+as $$
+    with ricerca as (
+        select to_tsquery('simple', string_agg(quote_literal(parola) || ':*', ' & ')) as tsquery
+        from regexp_split_to_table(
+            lower(extensions.unaccent('extensions.unaccent'::regdictionary, query)), '[^[:alnum:]]+'
+        ) as parola
+        where parola <> ''
+    )
+    select l.id, ts_rank(public.libreria_documento(l.titolo, l.descrizione), r.tsquery) as rank
+    from public.libreria l, ricerca r
+    where public.libreria_documento(l.titolo, l.descrizione) @@ r.tsquery
+    order by rank desc, l.id;
+$$;
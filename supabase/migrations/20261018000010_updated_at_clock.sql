@@ -0,0 +1,32 @@
+-- updated_at e deleted_at con l'ora effettiva della scrittura
+--
+-- now() è l'ora di inizio della transazione: una transazione lunga confermata
+-- dopo una sincronizzazione avrebbe righe con updated_at più vecchio del
+-- watermark. clock_timestamp() riduce l'intervallo al tempo tra la scrittura
+-- e il commit, che utils/supabase_db.py copre rileggendo DELTA_SYNC_OVERLAP.
+
+create or replace function public.imposta_updated_at()
+returns trigger
+language plpgsql
+as $$
+begin
+    new.updated_at = clock_timestamp();
+    return new;
+end;
+$$;
+
+alter table public.eliminazioni alter column deleted_at set default clock_timestamp();
+
+do $$
+declare
+    t text;
+begin
+    foreach t in array array[
+        'studenti', 'progressi', 'libreria', 'pagamenti',
+        'custom_links', 'giorni_lezione', 'branding_settings'
+    ]
+    loop
+        execute format('alter table public.%I alter column updated_at set default clock_timestamp()', t);
+    end loop;
+end;
+$$;
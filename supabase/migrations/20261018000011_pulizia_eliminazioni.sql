@@ -0,0 +1,18 @@
+-- Pulizia periodica delle eliminazioni
+--
+-- public.pulisci_eliminazioni (20261018000001_delta_sync.sql) non veniva mai
+-- eseguita, quindi public.eliminazioni cresceva senza limite. pg_cron la
+-- esegue ogni notte: le eliminazioni più vecchie di 30 giorni sono ben oltre
+-- DELTA_SYNC_MAX_AGE (un giorno) di utils/supabase_db.py e della replica, dopo
+-- il quale ogni sessione rifà un caricamento completo senza leggerle.
+
+create extension if not exists pg_cron;
+
+-- Una sola pianificazione anche se la migrazione viene applicata di nuovo
+select cron.unschedule(jobid) from cron.job where jobname = 'pulisci_eliminazioni';
+
+select cron.schedule(
+    'pulisci_eliminazioni',
+    '17 3 * * *',
+    'select public.pulisci_eliminazioni()'
+);
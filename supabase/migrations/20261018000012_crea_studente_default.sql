@@ -0,0 +1,42 @@
+-- crea_studente rispetta i valori di default delle colonne
+--
+-- jsonb_populate_record con l'elenco completo delle colonne inseriva NULL per
+-- ogni chiave che utils/supabase_db.add_studente non invia (i campi vuoti),
+-- scavalcando i default della tabella come faceva il vecchio INSERT diretto.
+-- Ora l'INSERT elenca solo le colonne presenti nel JSON.
+
+create or replace function public.crea_studente(studente jsonb, giorni text[] default '{}')
+returns jsonb
+language plpgsql
+as $$
+declare
+    nuovo public.studenti;
+    giorni_inseriti jsonb;
+    colonne text;
+begin
+    select string_agg(format('%I', colonna), ', ' order by posizione) into colonne
+    from unnest(array[
+        'nome', 'cognome', 'canale', 'livello', 'metodologia', 'durata_lezione', 'prezzo_lezione',
+        'commenti', 'data_iscrizione', 'slides_url', 'classroom_url', 'meet_url'
+    ]) with ordinality as c(colonna, posizione)
+    where studente ? colonna;
+
+    if colonne is null then
+        insert into public.studenti default values returning * into nuovo;
+    else
+        execute format(
+            'insert into public.studenti (%1$s) select %1$s from jsonb_populate_record(null::public.studenti, $1) returning *',
+            colonne
+        ) using studente into nuovo;
+    end if;
+
+    insert into public.giorni_lezione (studente_id, giorno)
+    select nuovo.id, giorno from unnest(giorni) as giorno;
+
+    select coalesce(jsonb_agg(to_jsonb(g)), '[]'::jsonb) into giorni_inseriti
+    from public.giorni_lezione g
+    where g.studente_id = nuovo.id;
+
+    return jsonb_build_object('studente', to_jsonb(nuovo), 'giorni_lezione', giorni_inseriti);
+end;
+$$;
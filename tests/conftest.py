@@ -0,0 +1,4 @@
+import os
+
+# I test non usano Supabase: il backend è il database SQLite locale
+os.environ.setdefault('DATA_BACKEND', 'sqlite')
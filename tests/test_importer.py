@@ -0,0 +1,50 @@
+import pandas as pd
+import streamlit as st
+
+from utils import importer
+from utils.importer import DURATA_LEZIONE_DEFAULT, imported_rows, run_import, validate_import
+
+
+def _studenti(**columns):
+    base = {
+        'nome': ['Anna', 'Luca', 'Sara'],
+        'cognome': ['Rossi', 'Bianchi', 'Verdi'],
+        'canale': ['Diretto', 'Preply', 'iTalki'],
+        'livello': ['a1', 'B2', 'C1'],
+        'prezzo_lezione': ['20', '25,5', '30'],
+        'data_iscrizione': ['2026-01-05', '05/02/2026', '2026-03-01'],
+    }
+    return pd.DataFrame({**base, **columns})
+
+def test_durata_lezione_defaults_like_the_form():
+    valid, errors = validate_import('studenti', _studenti())
+    assert errors.empty
+    assert valid['durata_lezione'].tolist() == [DURATA_LEZIONE_DEFAULT] * 3
+
+def test_durata_lezione_non_numeric_is_a_row_error():
+    valid, errors = validate_import('studenti', _studenti(durata_lezione=['45', 'un\'ora', None]))
+    assert errors.to_dict('records') == [{'riga': 3, 'errore': "Durata lezione non valida (minuti)"}]
+    assert valid['durata_lezione'].tolist() == [45, DURATA_LEZIONE_DEFAULT]
+
+def test_run_import_resumes_by_file_row(monkeypatch):
+    inserted, calls = [], {'n': 0}
+
+    def bulk_insert(table_name, rows):
+        calls['n'] += 1
+        if calls['n'] == 2:
+            raise RuntimeError("down")
+        inserted.extend(row['nome'] for row in rows)
+        return len(rows)
+
+    monkeypatch.setattr(importer.backend, 'bulk_insert', bulk_insert, raising=False)
+    monkeypatch.setattr(importer.backend, 'load_data', lambda: None, raising=False)
+    st.session_state.pop('import_checkpoints', None)
+    rows = pd.DataFrame({'nome': ['a', 'b', 'c', 'd']}, index=[0, 1, 3, 4])
+
+    assert not run_import('studenti', rows, 'k', chunk_size=2)
+    assert imported_rows('k') == {0, 1}
+    # Al nuovo tentativo la validazione scarta la riga 1 e accetta la 2: nessuna riga saltata o ripetuta
+    rows = pd.DataFrame({'nome': ['a', 'c2', 'c', 'd']}, index=[0, 2, 3, 4])
+    assert run_import('studenti', rows, 'k', chunk_size=2)
+    assert inserted == ['a', 'b', 'c2', 'c', 'd']
+    assert imported_rows('k') == {0, 1, 2, 3, 4}
@@ -0,0 +1,72 @@
+import time
+
+from utils.write_queue import Result, Write, WriteQueue, batch_writes
+
+
+def _write(operation, key, table='pagamenti', session='s1'):
+    return Write(session, table, operation, key, {'id': key})
+
+def test_batch_writes_keeps_fifo_order():
+    writes = [_write('delete', 17), _write('insert', 'pending-P'), _write('delete', 'pending-P')]
+    batches = batch_writes(writes)
+    assert [(batch[0].operation, [write.key for write in batch]) for batch in batches] == [
+        ('delete', [17]), ('insert', ['pending-P']), ('delete', ['pending-P'])]
+
+def test_batch_writes_groups_consecutive_writes():
+    writes = [_write('insert', 'pending-A'), _write('insert', 'pending-B'),
+              _write('insert', 'pending-C', table='progressi'), _write('delete', 3), _write('delete', 4)]
+    assert [len(batch) for batch in batch_writes(writes)] == [2, 1, 2]
+
+def test_batch_writes_empty():
+    assert batch_writes([]) == []
+
+def _queue(flush):
+    write_queue = WriteQueue(flush)
+    # Niente thread: i blocchi si eseguono direttamente con _run_batch
+    write_queue._pending['s1'] = 0
+    return write_queue
+
+def _submit(write_queue, batch):
+    for write in batch:
+        write_queue._pending[write.session] += 1
+    write_queue._run_batch(batch)
+
+def test_run_batch_reports_every_write():
+    flush = lambda table_name, operation, writes: [Result(writes[0], True, None, None)]
+    write_queue = _queue(flush)
+    batch = [_write('insert', 'pending-A'), _write('insert', 'pending-B')]
+    _submit(write_queue, batch)
+    assert write_queue.pending('s1') == 0
+    results = write_queue.take_results('s1')
+    assert [(result.write.key, result.ok) for result in results] == [('pending-A', True), ('pending-B', False)]
+
+def test_run_batch_counts_identical_writes_separately():
+    write = _write('delete', 5)
+    flush = lambda table_name, operation, writes: [Result(writes[0], True, None, None)]
+    write_queue = _queue(flush)
+    _submit(write_queue, [write, write])
+    assert write_queue.pending('s1') == 0
+    assert [result.ok for result in write_queue.take_results('s1')] == [True, False]
+
+def test_run_batch_flush_error_fails_the_batch():
+    def flush(table_name, operation, writes):
+        raise RuntimeError("boom")
+    write_queue = _queue(flush)
+    _submit(write_queue, [_write('delete', 1), _write('delete', 2, session='s2')])
+    assert write_queue.pending('s1') == write_queue.pending('s2') == 0
+    assert [result.error for result in write_queue.take_results('s1')] == ["boom"]
+    assert write_queue.take_results('s1') == []
+
+def test_worker_runs_batches_in_order():
+    order = []
+    def flush(table_name, operation, writes):
+        order.append((operation, [write.key for write in writes]))
+        return [Result(write, True, None, None) for write in writes]
+    write_queue = WriteQueue(flush)
+    for write in [_write('delete', 17), _write('insert', 'pending-P'), _write('delete', 'pending-P')]:
+        write_queue.submit(write)
+    deadline = time.monotonic() + 5
+    while write_queue.pending('s1') and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert write_queue.pending('s1') == 0
+    assert order == [('delete', [17]), ('insert', ['pending-P']), ('delete', ['pending-P'])]
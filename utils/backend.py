@@ -0,0 +1,35 @@
+import importlib
+import os
+
+import streamlit as st
+
+# Sorgenti dei dati disponibili:
+# - direct: letture e scritture su Supabase
+# - replica: letture da una copia SQLite locale, sincronizzata con Supabase in background
+# - sqlite: solo il database locale data.db, senza Supabase
+BACKENDS = {
+    'direct': 'utils.supabase_db',
+    'replica': 'utils.replica',
+    'sqlite': 'utils.database',
+}
+
+# Modalità scelta da Streamlit secrets o variabile d'ambiente DATA_BACKEND
+if "DATA_BACKEND" in st.secrets:
+    DATA_BACKEND = st.secrets["DATA_BACKEND"]
+else:
+    DATA_BACKEND = os.environ.get("DATA_BACKEND", "direct")
+
+if DATA_BACKEND not in BACKENDS:
+    raise ValueError(f"DATA_BACKEND must be one of {', '.join(BACKENDS)} (got {DATA_BACKEND!r})")
+
+backend = importlib.import_module(BACKENDS[DATA_BACKEND])
+
+
+def report_writes():
+    """Show the outcome of the writes run in background, for the backends that queue them"""
+    if hasattr(backend, 'report_writes'):
+        backend.report_writes()
+
+def __getattr__(name):
+    """Resolve `from utils.backend import add_studente` to the configured backend module"""
+    return getattr(backend, name)
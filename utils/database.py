@@ -2,28 +2,73 @@ import sqlite3
 import pandas as pd
 import streamlit as st
 from datetime import datetime
-
-def init_db():
-    """Inizializza il database e crea le tabelle necessarie"""
-    conn = sqlite3.connect('data.db')
-    c = conn.cursor()
-
-    try:
-        # Create tables in correct order to avoid foreign key issues
-        c.execute('''CREATE TABLE IF NOT EXISTS branding_settings
-                     (id INTEGER PRIMARY KEY,
+from utils.table_cache import get_table_cache
+from utils.table_types import compact, record_loaded_size
+from utils.sqlite_pool import get_pool
+from utils.helpers import ordina_per_mese
+from utils.image_processor import LOGO_VARIANT_WIDTHS, create_logo_variants
+from utils.indici import COLONNE_RICERCA_LIBRERIA, cerca_testo, parole
+
+# Query usate per caricare le tabelle in session state
+TABLE_QUERIES = {
+    'studenti': "SELECT * FROM studenti",
+    'progressi': "SELECT * FROM progressi",
+    'libreria': "SELECT * FROM libreria",
+    'pagamenti': "SELECT * FROM pagamenti",
+    'custom_links': "SELECT * FROM custom_links",
+    'branding_settings': "SELECT * FROM branding_settings",
+    'giorni_lezione': """
+        SELECT gl.studente_id, gl.giorno, s.nome, s.cognome, s.livello
+        FROM giorni_lezione gl
+        JOIN studenti s ON gl.studente_id = s.id
+    """,
+}
+
+# Tabelle collegate agli studenti: eliminate a cascata insieme allo studente
+CHILD_TABLES = {
+    'giorni_lezione': ('''CREATE TABLE IF NOT EXISTS {name}
+                     ({id},
+                      studente_id INTEGER,
+                      giorno TEXT NOT NULL,
+                      FOREIGN KEY (studente_id) REFERENCES studenti(id) ON DELETE CASCADE)''',
+                       "id, studente_id, giorno"),
+    'progressi': ('''CREATE TABLE IF NOT EXISTS {name}
+                     ({id},
+                      studente_id INTEGER,
+                      data DATE NOT NULL,
+                      contenuto_id INTEGER,
+                      descrizione TEXT NOT NULL,
+                      FOREIGN KEY (studente_id) REFERENCES studenti(id) ON DELETE CASCADE,
+                      FOREIGN KEY (contenuto_id) REFERENCES libreria(id) ON DELETE SET NULL)''',
+                  "id, studente_id, data, contenuto_id, descrizione"),
+    'pagamenti': ('''CREATE TABLE IF NOT EXISTS {name}
+                     ({id},
+                      studente_id INTEGER,
+                      data DATE NOT NULL,
+                      importo REAL NOT NULL,
+                      mese TEXT NOT NULL,
+                      anno INTEGER NOT NULL,
+                      commenti TEXT,
+                      FOREIGN KEY (studente_id) REFERENCES studenti(id) ON DELETE CASCADE)''',
+                  "id, studente_id, data, importo, mese, anno, commenti"),
+}
+
+# Tabelle principali, create prima di quelle collegate agli studenti
+TABLES = {
+    'branding_settings': '''CREATE TABLE IF NOT EXISTS {name}
+                     ({id},
                       logo BLOB,
-                      welcome_message TEXT)''')
-
-        c.execute('''CREATE TABLE IF NOT EXISTS custom_links
-                     (id INTEGER PRIMARY KEY,
+                      welcome_message TEXT,
+                      logo_160 BLOB,
+                      logo_320 BLOB)''',
+    'custom_links': '''CREATE TABLE IF NOT EXISTS {name}
+                     ({id},
                       titolo TEXT NOT NULL,
                       url TEXT NOT NULL,
                       icona BLOB,
-                      ordine INTEGER)''')
-
-        c.execute('''CREATE TABLE IF NOT EXISTS studenti
-                     (id INTEGER PRIMARY KEY,
+                      ordine INTEGER)''',
+    'studenti': '''CREATE TABLE IF NOT EXISTS {name}
+                     ({id},
                       nome TEXT NOT NULL,
                       cognome TEXT NOT NULL,
                       canale TEXT NOT NULL,
@@ -35,47 +80,250 @@ def init_db():
                       data_iscrizione DATE NOT NULL,
                       slides_url TEXT,
                       classroom_url TEXT,
-                      meet_url TEXT)''')
-
-        c.execute('''CREATE TABLE IF NOT EXISTS giorni_lezione
-                     (id INTEGER PRIMARY KEY,
-                      studente_id INTEGER,
-                      giorno TEXT NOT NULL,
-                      FOREIGN KEY (studente_id) REFERENCES studenti(id))''')
-
-        c.execute('''CREATE TABLE IF NOT EXISTS progressi
-                     (id INTEGER PRIMARY KEY,
-                      studente_id INTEGER,
-                      data DATE NOT NULL,
-                      contenuto_id INTEGER,
-                      descrizione TEXT NOT NULL,
-                      FOREIGN KEY (studente_id) REFERENCES studenti(id),
-                      FOREIGN KEY (contenuto_id) REFERENCES libreria(id))''')
-
-        c.execute('''CREATE TABLE IF NOT EXISTS pagamenti
-                     (id INTEGER PRIMARY KEY,
-                      studente_id INTEGER,
-                      data DATE NOT NULL,
-                      importo REAL NOT NULL,
-                      mese TEXT NOT NULL,
-                      anno INTEGER NOT NULL,
-                      commenti TEXT,
-                      FOREIGN KEY (studente_id) REFERENCES studenti(id))''')
-
-        c.execute('''CREATE TABLE IF NOT EXISTS libreria
-                     (id INTEGER PRIMARY KEY,
+                      meet_url TEXT)''',
+    'libreria': '''CREATE TABLE IF NOT EXISTS {name}
+                     ({id},
                       libro TEXT,
                       titolo TEXT NOT NULL,
                       url TEXT NOT NULL,
                       categoria TEXT NOT NULL,
                       livello TEXT NOT NULL,
-                      descrizione TEXT)''')
-                      
-        c.execute('''CREATE TABLE IF NOT EXISTS libri_disponibili
-                     (id INTEGER PRIMARY KEY,
-                      nome TEXT NOT NULL UNIQUE)''')
+                      descrizione TEXT)''',
+}
 
+# Chiave primaria delle tabelle: intera e autoincrementale in data.db
+ID_COLUMN = 'id INTEGER PRIMARY KEY'
+
+DB_PATH = 'data.db'
+
+def _connection():
+    """Prende in prestito una connessione dal pool condiviso (WAL, foreign key attive)"""
+    return get_pool(DB_PATH).connection()
+
+def _upgrade_cascade(conn):
+    """Ricrea le tabelle collegate agli studenti con ON DELETE CASCADE.
+
+    SQLite non permette di modificare un vincolo esistente: le tabelle vengono
+    ricreate e ricopiate in una transazione, scartando i record orfani.
+    """
+    conn.execute("PRAGMA foreign_keys = OFF")
+    conn.execute("BEGIN")
+    try:
+        # I trigger del riepilogo mensile impedirebbero di ricreare pagamenti:
+        # li ricrea, con un ricalcolo completo, l'aggiornamento successivo
+        for trigger_name in PAGAMENTI_MENSILI_TRIGGERS:
+            conn.execute(f"DROP TRIGGER IF EXISTS {trigger_name}")
+        for table_name, (ddl, columns) in CHILD_TABLES.items():
+            conn.execute(ddl.format(name=f"{table_name}_nuova", id=ID_COLUMN))
+            conn.execute(f"""INSERT INTO {table_name}_nuova ({columns})
+                             SELECT {columns} FROM {table_name}
+                             WHERE studente_id IN (SELECT id FROM studenti)""")
+            conn.execute(f"DROP TABLE {table_name}")
+            conn.execute(f"ALTER TABLE {table_name}_nuova RENAME TO {table_name}")
+        conn.execute("""UPDATE progressi SET contenuto_id = NULL
+                        WHERE contenuto_id NOT IN (SELECT id FROM libreria)""")
         conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.execute("PRAGMA foreign_keys = ON")
+
+# Indici sulle foreign key e sulle colonne usate per filtrare per studente e per mese
+INDEXES = {
+    'idx_giorni_lezione_studente': "giorni_lezione (studente_id)",
+    'idx_progressi_studente_data': "progressi (studente_id, data)",
+    'idx_pagamenti_studente': "pagamenti (studente_id)",
+    'idx_pagamenti_anno_mese': "pagamenti (anno, mese)",
+    'idx_progressi_contenuto': "progressi (contenuto_id)",
+}
+
+def _create_indexes(conn):
+    """Crea gli indici mancanti e aggiorna le statistiche del query planner"""
+    for index_name, columns in INDEXES.items():
+        conn.execute(f"CREATE INDEX IF NOT EXISTS {index_name} ON {columns}")
+    conn.commit()
+    conn.execute("ANALYZE")
+
+# Riepilogo mensile dei pagamenti per canale: i trigger lo aggiornano a ogni
+# scrittura su pagamenti e studenti, così le statistiche leggono una riga per
+# mese e canale invece di tutti i pagamenti. Contiene i pagamenti di studenti
+# esistenti, attribuiti al canale attuale dello studente.
+PAGAMENTI_MENSILI = '''CREATE TABLE IF NOT EXISTS pagamenti_mensili
+                     (anno INTEGER NOT NULL,
+                      mese TEXT NOT NULL,
+                      canale TEXT NOT NULL,
+                      totale REAL NOT NULL,
+                      n_pagamenti INTEGER NOT NULL,
+                      PRIMARY KEY (anno, mese, canale))'''
+
+# Somma nel riepilogo le righe di una SELECT (anno, mese, canale, totale, n_pagamenti)
+_AGGIUNGI_MENSILI = """INSERT INTO pagamenti_mensili (anno, mese, canale, totale, n_pagamenti)
+                       {select}
+                       ON CONFLICT (anno, mese, canale) DO UPDATE
+                       SET totale = totale + excluded.totale, n_pagamenti = n_pagamenti + excluded.n_pagamenti;
+                       DELETE FROM pagamenti_mensili WHERE n_pagamenti <= 0;"""
+
+# Un pagamento (NEW o OLD) con segno +1 o -1; senza studente la SELECT è vuota
+_PAGAMENTO = """SELECT {row}.anno, {row}.mese, s.canale, {sign} * {row}.importo, {sign}
+                FROM studenti s WHERE s.id = {row}.studente_id"""
+
+# Tutti i pagamenti di uno studente, con il canale indicato e segno +1 o -1
+_PAGAMENTI_STUDENTE = """SELECT anno, mese, {row}.canale, {sign} * SUM(importo), {sign} * COUNT(*)
+                         FROM pagamenti WHERE studente_id = {row}.id GROUP BY anno, mese"""
+
+PAGAMENTI_MENSILI_TRIGGERS = {
+    'pagamenti_mensili_insert': ("AFTER INSERT ON pagamenti",
+                                 [_PAGAMENTO.format(row='NEW', sign=1)]),
+    'pagamenti_mensili_delete': ("AFTER DELETE ON pagamenti",
+                                 [_PAGAMENTO.format(row='OLD', sign=-1)]),
+    'pagamenti_mensili_update': ("AFTER UPDATE OF studente_id, importo, anno, mese ON pagamenti",
+                                 [_PAGAMENTO.format(row='OLD', sign=-1), _PAGAMENTO.format(row='NEW', sign=1)]),
+    'pagamenti_mensili_studente_insert': ("AFTER INSERT ON studenti",
+                                          [_PAGAMENTI_STUDENTE.format(row='NEW', sign=1)]),
+    # BEFORE: durante la cancellazione a cascata lo studente non esiste già più
+    # e i trigger sui pagamenti non trovano il canale da aggiornare
+    'pagamenti_mensili_studente_delete': ("BEFORE DELETE ON studenti",
+                                          [_PAGAMENTI_STUDENTE.format(row='OLD', sign=-1)]),
+    'pagamenti_mensili_studente_canale': ("""AFTER UPDATE OF id, canale ON studenti
+                                           WHEN OLD.canale IS NOT NEW.canale OR OLD.id IS NOT NEW.id""",
+                                          [_PAGAMENTI_STUDENTE.format(row='OLD', sign=-1),
+                                           _PAGAMENTI_STUDENTE.format(row='NEW', sign=1)]),
+}
+
+# Riepilogo ricalcolato dai pagamenti, per la ricostruzione e la verifica
+_PAGAMENTI_MENSILI_CALCOLATI = """SELECT p.anno, p.mese, s.canale, SUM(p.importo) AS totale, COUNT(*) AS n_pagamenti
+                                  FROM pagamenti p JOIN studenti s ON s.id = p.studente_id
+                                  GROUP BY p.anno, p.mese, s.canale"""
+
+def _rebuild_pagamenti_mensili(conn):
+    """Ricalcola da zero il riepilogo mensile dei pagamenti (senza commit)"""
+    conn.execute("DELETE FROM pagamenti_mensili")
+    conn.execute(f"""INSERT INTO pagamenti_mensili (anno, mese, canale, totale, n_pagamenti)
+                     {_PAGAMENTI_MENSILI_CALCOLATI}""")
+
+def _create_pagamenti_mensili(conn, rebuild=True):
+    """Crea il riepilogo mensile dei pagamenti con i suoi trigger e lo ricalcola.
+
+    Con rebuild=False il ricalcolo avviene solo se la tabella non esisteva.
+    """
+    exists = conn.execute("""SELECT 1 FROM sqlite_master
+                             WHERE type = 'table' AND name = 'pagamenti_mensili'""").fetchone()
+    conn.execute(PAGAMENTI_MENSILI)
+    for trigger_name, (event, selects) in PAGAMENTI_MENSILI_TRIGGERS.items():
+        body = "\n".join(_AGGIUNGI_MENSILI.format(select=select) for select in selects)
+        conn.execute(f"CREATE TRIGGER IF NOT EXISTS {trigger_name} {event} BEGIN {body} END")
+    if rebuild or not exists:
+        _rebuild_pagamenti_mensili(conn)
+    conn.commit()
+
+# Indice full-text (FTS5) di titolo e descrizione della libreria, senza
+# distinguere maiuscole e accenti. Il testo resta in libreria ("external
+# content"): l'indice è collegato per rowid, che nella replica locale è
+# distinto dall'id, e i trigger lo tengono aggiornato
+LIBRERIA_FTS = """CREATE VIRTUAL TABLE IF NOT EXISTS libreria_fts
+                  USING fts5(titolo, descrizione, content='libreria',
+                             tokenize='unicode61 remove_diacritics 2')"""
+
+_INDICIZZA = "INSERT INTO libreria_fts (rowid, titolo, descrizione) VALUES (NEW.rowid, NEW.titolo, NEW.descrizione);"
+_DEINDICIZZA = """INSERT INTO libreria_fts (libreria_fts, rowid, titolo, descrizione)
+                  VALUES ('delete', OLD.rowid, OLD.titolo, OLD.descrizione);"""
+
+LIBRERIA_FTS_TRIGGERS = {
+    'libreria_fts_insert': ("AFTER INSERT ON libreria", [_INDICIZZA]),
+    'libreria_fts_delete': ("AFTER DELETE ON libreria", [_DEINDICIZZA]),
+    'libreria_fts_update': ("AFTER UPDATE ON libreria", [_DEINDICIZZA, _INDICIZZA]),
+}
+
+def _create_libreria_fts(conn, rebuild=True):
+    """Crea l'indice full-text della libreria con i suoi trigger e lo ricostruisce.
+
+    Con rebuild=False la ricostruzione avviene solo se l'indice non esisteva.
+    Senza il modulo FTS5 in SQLite la ricerca usa l'indice in memoria.
+    """
+    exists = conn.execute("""SELECT 1 FROM sqlite_master
+                             WHERE type = 'table' AND name = 'libreria_fts'""").fetchone()
+    try:
+        conn.execute(LIBRERIA_FTS)
+    except sqlite3.OperationalError:
+        return
+    for trigger_name, (event, statements) in LIBRERIA_FTS_TRIGGERS.items():
+        conn.execute(f"CREATE TRIGGER IF NOT EXISTS {trigger_name} {event} BEGIN {' '.join(statements)} END")
+    if rebuild or not exists:
+        conn.execute("INSERT INTO libreria_fts (libreria_fts) VALUES ('rebuild')")
+    conn.commit()
+
+# Colonne delle varianti ridimensionate del logo, per larghezza
+LOGO_VARIANTS = {width: f'logo_{width}' for width in LOGO_VARIANT_WIDTHS}
+
+def _logo_variants(logo):
+    """Restituisce {colonna: PNG ridimensionato} per il logo (anche in base64),
+    vuoto senza logo o se non è un'immagine leggibile (si mostrerà l'originale)"""
+    variants = create_logo_variants(logo)
+    return {LOGO_VARIANTS[width]: variants[width] for width in variants}
+
+def _add_logo_variants(conn, rebuild=True):
+    """Aggiunge le colonne delle varianti del logo e le genera per il logo salvato.
+
+    Con rebuild=False le colonne mancanti vengono solo aggiunte (la replica
+    riceve le varianti da Supabase).
+    """
+    existing = {row[1] for row in conn.execute("PRAGMA table_info(branding_settings)")}
+    for column in LOGO_VARIANTS.values():
+        if column not in existing:
+            conn.execute(f"ALTER TABLE branding_settings ADD COLUMN {column} BLOB")
+    if rebuild:
+        for id, logo in conn.execute("SELECT id, logo FROM branding_settings").fetchall():
+            variants = _logo_variants(logo)
+            if variants:
+                assignments = ', '.join(f"{column} = ?" for column in variants)
+                conn.execute(f"UPDATE branding_settings SET {assignments} WHERE id = ?", (*variants.values(), id))
+    conn.commit()
+
+# Aggiornamenti dello schema, applicati in ordine in base a PRAGMA user_version
+MIGRATIONS = [_upgrade_cascade, _create_indexes, _create_pagamenti_mensili, _create_libreria_fts,
+              _add_logo_variants]
+
+def create_schema(conn, id_column=ID_COLUMN):
+    """Crea le tabelle e gli indici mancanti.
+
+    id_column permette di riusare lo schema con chiavi diverse, ad esempio
+    'id PRIMARY KEY' per la replica locale di Supabase (id interi o UUID).
+    """
+    for table_name, ddl in TABLES.items():
+        conn.execute(ddl.format(name=table_name, id=id_column))
+    for table_name, (ddl, _) in CHILD_TABLES.items():
+        conn.execute(ddl.format(name=table_name, id=id_column))
+    conn.execute('''CREATE TABLE IF NOT EXISTS libri_disponibili
+                    (id INTEGER PRIMARY KEY,
+                     nome TEXT NOT NULL UNIQUE)''')
+    for index_name, columns in INDEXES.items():
+        conn.execute(f"CREATE INDEX IF NOT EXISTS {index_name} ON {columns}")
+    _create_pagamenti_mensili(conn, rebuild=False)
+    _create_libreria_fts(conn, rebuild=False)
+    _add_logo_variants(conn, rebuild=False)
+    conn.commit()
+
+def _migrate(conn):
+    """Porta lo schema di un database esistente all'ultima versione"""
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    for number, upgrade in enumerate(MIGRATIONS[version:], start=version + 1):
+        upgrade(conn)
+        conn.execute(f"PRAGMA user_version = {number}")
+        conn.commit()
+
+def _invalidate(*tables):
+    """Invalida le tabelle modificate nella cache condivisa tra le sessioni"""
+    get_table_cache('sqlite').invalidate(*tables)
+
+def init_db():
+    """Inizializza il database e crea le tabelle necessarie"""
+    try:
+        with _connection() as conn:
+            create_schema(conn)
+            _migrate(conn)
+            # Aggiorna le statistiche solo delle tabelle cambiate molto dall'ultimo ANALYZE
+            conn.execute("PRAGMA optimize")
 
         # Initialize session states
         if 'studenti' not in st.session_state:
@@ -101,7 +349,8 @@ def init_db():
                 'id', 'titolo', 'url', 'icona', 'ordine'
             ])
         if 'branding_settings' not in st.session_state:
-            st.session_state.branding_settings = pd.DataFrame(columns=['id', 'logo', 'welcome_message'])
+            st.session_state.branding_settings = pd.DataFrame(columns=['id', 'logo', 'welcome_message',
+                                                                       *LOGO_VARIANTS.values()])
 
 
         # Load data
@@ -109,241 +358,340 @@ def init_db():
 
     except Exception as e:
         st.error(f"Errore nell'inizializzazione del database: {str(e)}")
-    finally:
-        conn.close()
 
 def load_data():
-    """Carica i dati dal database nelle session state"""
-    conn = sqlite3.connect('data.db')
+    """Carica i dati dal database nelle session state.
+
+    Le tabelle vengono lette dalla cache condivisa tra le sessioni e
+    interrogate sul database solo se scadute o invalidate da una scrittura.
+    """
+    cache = get_table_cache('sqlite')
     try:
-        st.session_state.studenti = pd.read_sql_query("SELECT * FROM studenti", conn)
-        st.session_state.progressi = pd.read_sql_query("SELECT * FROM progressi", conn)
-        st.session_state.libreria = pd.read_sql_query("SELECT * FROM libreria", conn)
-        st.session_state.pagamenti = pd.read_sql_query("SELECT * FROM pagamenti", conn)
-        st.session_state.custom_links = pd.read_sql_query("SELECT * FROM custom_links", conn)
-        st.session_state.giorni_lezione = pd.read_sql_query("""
-            SELECT gl.studente_id, gl.giorno, s.nome, s.cognome, s.livello
-            FROM giorni_lezione gl
-            JOIN studenti s ON gl.studente_id = s.id
-        """, conn)
-        
-        # Carica anche la lista dei libri disponibili
-        libri = pd.read_sql_query("SELECT nome FROM libri_disponibili ORDER BY nome", conn)
-        if not libri.empty:
-            st.session_state.libri_disponibili = set(libri['nome'].tolist())
-        else:
-            st.session_state.libri_disponibili = set()
+        with cache.lock, _connection() as conn:
+            for table_name, query in TABLE_QUERIES.items():
+                snapshot = cache.get(table_name)
+                if snapshot is None:
+                    data = pd.read_sql_query(query, conn)
+                    record_loaded_size(table_name, data)
+                    snapshot = cache.put(table_name, compact(table_name, data))
+                st.session_state[table_name] = snapshot.data
+
+            # Carica anche la lista dei libri disponibili
+            snapshot = cache.get('libri_disponibili')
+            if snapshot is None:
+                libri = pd.read_sql_query("SELECT nome FROM libri_disponibili ORDER BY nome", conn)
+                snapshot = cache.put('libri_disponibili', set(libri['nome'].tolist()))
+            st.session_state.libri_disponibili = snapshot.data
 
     except Exception as e:
         st.error(f"Errore nel caricamento dei dati: {str(e)}")
-    finally:
-        conn.close()
+
+def iter_table(table_name, columns='*', filters=None, chunk_size=1000, connection=None):
+    """Restituisce la tabella a blocchi di DataFrame, leggendo il cursore con fetchmany.
+
+    filters associa a una colonna un valore o una lista di valori ammessi,
+    come helpers.filter_dataframe. In memoria c'è un solo blocco alla volta.
+    """
+    conditions, params = [], []
+    for column, value in (filters or {}).items():
+        values = list(value) if isinstance(value, (list, tuple, set)) else [value]
+        conditions.append(f"{column} IN ({', '.join('?' * len(values))})")
+        params.extend(values)
+    where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+
+    with (connection or _connection)() as conn:
+        cursor = conn.execute(f"SELECT {columns} FROM {table_name}{where} ORDER BY id", params)
+        names = [description[0] for description in cursor.description]
+        while rows := cursor.fetchmany(chunk_size):
+            yield pd.DataFrame.from_records(rows, columns=names)
+
+# Statistiche dei pagamenti calcolate con GROUP BY, per tipo di statistica:
+# quelle mensili e per canale leggono il riepilogo pagamenti_mensili
+STATISTICHE_PAGAMENTI_QUERIES = {
+    'mensili': """SELECT anno, mese, SUM(totale) AS totale, SUM(n_pagamenti) AS n_pagamenti
+                  FROM pagamenti_mensili
+                  GROUP BY anno, mese""",
+    'canali': """SELECT anno, mese, canale, totale, n_pagamenti
+                 FROM pagamenti_mensili""",
+    'studenti': """SELECT p.studente_id, s.nome, s.cognome,
+                          SUM(p.importo) AS totale, AVG(p.importo) AS media, COUNT(*) AS n_pagamenti
+                   FROM pagamenti p
+                   JOIN studenti s ON s.id = p.studente_id
+                   GROUP BY p.studente_id, s.nome, s.cognome""",
+}
+
+def get_statistiche_pagamenti(vista, connection=None):
+    """Restituisce le statistiche dei pagamenti calcolate dal database: 'mensili' o 'studenti'"""
+    with (connection or _connection)() as conn:
+        stats = pd.read_sql_query(STATISTICHE_PAGAMENTI_QUERIES[vista], conn)
+    return ordina_per_mese(stats) if vista != 'studenti' else stats
+
+def ricostruisci_pagamenti_mensili(connection=None):
+    """Ricalcola da zero il riepilogo mensile dei pagamenti e restituisce le righe scritte"""
+    with (connection or _connection)() as conn:
+        _rebuild_pagamenti_mensili(conn)
+        righe = conn.execute("SELECT COUNT(*) FROM pagamenti_mensili").fetchone()[0]
+        conn.commit()
+    return righe
+
+def verifica_pagamenti_mensili(connection=None):
+    """Confronta il riepilogo mensile con i pagamenti e restituisce le righe che non tornano"""
+    # FULL OUTER JOIN non c'è nelle versioni di SQLite precedenti alla 3.39:
+    # si uniscono le chiavi dei due lati e si confrontano con due LEFT JOIN
+    query = f"""WITH calcolati AS ({_PAGAMENTI_MENSILI_CALCOLATI}),
+                     chiavi AS (SELECT anno, mese, canale FROM pagamenti_mensili
+                                UNION SELECT anno, mese, canale FROM calcolati)
+                SELECT k.anno, k.mese, k.canale,
+                       r.totale AS totale_riepilogo, c.totale AS totale_pagamenti,
+                       r.n_pagamenti AS n_riepilogo, c.n_pagamenti AS n_pagamenti
+                FROM chiavi k
+                LEFT JOIN pagamenti_mensili r ON r.anno = k.anno AND r.mese = k.mese AND r.canale = k.canale
+                LEFT JOIN calcolati c ON c.anno = k.anno AND c.mese = k.mese AND c.canale = k.canale
+                WHERE r.n_pagamenti IS NOT c.n_pagamenti
+                   OR ABS(COALESCE(r.totale, 0) - COALESCE(c.totale, 0)) > 0.005"""
+    with (connection or _connection)() as conn:
+        return ordina_per_mese(pd.read_sql_query(query, conn))
+
+def cerca_risorse(query, connection=None):
+    """Restituisce gli id delle risorse della libreria che contengono tutte le
+    parole di query (anche come inizio di parola), dalla più pertinente.
+
+    Usa l'indice FTS5 con il punteggio bm25; se SQLite non ha FTS5 cerca
+    nell'indice in memoria della libreria in sessione.
+    """
+    parole_query = parole(query)
+    if not parole_query:
+        return []
+    # Ogni parola tra virgolette (nessun operatore FTS5) e con * per la ricerca per prefisso
+    match = ' '.join(f'"{parola}"*' for parola in parole_query)
+    pesi = ', '.join(str(peso) for peso in COLONNE_RICERCA_LIBRERIA.values())
+    try:
+        with (connection or _connection)() as conn:
+            rows = conn.execute(f"""SELECT l.id FROM libreria_fts
+                                    JOIN libreria l ON l.rowid = libreria_fts.rowid
+                                    WHERE libreria_fts MATCH ?
+                                    ORDER BY bm25(libreria_fts, {pesi})""", (match,)).fetchall()
+    except sqlite3.OperationalError:
+        return cerca_testo(st.session_state.libreria, query, COLONNE_RICERCA_LIBRERIA)
+    return [row[0] for row in rows]
 
 def add_studente(nome, cognome, canale, livello, metodologia, durata_lezione, prezzo_lezione, 
                 commenti, data_iscrizione, slides_url, classroom_url, meet_url, giorni_lezione=None):
     """Aggiunge un nuovo studente al database"""
-    conn = sqlite3.connect('data.db')
-    c = conn.cursor()
-    try:
-        c.execute("""INSERT INTO studenti 
-                     (nome, cognome, canale, livello, metodologia, durata_lezione, 
-                      prezzo_lezione, commenti, data_iscrizione, slides_url, classroom_url, meet_url)
-                     VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""", 
-                  (nome, cognome, canale, livello, metodologia, durata_lezione, 
-                   prezzo_lezione, commenti, data_iscrizione, slides_url, classroom_url, meet_url))
-
-        # Get the ID of the newly inserted student
-        studente_id = c.lastrowid
-
-        # Insert giorni_lezione if provided
-        if giorni_lezione:
-            for giorno in giorni_lezione:
-                c.execute("""INSERT INTO giorni_lezione (studente_id, giorno)
-                           VALUES (?, ?)""", (studente_id, giorno))
+    with _connection() as conn:
+        c = conn.cursor()
+        try:
+            c.execute("""INSERT INTO studenti 
+                         (nome, cognome, canale, livello, metodologia, durata_lezione, 
+                          prezzo_lezione, commenti, data_iscrizione, slides_url, classroom_url, meet_url)
+                         VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""", 
+                      (nome, cognome, canale, livello, metodologia, durata_lezione, 
+                       prezzo_lezione, commenti, data_iscrizione, slides_url, classroom_url, meet_url))
+
+            # Get the ID of the newly inserted student
+            studente_id = c.lastrowid
+
+            # Insert giorni_lezione if provided, in the same transaction
+            if giorni_lezione:
+                c.executemany("""INSERT INTO giorni_lezione (studente_id, giorno)
+                                 VALUES (?, ?)""", [(studente_id, giorno) for giorno in giorni_lezione])
+
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            st.error(f"Errore nell'aggiunta dello studente: {str(e)}")
+    _invalidate('studenti', 'giorni_lezione')
+    load_data()
 
+def bulk_insert(table_name, rows):
+    """Inserisce una lista di righe in un'unica transazione e restituisce quante sono state scritte"""
+    if not rows:
+        return 0
+    columns = list(rows[0])
+    with _connection() as conn:
+        conn.executemany(f"INSERT INTO {table_name} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})",
+                         [tuple(row[column] for column in columns) for row in rows])
         conn.commit()
-    except Exception as e:
-        st.error(f"Errore nell'aggiunta dello studente: {str(e)}")
-    finally:
-        conn.close()
-    load_data()
+    _invalidate(table_name)
+    return len(rows)
 
 def add_custom_link(titolo, url, icona, ordine):
     """Aggiunge un nuovo link personalizzato"""
-    conn = sqlite3.connect('data.db')
-    c = conn.cursor()
-    c.execute("""INSERT INTO custom_links (titolo, url, icona, ordine)
-                 VALUES (?, ?, ?, ?)""",
-              (titolo, url, icona, ordine))
-    conn.commit()
-    conn.close()
+    with _connection() as conn:
+        conn.execute("""INSERT INTO custom_links (titolo, url, icona, ordine)
+                        VALUES (?, ?, ?, ?)""",
+                     (titolo, url, icona, ordine))
+        conn.commit()
+    _invalidate('custom_links')
     load_data()
 
 def update_custom_link(id, titolo, url, icona, ordine):
     """Aggiorna un link personalizzato"""
-    conn = sqlite3.connect('data.db')
-    c = conn.cursor()
-    c.execute("""UPDATE custom_links 
-                 SET titolo = ?, url = ?, icona = ?, ordine = ?
-                 WHERE id = ?""",
-              (titolo, url, icona, ordine, id))
-    conn.commit()
-    conn.close()
+    with _connection() as conn:
+        conn.execute("""UPDATE custom_links 
+                        SET titolo = ?, url = ?, icona = ?, ordine = ?
+                        WHERE id = ?""",
+                     (titolo, url, icona, ordine, id))
+        conn.commit()
+    _invalidate('custom_links')
     load_data()
 
 def delete_custom_link(id):
     """Elimina un link personalizzato"""
-    conn = sqlite3.connect('data.db')
-    c = conn.cursor()
-    c.execute("DELETE FROM custom_links WHERE id = ?", (id,))
-    conn.commit()
-    conn.close()
+    with _connection() as conn:
+        conn.execute("DELETE FROM custom_links WHERE id = ?", (id,))
+        conn.commit()
+    _invalidate('custom_links')
     load_data()
 
-def add_progresso(studente_id, data, contenuto_id, descrizione):
-    """Aggiunge un nuovo progresso al database"""
-    conn = sqlite3.connect('data.db')
-    c = conn.cursor()
-    c.execute("""INSERT INTO progressi (studente_id, data, contenuto_id, descrizione)
-                 VALUES (?, ?, ?, ?)""",
-              (studente_id, data, contenuto_id, descrizione))
-    conn.commit()
-    conn.close()
+def add_progresso(studente_id, data, contenuto_id, descrizione, in_background=False):
+    """Aggiunge un nuovo progresso al database (in_background non serve: la scrittura è locale)"""
+    with _connection() as conn:
+        conn.execute("""INSERT INTO progressi (studente_id, data, contenuto_id, descrizione)
+                        VALUES (?, ?, ?, ?)""",
+                     (studente_id, data, contenuto_id, descrizione))
+        conn.commit()
+    _invalidate('progressi')
     load_data()
 
 def add_risorsa(libro, titolo, url, categoria, livello, descrizione):
     """Aggiunge una nuova risorsa alla libreria"""
-    conn = sqlite3.connect('data.db')
-    c = conn.cursor()
-    c.execute("""INSERT INTO libreria (libro, titolo, url, categoria, livello, descrizione)
-                 VALUES (?, ?, ?, ?, ?, ?)""",
-              (libro, titolo, url, categoria, livello, descrizione))
-    conn.commit()
-    conn.close()
+    with _connection() as conn:
+        conn.execute("""INSERT INTO libreria (libro, titolo, url, categoria, livello, descrizione)
+                        VALUES (?, ?, ?, ?, ?, ?)""",
+                     (libro, titolo, url, categoria, livello, descrizione))
+        conn.commit()
+    _invalidate('libreria')
     load_data()
     
 def delete_risorsa(id):
     """Elimina una risorsa dalla libreria"""
-    conn = sqlite3.connect('data.db')
-    c = conn.cursor()
-    c.execute("DELETE FROM libreria WHERE id = ?", (id,))
-    conn.commit()
-    conn.close()
+    with _connection() as conn:
+        conn.execute("DELETE FROM libreria WHERE id = ?", (id,))
+        conn.commit()
+    # progressi.contenuto_id diventa NULL (ON DELETE SET NULL): anche progressi è cambiata
+    _invalidate('libreria', 'progressi')
     load_data()
 
-def add_pagamento(studente_id, data, importo, mese, anno, commenti):
-    """Aggiunge un nuovo pagamento al database"""
-    conn = sqlite3.connect('data.db')
-    c = conn.cursor()
-    c.execute("""INSERT INTO pagamenti (studente_id, data, importo, mese, anno, commenti)
-                 VALUES (?, ?, ?, ?, ?, ?)""",
-              (studente_id, data, importo, mese, anno, commenti))
-    conn.commit()
-    conn.close()
+def add_pagamento(studente_id, data, importo, mese, anno, commenti, in_background=False):
+    """Aggiunge un nuovo pagamento al database (in_background non serve: la scrittura è locale)"""
+    with _connection() as conn:
+        conn.execute("""INSERT INTO pagamenti (studente_id, data, importo, mese, anno, commenti)
+                        VALUES (?, ?, ?, ?, ?, ?)""",
+                     (studente_id, data, importo, mese, anno, commenti))
+        conn.commit()
+    _invalidate('pagamenti')
     load_data()
 
 def update_studente(id, nome, cognome, canale, livello, durata_lezione, prezzo_lezione):
     """Aggiorna i dati di uno studente"""
-    conn = sqlite3.connect('data.db')
-    c = conn.cursor()
-    c.execute("""UPDATE studenti 
-                 SET nome = ?, cognome = ?, canale = ?, livello = ?, 
-                     durata_lezione = ?, prezzo_lezione = ?
-                 WHERE id = ?""",
-              (nome, cognome, canale, livello, durata_lezione, prezzo_lezione, id))
-    conn.commit()
-    conn.close()
+    with _connection() as conn:
+        conn.execute("""UPDATE studenti 
+                        SET nome = ?, cognome = ?, canale = ?, livello = ?, 
+                            durata_lezione = ?, prezzo_lezione = ?
+                        WHERE id = ?""",
+                     (nome, cognome, canale, livello, durata_lezione, prezzo_lezione, id))
+        conn.commit()
+    _invalidate('studenti', 'giorni_lezione')
     load_data()
 
 def delete_studente(id):
-    """Elimina uno studente dal database"""
-    conn = sqlite3.connect('data.db')
-    c = conn.cursor()
-    c.execute("DELETE FROM studenti WHERE id = ?", (id,))
-    # Elimina anche i progressi e i pagamenti associati
-    c.execute("DELETE FROM progressi WHERE studente_id = ?", (id,))
-    c.execute("DELETE FROM pagamenti WHERE studente_id = ?", (id,))
-    c.execute("DELETE FROM giorni_lezione WHERE studente_id = ?", (id,)) #added to delete from new table
-    conn.commit()
-    conn.close()
+    """Elimina uno studente dal database (progressi, pagamenti e giorni di lezione a cascata)"""
+    delete_studenti([id])
+
+def delete_studenti(ids):
+    """Elimina più studenti in un'unica transazione, con i record collegati a cascata"""
+    with _connection() as conn:
+        conn.executemany("DELETE FROM studenti WHERE id = ?", [(id,) for id in ids])
+        conn.commit()
+    _invalidate('studenti', 'progressi', 'pagamenti', 'giorni_lezione')
     load_data()
 
 def save_branding_settings(logo_bytes=None, welcome_message=None):
-    """Salva le impostazioni di branding"""
-    conn = sqlite3.connect('data.db')
-    c = conn.cursor()
-
-    # Check if settings exist
-    c.execute("SELECT COUNT(*) FROM branding_settings")
-    if c.fetchone()[0] == 0:
-        c.execute("INSERT INTO branding_settings (logo, welcome_message) VALUES (?, ?)", 
-                 (logo_bytes, welcome_message))
-    else:
-        c.execute("UPDATE branding_settings SET logo = ?, welcome_message = ?", 
-                 (logo_bytes, welcome_message))
-
-    conn.commit()
-    conn.close()
+    """Salva le impostazioni di branding con le varianti ridimensionate del logo"""
+    variants = _logo_variants(logo_bytes) or dict.fromkeys(LOGO_VARIANTS.values())
+    data = {'logo': logo_bytes, 'welcome_message': welcome_message, **variants}
+    with _connection() as conn:
+        c = conn.cursor()
 
-def get_branding_settings():
-    """Recupera le impostazioni di branding"""
-    conn = sqlite3.connect('data.db')
-    c = conn.cursor()
+        # Check if settings exist
+        c.execute("SELECT COUNT(*) FROM branding_settings")
+        if c.fetchone()[0] == 0:
+            c.execute(f"INSERT INTO branding_settings ({', '.join(data)}) VALUES ({', '.join('?' * len(data))})",
+                     tuple(data.values()))
+        else:
+            c.execute(f"UPDATE branding_settings SET {', '.join(f'{column} = ?' for column in data)}",
+                     tuple(data.values()))
 
-    c.execute("SELECT logo, welcome_message FROM branding_settings LIMIT 1")
-    result = c.fetchone()
+        conn.commit()
+    _invalidate('branding_settings')
+    load_data()
 
-    conn.close()
-    return result if result else (None, None)
+def get_logo(variant=None):
+    """Recupera il logo dalle impostazioni in sessione.
+
+    variant (una di LOGO_VARIANT_WIDTHS) sceglie la copia ridimensionata:
+    None se non è mai stata generata, mai l'originale al suo posto.
+    """
+    branding = st.session_state.get('branding_settings')
+    if branding is None or branding.empty:
+        return None
+    column = LOGO_VARIANTS.get(variant) if variant else 'logo'
+    if column not in branding.columns:
+        return None
+    logo = branding[column].iloc[0]
+    return None if logo is None or pd.isna(logo) else logo
+
+def get_branding_settings(variant=None):
+    """Recupera (logo, messaggio di benvenuto) dalla sessione, senza interrogare il database a ogni rerun"""
+    branding = st.session_state.get('branding_settings')
+    if branding is None or branding.empty:
+        return None, None
+    return get_logo(variant), branding['welcome_message'].iloc[0]
+
+def get_icone(links):
+    """Restituisce {id link: icona} per un DataFrame di custom_links"""
+    if links.empty:
+        return {}
+    return dict(zip(links['id'], links['icona']))
 
 def add_libro_disponibile(nome):
     """Aggiunge un nuovo libro alla lista dei libri disponibili"""
-    conn = sqlite3.connect('data.db')
-    c = conn.cursor()
-    try:
-        c.execute("INSERT INTO libri_disponibili (nome) VALUES (?)", (nome,))
-        conn.commit()
-        return True
-    except sqlite3.IntegrityError:
-        # Il libro esiste già
-        return False
-    finally:
-        conn.close()
+    with _connection() as conn:
+        try:
+            conn.execute("INSERT INTO libri_disponibili (nome) VALUES (?)", (nome,))
+            conn.commit()
+        except sqlite3.IntegrityError:
+            # Il libro esiste già
+            return False
+    _invalidate('libri_disponibili')
+    return True
 
 def get_libri_disponibili():
     """Recupera la lista dei libri disponibili"""
-    conn = sqlite3.connect('data.db')
-    libri = []
-    try:
-        c = conn.cursor()
-        c.execute("SELECT nome FROM libri_disponibili ORDER BY nome")
-        libri = [row[0] for row in c.fetchall()]
-    finally:
-        conn.close()
-    return libri
+    with _connection() as conn:
+        rows = conn.execute("SELECT nome FROM libri_disponibili ORDER BY nome").fetchall()
+    return [row[0] for row in rows]
 
 def delete_libro_disponibile(nome):
     """Elimina un libro dalla lista dei libri disponibili"""
-    conn = sqlite3.connect('data.db')
-    c = conn.cursor()
-    c.execute("DELETE FROM libri_disponibili WHERE nome = ?", (nome,))
-    conn.commit()
-    conn.close()
+    with _connection() as conn:
+        conn.execute("DELETE FROM libri_disponibili WHERE nome = ?", (nome,))
+        conn.commit()
+    _invalidate('libri_disponibili')
     
-def delete_pagamento(id):
-    """Elimina un pagamento dal database"""
-    conn = sqlite3.connect('data.db')
-    c = conn.cursor()
-    c.execute("DELETE FROM pagamenti WHERE id = ?", (id,))
-    conn.commit()
-    conn.close()
+def delete_pagamento(id, in_background=False):
+    """Elimina un pagamento dal database (in_background non serve: la scrittura è locale)"""
+    with _connection() as conn:
+        conn.execute("DELETE FROM pagamenti WHERE id = ?", (id,))
+        conn.commit()
+    _invalidate('pagamenti')
     load_data()
     
-def delete_progresso(id):
-    """Elimina un progresso dal database"""
-    conn = sqlite3.connect('data.db')
-    c = conn.cursor()
-    c.execute("DELETE FROM progressi WHERE id = ?", (id,))
-    conn.commit()
-    conn.close()
-    load_data()
\ No newline at end of file
+def delete_progresso(id, in_background=False):
+    """Elimina un progresso dal database (in_background non serve: la scrittura è locale)"""
+    with _connection() as conn:
+        conn.execute("DELETE FROM progressi WHERE id = ?", (id,))
+        conn.commit()
+    _invalidate('progressi')
+    load_data()
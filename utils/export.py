@@ -0,0 +1,128 @@
+import tempfile
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+import pyarrow.parquet as pq
+
+from utils import backend
+
+# Byte tenuti in memoria prima che il file di export passi su disco
+SPOOL_MAX_SIZE = 8 * 1024 * 1024
+
+# Formati di export: estensione e tipo MIME del download
+EXPORT_FORMATS = {
+    'CSV': ('csv', 'text/csv'),
+    'Parquet': ('parquet', 'application/vnd.apache.parquet'),
+}
+
+# Tipi delle colonne esportate. Le colonne con pochi valori ripetuti (canale,
+# livello, mese) sono dizionari: in Parquet occupano una frazione dello spazio
+CATEGORY = pa.dictionary(pa.int32(), pa.string())
+
+STUDENTI_SCHEMA = pa.schema([
+    ('id', pa.string()),
+    ('nome', pa.string()),
+    ('cognome', pa.string()),
+    ('canale', CATEGORY),
+    ('livello', CATEGORY),
+    ('metodologia', pa.string()),
+    ('durata_lezione', pa.int64()),
+    ('prezzo_lezione', pa.float64()),
+    ('commenti', pa.string()),
+    ('data_iscrizione', pa.date32()),
+    ('slides_url', pa.string()),
+    ('classroom_url', pa.string()),
+    ('meet_url', pa.string()),
+])
+
+STORICO_SCHEMA = pa.schema([
+    ('Studente', pa.string()),
+    ('Data', pa.date32()),
+    ('Mese', CATEGORY),
+    ('Anno', pa.int64()),
+    ('Importo', pa.float64()),
+    ('Note', pa.string()),
+])
+
+
+def _to_arrow(chunk, schema):
+    """Convert a DataFrame chunk to an Arrow table with the export schema"""
+    chunk = chunk.reindex(columns=schema.names)
+    for field in schema:
+        column = chunk[field.name]
+        if pa.types.is_date(field.type):
+            # Le date arrivano come testo ISO, con o senza orario
+            chunk[field.name] = pd.to_datetime(column, format='ISO8601', errors='coerce').dt.tz_localize(None)
+        elif pa.types.is_integer(field.type):
+            chunk[field.name] = pd.to_numeric(column, errors='coerce').astype('Int64')
+        elif pa.types.is_floating(field.type):
+            chunk[field.name] = pd.to_numeric(column, errors='coerce').astype(float)
+        else:
+            chunk[field.name] = column.astype(object).where(column.notna(), None).map(
+                lambda value: value if value is None else str(value))
+    return pa.Table.from_pandas(chunk, schema=schema, preserve_index=False)
+
+def write_export(chunks, schema, export_format='CSV'):
+    """Write DataFrame chunks to a CSV or zstd-compressed Parquet file and return its bytes.
+
+    Chunks are converted and written one at a time into a spooled temporary
+    file (on disk past SPOOL_MAX_SIZE), so the rows are never all in memory as
+    a DataFrame. The finished file is returned whole, and st.download_button
+    keeps its own copy: the export itself is held in memory.
+    """
+    with tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE) as file:
+        if export_format == 'Parquet':
+            writer = pq.ParquetWriter(file, schema, compression='zstd')
+        else:
+            writer = pa_csv.CSVWriter(file, schema, write_options=pa_csv.WriteOptions(quoting_style='needed'))
+        with writer:
+            for chunk in chunks:
+                if not chunk.empty:
+                    writer.write_table(_to_arrow(chunk, schema))
+        file.seek(0)
+        return file.read()
+
+def _filters(**filters):
+    """Drop the filters left empty (None, "Tutti" or an empty selection)"""
+    # I valori numpy (es. l'anno scelto dalla selectbox) diventano tipi Python
+    return {column: value.item() if hasattr(value, 'item') else value
+            for column, value in filters.items()
+            if value is not None and value != "Tutti" and not (isinstance(value, list) and not value)}
+
+def export_studenti(export_format='CSV', canale=None, livello=None, ids=None):
+    """Export the students matching the list filters, streamed from the backend.
+
+    ids restricts the export to the given students (the search results):
+    an empty list exports no rows, None exports every student.
+    """
+    filters = _filters(canale=canale, livello=livello)
+    if ids is not None:
+        filters['id'] = list(ids)
+    chunks = backend.iter_table('studenti', filters=filters) if ids is None or len(ids) else []
+    return write_export(chunks, STUDENTI_SCHEMA, export_format)
+
+def _storico_chunks(chunks, studenti):
+    """Add the student name to payment chunks and rename the columns as in the history table"""
+    nomi = (studenti['nome'] + ' ' + studenti['cognome']).set_axis(studenti['id'])
+    for chunk in chunks:
+        yield pd.DataFrame({
+            'Studente': chunk['studente_id'].map(nomi),
+            'Data': chunk['data'],
+            'Mese': chunk['mese'],
+            'Anno': chunk['anno'],
+            'Importo': chunk['importo'],
+            'Note': chunk['commenti'],
+        })
+
+def export_storico_pagamenti(studenti, export_format='CSV', studente_id=None, anno=None, mese=None):
+    """Export the payment history matching the page filters, streamed from the backend.
+
+    Rows come out in insertion (id) order, the order the backend pages on.
+    """
+    chunks = backend.iter_table(
+        'pagamenti',
+        columns='id,studente_id,data,importo,mese,anno,commenti',
+        filters=_filters(studente_id=studente_id, anno=anno, mese=mese),
+    )
+    return write_export(_storico_chunks(chunks, studenti), STORICO_SCHEMA, export_format)
@@ -2,6 +2,16 @@ import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
 
+MESI = ["Gennaio", "Febbraio", "Marzo", "Aprile", "Maggio", "Giugno",
+        "Luglio", "Agosto", "Settembre", "Ottobre", "Novembre", "Dicembre"]
+
+# Colonne delle statistiche sui pagamenti, come restituite dai backend
+STATISTICHE_PAGAMENTI_COLUMNS = {
+    'mensili': ['anno', 'mese', 'totale', 'n_pagamenti'],
+    'canali': ['anno', 'mese', 'canale', 'totale', 'n_pagamenti'],
+    'studenti': ['studente_id', 'nome', 'cognome', 'totale', 'media', 'n_pagamenti'],
+}
+
 def create_monthly_stats(df):
     """Crea statistiche mensili dai dati degli studenti"""
     df['data_iscrizione'] = pd.to_datetime(df['data_iscrizione'])
@@ -40,3 +50,51 @@ def filter_dataframe(df, filters):
                 filtered_df = filtered_df[filtered_df[column] == value]
     
     return filtered_df
+
+def pagina_dataframe(df, ordina_per, crescente, pagina, righe_per_pagina):
+    """Ordina un DataFrame e ne restituisce una pagina (numerate da 1).
+
+    Con ordina_per=None le righe restano nell'ordine ricevuto (es. per pertinenza).
+    """
+    # Il testo si ordina senza distinguere maiuscole e minuscole
+    ordinati = df if ordina_per is None else df.sort_values(
+        ordina_per, ascending=crescente, na_position='last', kind='stable',
+        key=lambda colonna: colonna.str.lower() if colonna.dtype == object else colonna
+    )
+    inizio = (pagina - 1) * righe_per_pagina
+    return ordinati.iloc[inizio:inizio + righe_per_pagina]
+
+def formatta_data(valore):
+    """Formatta una data (Timestamp, date o testo ISO) come gg/mm/aaaa, vuota se mancante"""
+    data = pd.to_datetime(valore, errors='coerce')
+    return '' if pd.isna(data) else data.strftime('%d/%m/%Y')
+
+def ordina_per_mese(df):
+    """Ordina per anno e mese di calendario (non in ordine alfabetico)"""
+    # Da categoria a testo: una categoria mappata si ordinerebbe per nome del mese
+    numero_mese = df['mese'].astype(object).map({mese: numero for numero, mese in enumerate(MESI)})
+    return df.assign(_numero_mese=numero_mese).sort_values(['anno', '_numero_mese'])\
+             .drop(columns='_numero_mese').reset_index(drop=True)
+
+def aggrega_pagamenti(pagamenti, studenti, vista):
+    """Calcola in pandas le statistiche dei pagamenti, se il database non le fornisce"""
+    if vista == 'mensili':
+        # observed=True: mese e canale sono categorie, e con il default di pandas 2 (observed=False)
+        # ogni combinazione senza pagamenti diventerebbe una riga a zero
+        stats = pagamenti.groupby(['anno', 'mese'], observed=True)['importo']\
+                         .agg(totale='sum', n_pagamenti='count').reset_index()
+    elif vista == 'canali':
+        stats = pd.merge(pagamenti, studenti[['id', 'canale']], left_on='studente_id', right_on='id')\
+                  .groupby(['anno', 'mese', 'canale'], observed=True)['importo']\
+                  .agg(totale='sum', n_pagamenti='count').reset_index()
+    else:
+        stats = pd.merge(
+            pagamenti.groupby('studente_id')['importo'].agg(totale='sum', media='mean', n_pagamenti='count').reset_index(),
+            studenti[['id', 'nome', 'cognome']],
+            left_on='studente_id',
+            right_on='id'
+        )
+    stats = stats.reindex(columns=STATISTICHE_PAGAMENTI_COLUMNS[vista])
+    # Mese e canale come testo, come le statistiche calcolate dal database
+    return stats.astype({colonna: object for colonna, tipo in stats.dtypes.items()
+                         if isinstance(tipo, pd.CategoricalDtype)})
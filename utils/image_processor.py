@@ -1,7 +1,11 @@
+import base64
 import io
 from PIL import Image
 import streamlit as st
 
+# Larghezze (px) delle varianti del logo: 160 per .logo-container, 320 per schermi HiDPI
+LOGO_VARIANT_WIDTHS = (160, 320)
+
 def process_upload_image(uploaded_file, keep_original=False, max_file_size=50*1024*1024):
     """
     Process uploaded image with comprehensive error handling
@@ -63,4 +67,34 @@ def process_upload_image(uploaded_file, keep_original=False, max_file_size=50*10
     except Exception as e:
         error_msg = f"Errore nel processare l'immagine: {str(e)}"
         st.error(error_msg)
-        return None, error_msg
\ No newline at end of file
+        return None, error_msg
+
+def create_logo_variants(image_bytes, widths=LOGO_VARIANT_WIDTHS):
+    """
+    Create display-sized PNG copies of the logo, one per width
+    Images narrower than a width are kept at their size (never upscaled)
+    The logo may be bytes or base64 text (as returned by Supabase); without a
+    logo, or if it is not a readable image, no variants are created
+    """
+    if not image_bytes:
+        return {}
+    try:
+        if isinstance(image_bytes, str):
+            image_bytes = base64.b64decode(image_bytes)
+        image = Image.open(io.BytesIO(image_bytes))
+        image.load()
+    except (OSError, ValueError):
+        return {}
+    if image.mode not in ('RGBA', 'RGB'):
+        image = image.convert('RGBA')
+
+    variants = {}
+    for width in widths:
+        resized = image
+        if image.width > width:
+            height = max(1, round(image.height * width / image.width))
+            resized = image.resize((width, height), Image.Resampling.LANCZOS)
+        output = io.BytesIO()
+        resized.save(output, format='PNG', optimize=True)
+        variants[width] = output.getvalue()
+    return variants
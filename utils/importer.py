@@ -0,0 +1,199 @@
+import hashlib
+import importlib.util
+import io
+
+import pandas as pd
+import streamlit as st
+
+from utils import backend
+from utils.helpers import MESI
+
+# Righe inserite con una sola richiesta (o transazione) durante l'importazione
+IMPORT_CHUNK_SIZE = 500
+
+CANALI = ["Diretto", "Apprentus", "Preply", "iTalki"]
+LIVELLI = ["A1", "A2", "B1", "B2", "C1", "C2"]
+
+# Durata in minuti delle lezioni senza durata nel file, come nel modulo di pages/1_studenti.py
+DURATA_LEZIONE_DEFAULT = 30
+
+# Colonne dei file da importare, per tabella. Pagamenti e progressi indicano lo
+# studente come "Nome Cognome" (colonna studente) oppure con la colonna studente_id
+IMPORT_COLUMNS = {
+    'studenti': {
+        'required': ['nome', 'cognome', 'canale', 'livello', 'prezzo_lezione', 'data_iscrizione'],
+        'optional': ['metodologia', 'durata_lezione', 'commenti', 'slides_url', 'classroom_url', 'meet_url'],
+    },
+    'pagamenti': {
+        'required': ['studente', 'data', 'importo', 'mese', 'anno'],
+        'optional': ['commenti'],
+    },
+    'progressi': {
+        'required': ['studente', 'data', 'descrizione'],
+        'optional': ['contenuto'],
+    },
+}
+
+# Estensioni dei fogli di calcolo e pacchetto con cui pandas le legge
+EXCEL_READERS = {'xlsx': 'openpyxl', 'xls': 'xlrd'}
+
+# Tipi di file accettati: i formati Excel solo se il loro lettore è installato
+IMPORT_FILE_TYPES = ['csv', *(extension for extension, package in EXCEL_READERS.items()
+                              if importlib.util.find_spec(package) is not None)]
+
+
+def read_import_file(uploaded_file):
+    """Read an uploaded CSV or Excel file as text columns with normalized names"""
+    extension = uploaded_file.name.lower().rsplit('.', 1)[-1]
+    if extension in EXCEL_READERS:
+        try:
+            df = pd.read_excel(uploaded_file, dtype=str)
+        except ImportError:
+            raise ValueError(f"Per importare file .{extension} installa il pacchetto "
+                             f"{EXCEL_READERS[extension]}, oppure usa un CSV")
+    else:
+        df = pd.read_csv(uploaded_file, dtype=str, sep=None, engine='python')
+    df.columns = [str(column).strip().lower().replace(' ', '_') for column in df.columns]
+    # Celle vuote o fatte di soli spazi valgono come mancanti
+    return df.apply(lambda column: column.str.strip()).replace('', None)
+
+def file_checksum(uploaded_file):
+    """Return a checksum of the uploaded file, used to resume an interrupted import"""
+    return hashlib.sha1(uploaded_file.getvalue()).hexdigest()
+
+def _errors(mask, message):
+    """Return an errors DataFrame with the file row numbers where mask is True"""
+    # +2: riga dell'intestazione e numerazione da 1, come nel foglio di calcolo
+    return pd.DataFrame({'riga': mask.index[mask] + 2, 'errore': message})
+
+def _parse_dates(values):
+    """Parse dates written as ISO (2025-03-01) or in the Italian format (01/03/2025)"""
+    iso = pd.to_datetime(values, format='ISO8601', errors='coerce')
+    italian = pd.to_datetime(values.where(iso.isna()), format='%d/%m/%Y', errors='coerce')
+    return iso.fillna(italian)
+
+def _lookup(keys, index, ids):
+    """Map keys to ids keeping their original type (a numeric map would turn them into floats)"""
+    return keys.map(pd.Series(ids.astype(object).values, index=index))
+
+def _resolve_studenti(df, studenti):
+    """Return the studente_id of every row, from studente_id or from "Nome Cognome" """
+    if 'studente_id' in df.columns:
+        # Gli id del file sono testo: si riportano al tipo degli id in sessione
+        return _lookup(df['studente_id'], studenti['id'].astype(str), studenti['id'])
+    nomi = (studenti['nome'].str.strip() + ' ' + studenti['cognome'].str.strip()).str.lower()
+    # Un nome ripetuto non identifica uno studente: resta senza corrispondenza
+    univoci = studenti.assign(chiave=nomi)[~nomi.duplicated(keep=False)]
+    return _lookup(df['studente'].str.lower().str.split().str.join(' '), univoci['chiave'], univoci['id'])
+
+def validate_import(table_name, df):
+    """Check a file against IMPORT_COLUMNS with vectorized pandas checks.
+
+    Returns the rows ready for bulk_insert (original index preserved, so errors
+    can point to the file rows) and a DataFrame of errors (riga, errore).
+    """
+    spec = IMPORT_COLUMNS[table_name]
+    required = list(spec['required'])
+    if table_name != 'studenti' and 'studente_id' in df.columns:
+        required[required.index('studente')] = 'studente_id'
+    missing = [column for column in required if column not in df.columns]
+    if missing:
+        return pd.DataFrame(), pd.DataFrame({'riga': [1], 'errore': [f"Colonne mancanti: {', '.join(missing)}"]})
+
+    errors = [_errors(df[column].isna(), f"Valore mancante in {column}") for column in required]
+    rows = pd.DataFrame(index=df.index)
+    for column in spec['optional']:
+        rows[column] = df[column] if column in df.columns else None
+
+    if table_name == 'studenti':
+        rows[['nome', 'cognome']] = df[['nome', 'cognome']]
+        rows['canale'] = df['canale']
+        rows['livello'] = df['livello'].str.upper()
+        rows['prezzo_lezione'] = pd.to_numeric(df['prezzo_lezione'].str.replace(',', '.'), errors='coerce').astype(float)
+        durata = pd.to_numeric(rows['durata_lezione'], errors='coerce')
+        rows['durata_lezione'] = durata.fillna(DURATA_LEZIONE_DEFAULT).round().astype('Int64')
+        data = _parse_dates(df['data_iscrizione'])
+        rows['data_iscrizione'] = data.dt.strftime('%Y-%m-%d')
+        errors += [
+            _errors(df['canale'].notna() & ~df['canale'].isin(CANALI), f"Canale non valido (ammessi: {', '.join(CANALI)})"),
+            _errors(df['livello'].notna() & ~rows['livello'].isin(LIVELLI), f"Livello non valido (ammessi: {', '.join(LIVELLI)})"),
+            _errors(df['prezzo_lezione'].notna() & ~(rows['prezzo_lezione'] >= 0), "Prezzo lezione non valido"),
+            _errors(df.get('durata_lezione', pd.Series(index=df.index)).notna() & ~(durata > 0),
+                    "Durata lezione non valida (minuti)"),
+            _errors(df['data_iscrizione'].notna() & data.isna(), "Data di iscrizione non valida"),
+        ]
+    else:
+        studenti = st.session_state.get('studenti', pd.DataFrame(columns=['id', 'nome', 'cognome']))
+        rows['studente_id'] = _resolve_studenti(df, studenti)
+        reference = df['studente_id'] if 'studente_id' in df.columns else df['studente']
+        errors.append(_errors(reference.notna() & rows['studente_id'].isna(), "Studente non trovato (o nome non univoco)"))
+        data = _parse_dates(df['data'])
+        rows['data'] = data.dt.strftime('%Y-%m-%d')
+        errors.append(_errors(df['data'].notna() & data.isna(), "Data non valida"))
+
+    if table_name == 'pagamenti':
+        rows['importo'] = pd.to_numeric(df['importo'].str.replace(',', '.'), errors='coerce').astype(float)
+        rows['mese'] = df['mese'].str.capitalize()
+        rows['anno'] = pd.to_numeric(df['anno'], errors='coerce').astype('Int64')
+        errors += [
+            _errors(df['importo'].notna() & ~(rows['importo'] > 0), "Importo non valido"),
+            _errors(df['mese'].notna() & ~rows['mese'].isin(MESI), "Mese non valido"),
+            _errors(df['anno'].notna() & rows['anno'].isna(), "Anno non valido"),
+        ]
+    elif table_name == 'progressi':
+        libreria = st.session_state.get('libreria', pd.DataFrame(columns=['id', 'titolo']))
+        titoli = libreria.drop_duplicates('titolo', keep=False)
+        rows['descrizione'] = df['descrizione']
+        rows['contenuto_id'] = _lookup(rows.pop('contenuto'), titoli['titolo'], titoli['id'])
+        errors.append(_errors(df.get('contenuto', pd.Series(index=df.index)).notna() & rows['contenuto_id'].isna(),
+                              "Contenuto non trovato in libreria"))
+
+    errors = pd.concat(errors, ignore_index=True).sort_values('riga', kind='stable')
+    valid = rows.drop(index=errors['riga'] - 2)
+    return valid, errors.reset_index(drop=True)
+
+def _records(rows):
+    """Convert a DataFrame to JSON-friendly dicts (None for missing values)"""
+    rows = rows.astype(object)
+    return rows.where(rows.notna(), None).to_dict('records')
+
+def imported_rows(checkpoint_key):
+    """Return the file rows (index of the validated rows) already imported under checkpoint_key"""
+    return st.session_state.get('import_checkpoints', {}).get(checkpoint_key, set())
+
+def run_import(table_name, rows, checkpoint_key, chunk_size=IMPORT_CHUNK_SIZE):
+    """Insert rows in chunks with a progress bar, skipping the rows already imported.
+
+    Every chunk is one request (or one transaction), and the checkpoint in
+    session_state records the file rows of each committed chunk. Rows are
+    identified by their index in the file, so a retry after a failure neither
+    skips nor repeats rows even if validation now accepts a different set.
+    The data is reloaded once, at the end. Returns True if every row is in.
+    """
+    done = st.session_state.setdefault('import_checkpoints', {}).setdefault(checkpoint_key, set())
+    total = len(rows)
+    pending = rows[~rows.index.isin(done)]
+    imported = total - len(pending)
+    progress = st.progress(imported / total if total else 1.0, text=f"Importate {imported} righe su {total}")
+
+    for offset in range(0, len(pending), chunk_size):
+        chunk = pending.iloc[offset:offset + chunk_size]
+        try:
+            backend.bulk_insert(table_name, _records(chunk))
+        except Exception as e:
+            st.error(f"🌧️ Piove ❌ Importazione interrotta alla riga {chunk.index[0] + 2} del file: {str(e)}. "
+                     "Importa di nuovo lo stesso file per riprendere da qui.")
+            return False
+        done.update(chunk.index)
+        imported += len(chunk)
+        progress.progress(imported / total, text=f"Importate {imported} righe su {total}")
+
+    backend.load_data()
+    return True
+
+def import_template(table_name):
+    """Return an empty CSV with the columns expected for table_name"""
+    spec = IMPORT_COLUMNS[table_name]
+    buffer = io.StringIO()
+    pd.DataFrame(columns=spec['required'] + spec['optional']).to_csv(buffer, index=False)
+    return buffer.getvalue()
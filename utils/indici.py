@@ -0,0 +1,184 @@
+import bisect
+import itertools
+import math
+import re
+import threading
+import unicodedata
+import weakref
+from collections import Counter, defaultdict
+
+# Indici già costruiti, per DataFrame e tipo di indice. I DataFrame in sessione
+# non vengono mai modificati sul posto (ogni scrittura ne crea uno nuovo, vedi
+# utils/table_cache.py): lo stesso oggetto ha sempre gli stessi dati, quindi
+# l'identità fa da versione e un indice vale finché il DataFrame esiste.
+# Le sessioni che leggono la stessa versione dalla cache condividono gli indici.
+_indici = {}
+_lock = threading.Lock()
+
+
+def _memo(df, name, build):
+    """Return build(df), computed once per DataFrame object and index name"""
+    key = (id(df), name)
+    with _lock:
+        entry = _indici.get(key)
+    if entry is not None and entry[0]() is df:
+        return entry[1]
+    value = build(df)
+    with _lock:
+        _indici[key] = (weakref.ref(df), value)
+    # Quando il DataFrame viene liberato il suo id può essere riusato: l'indice va tolto
+    weakref.finalize(df, _forget, key)
+    return value
+
+def _forget(key):
+    """Drop an index whose DataFrame no longer exists"""
+    with _lock:
+        _indici.pop(key, None)
+
+def etichette(df, formato):
+    """Return {id: label} with labels built from a str.format template over the row columns.
+
+    Meant for selectbox format_func: `format_func=etichette(studenti, "{nome} {cognome}").get`
+    renders every option with one dict lookup instead of a scan of the DataFrame.
+    """
+    return _memo(df, f"etichette:{formato}",
+                 lambda df: dict(zip(df['id'], (formato.format(**record) for record in df.to_dict('records')))))
+
+def record_per_id(df):
+    """Return {id: row as a dict}"""
+    return _memo(df, "record", lambda df: dict(zip(df['id'], df.to_dict('records'))))
+
+def _gruppi_per_studente(df):
+    """Split df by studente_id, each group sorted by date, most recent first"""
+    if df.empty or 'studente_id' not in df.columns:
+        return {}
+    ordinati = df.sort_values('data', ascending=False, kind='stable')
+    return dict(tuple(ordinati.groupby('studente_id', sort=False)))
+
+def righe_studente(df, studente_id):
+    """Return the rows of df (progressi or pagamenti) of a student, most recent first.
+
+    The grouping is built once per DataFrame, so rendering every student of
+    the list is one dict lookup each instead of a full filter and sort.
+    """
+    return _memo(df, "per_studente", _gruppi_per_studente).get(studente_id, df.iloc[0:0])
+
+# Colonne della libreria in cui si cerca, con il loro peso nel punteggio
+# (lo stesso ordine di importanza dei backend: titolo prima della descrizione)
+COLONNE_RICERCA_LIBRERIA = {'titolo': 2.0, 'descrizione': 1.0}
+
+def parole(testo):
+    """Split text into lowercase words without accents ("Perché" -> ["perche"])"""
+    testo = unicodedata.normalize('NFKD', str(testo).casefold())
+    testo = ''.join(carattere for carattere in testo if not unicodedata.combining(carattere))
+    return re.findall(r'[^\W_]+', testo)
+
+def _indice_testo(df, colonne):
+    """Build the inverted index of df: sorted words, {word: {id: weighted count}} and row count"""
+    occorrenze = defaultdict(lambda: defaultdict(float))
+    for colonna, peso in colonne.items():
+        for id, valore in zip(df['id'].tolist(), df[colonna]):
+            # Le descrizioni mancanti arrivano come None o NaN
+            if isinstance(valore, str):
+                for parola in parole(valore):
+                    occorrenze[parola][id] += peso
+    return sorted(occorrenze), {parola: dict(ids) for parola, ids in occorrenze.items()}, len(df)
+
+def cerca_testo(df, query, colonne):
+    """Return the ids of the rows of df containing every word of query, best match first.
+
+    Every query word also matches the longer words it starts ("gramm" finds
+    "grammatica"). Case and accents are ignored. Rows are ranked by tf-idf over
+    the weighted columns. The index is built once per DataFrame.
+    """
+    termini, occorrenze, n_righe = _memo(df, f"testo:{sorted(colonne.items())}",
+                                         lambda df: _indice_testo(df, colonne))
+    punteggi = None
+    for parola in parole(query):
+        trovati = defaultdict(float)
+        # Le parole che iniziano con parola sono contigue nella lista ordinata
+        for termine in itertools.takewhile(lambda termine: termine.startswith(parola),
+                                           termini[bisect.bisect_left(termini, parola):]):
+            idf = math.log(1 + n_righe / len(occorrenze[termine]))
+            for id, conteggio in occorrenze[termine].items():
+                trovati[id] += conteggio * idf
+        punteggi = trovati if punteggi is None else {
+            id: punteggio + trovati[id] for id, punteggio in punteggi.items() if id in trovati}
+    return sorted(punteggi, key=punteggi.get, reverse=True) if punteggi else []
+
+# Somiglianza minima tra ricerca e studente (trigrammi in comune sui trigrammi
+# della ricerca), come la soglia predefinita di pg_trgm
+SOGLIA_TRIGRAMMI = 0.3
+
+# Colonne degli studenti in cui cerca cerca_studenti
+COLONNE_RICERCA_STUDENTI = ('nome', 'cognome', 'commenti')
+
+def trigrammi(testo):
+    """Return the trigrams of the words of text, padded like pg_trgm ("  m", " ma", ..., "io ")"""
+    return {f"  {parola} "[i:i + 3] for parola in parole(testo) for i in range(len(parola) + 1)}
+
+
+class IndiceTrigrammi:
+    """Trigram index of one text per id, updated only for the rows that change"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.sorgente = None
+        self._testi = {}
+        self._trigrammi = {}
+        self._righe = defaultdict(set)
+
+    def aggiorna(self, testi):
+        """Make the index hold exactly testi ({id: text}), reindexing new and changed rows only"""
+        for id in self._testi.keys() - testi.keys():
+            self._rimuovi(id)
+        for id, testo in testi.items():
+            if self._testi.get(id) != testo:
+                self._rimuovi(id)
+                self._testi[id] = testo
+                self._trigrammi[id] = trigrammi(testo)
+                for trigramma in self._trigrammi[id]:
+                    self._righe[trigramma].add(id)
+
+    def _rimuovi(self, id):
+        """Drop the row id from the index"""
+        self._testi.pop(id, None)
+        for trigramma in self._trigrammi.pop(id, ()):
+            self._righe[trigramma].discard(id)
+            if not self._righe[trigramma]:
+                del self._righe[trigramma]
+
+    def cerca(self, query, soglia=SOGLIA_TRIGRAMMI):
+        """Return the ids similar to query, most similar first.
+
+        Ranked by the share of query trigrams found in the row, then by how
+        much of the row the query covers (shorter texts first on a tie).
+        """
+        trigrammi_query = trigrammi(query)
+        if not trigrammi_query:
+            return []
+        in_comune = Counter(id for trigramma in trigrammi_query for id in self._righe.get(trigramma, ()))
+        punteggi = {}
+        for id, n in in_comune.items():
+            if n / len(trigrammi_query) >= soglia:
+                punteggi[id] = (n / len(trigrammi_query), n / len(self._trigrammi[id] | trigrammi_query))
+        return sorted(punteggi, key=punteggi.get, reverse=True)
+
+_trigrammi_studenti = IndiceTrigrammi()
+
+def cerca_studenti(df, query):
+    """Return the ids of the students of df whose name, surname or notes look like query, best first.
+
+    Typos are tolerated ("mraio" finds "Mario"). One trigram index is shared
+    by the process: when df is a new version of the students, only the
+    added, changed and removed students are reindexed.
+    """
+    indice = _trigrammi_studenti
+    with indice.lock:
+        if indice.sorgente is None or indice.sorgente() is not df:
+            testo = df[COLONNE_RICERCA_STUDENTI[0]].fillna('').astype(str)
+            for colonna in COLONNE_RICERCA_STUDENTI[1:]:
+                testo = testo + ' ' + df[colonna].fillna('').astype(str)
+            indice.aggiorna(dict(zip(df['id'].tolist(), testo)))
+            indice.sorgente = weakref.ref(df)
+        return indice.cerca(query)
@@ -0,0 +1,614 @@
+import base64
+import json
+import os
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+import pandas as pd
+import streamlit as st
+
+from utils import supabase_db
+from utils import database
+from utils.database import create_schema
+from utils.sqlite_pool import get_pool
+from utils.supabase_client import get_client_stats
+from utils.table_cache import get_table_cache
+from utils.table_types import compact, record_loaded_size
+
+# File della replica locale di Supabase
+REPLICA_PATH = os.environ.get("REPLICA_DB_PATH", "replica.db")
+
+# Secondi tra due sincronizzazioni in background (una scrittura locale la anticipa)
+SYNC_INTERVAL = float(os.environ.get("REPLICA_SYNC_INTERVAL", 30))
+
+# Tentativi di invio di una scrittura prima di lasciarla in errore
+MAX_ATTEMPTS = 5
+
+# Prefisso degli id assegnati in locale, sostituiti da quelli di Supabase all'invio
+LOCAL_ID_PREFIX = 'local-'
+
+# La replica accetta gli id di Supabase così come sono (interi o UUID)
+REPLICA_ID_COLUMN = 'id PRIMARY KEY'
+
+# Tabelle sincronizzate per id, in ordine: prima quelle referenziate dalle altre
+SYNCED_TABLES = (
+    'studenti', 'libreria', 'custom_links', 'branding_settings',
+    'giorni_lezione', 'progressi', 'pagamenti',
+)
+
+# Colonne che puntano all'id di un'altra tabella, da aggiornare quando un id locale diventa definitivo
+REFERENCES = {
+    'studenti': [('giorni_lezione', 'studente_id'), ('progressi', 'studente_id'), ('pagamenti', 'studente_id')],
+    'libreria': [('progressi', 'contenuto_id')],
+}
+
+# Riferimenti che all'eliminazione diventano NULL (ON DELETE SET NULL); gli altri sono a cascata
+SET_NULL_REFERENCES = {('progressi', 'contenuto_id')}
+
+REPLICA_DDL = (
+    # Scritture locali in attesa di essere inviate a Supabase, nell'ordine in cui sono avvenute
+    '''CREATE TABLE IF NOT EXISTS replica_outbox
+       (seq INTEGER PRIMARY KEY,
+        tabella TEXT NOT NULL,
+        operazione TEXT NOT NULL,
+        chiave,
+        dati TEXT,
+        tentativi INTEGER NOT NULL DEFAULT 0,
+        errore TEXT)''',
+    # Id provvisori già sostituiti: una sessione può usarli ancora prima di ricaricare i dati
+    '''CREATE TABLE IF NOT EXISTS replica_id_map
+       (locale TEXT PRIMARY KEY,
+        definitivo)''',
+    # Watermark della sincronizzazione (per tabella, eliminazioni, ultima sincronizzazione)
+    '''CREATE TABLE IF NOT EXISTS replica_meta
+       (chiave TEXT PRIMARY KEY,
+        valore TEXT)''',
+)
+
+
+def _dumps(data):
+    """Serialize an outbox payload, keeping bytes (the logo) as base64"""
+    def default(value):
+        if isinstance(value, bytes):
+            return {'__bytes__': base64.b64encode(value).decode()}
+        raise TypeError(f"{type(value).__name__} non serializzabile")
+    return json.dumps(data, default=default)
+
+def _loads(text):
+    """Deserialize an outbox payload written by _dumps"""
+    def object_hook(value):
+        if set(value) == {'__bytes__'}:
+            return base64.b64decode(value['__bytes__'])
+        return value
+    return json.loads(text, object_hook=object_hook) if text else None
+
+def _records(df, columns):
+    """Return the rows of df as tuples of the given columns, with NaN turned into None"""
+    df = df.reindex(columns=columns).astype(object)
+    return list(df.where(df.notna(), None).itertuples(index=False, name=None))
+
+def _push_operation(table_name, operation, key, data):
+    """Apply one outbox operation to Supabase and return the rows it wrote"""
+    client = supabase_db.supabase
+    if table_name == 'branding_settings' and operation != 'delete':
+        # Stesso salvataggio della modalità diretta, varianti del logo comprese
+        existing_id = None if str(key).startswith(LOCAL_ID_PREFIX) else key
+        return supabase_db._save_branding(data['logo'], data['welcome_message'], existing_id)
+
+    key_column = 'nome' if table_name == 'libri_disponibili' else 'id'
+    if operation == 'insert':
+        return client.table(table_name).insert(data).execute().data
+    if operation == 'update':
+        return client.table(table_name).update(data).eq(key_column, key).execute().data
+    if table_name == 'studenti':
+        # Funziona anche senza ON DELETE CASCADE sul server
+        for child_table in supabase_db.STUDENT_CHILD_TABLES:
+            client.table(child_table).delete().eq('studente_id', key).execute()
+    return client.table(table_name).delete().eq(key_column, key).execute().data
+
+def _remap_id(conn, table_name, local_id, server_id):
+    """Replace a provisional id with the one assigned by Supabase, in the rows and in the outbox"""
+    # Genitore e figli cambiano id nella stessa transazione: i vincoli si verificano al commit
+    conn.execute("PRAGMA defer_foreign_keys = ON")
+    conn.execute(f"UPDATE {table_name} SET id = ? WHERE id = ?", (server_id, local_id))
+    conn.execute("INSERT OR REPLACE INTO replica_id_map (locale, definitivo) VALUES (?, ?)", (local_id, server_id))
+    conn.execute("UPDATE replica_outbox SET chiave = ? WHERE tabella = ? AND chiave = ?",
+                 (server_id, table_name, local_id))
+    for child_table, column in REFERENCES.get(table_name, ()):
+        conn.execute(f"UPDATE {child_table} SET {column} = ? WHERE {column} = ?", (server_id, local_id))
+        conn.execute(f"""UPDATE replica_outbox SET dati = json_set(dati, '$.{column}', ?)
+                         WHERE tabella = ? AND json_extract(dati, '$.{column}') = ?""",
+                     (server_id, child_table, local_id))
+
+
+class SyncWorker:
+    """Background thread that pushes local writes to Supabase and pulls remote changes"""
+
+    def __init__(self, pool, cache, interval=SYNC_INTERVAL):
+        self.pool = pool
+        self.cache = cache
+        self.interval = interval
+        self.status = {'last_sync': None, 'last_error': None, 'pushed': 0, 'pulled': 0}
+        # Una sola sincronizzazione alla volta (thread in background o init_db)
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Start the background thread (once)"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="replica-sync", daemon=True)
+            self._thread.start()
+
+    def wake(self):
+        """Sync as soon as possible instead of waiting for the next interval"""
+        self._wake.set()
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            try:
+                self.sync()
+            except Exception as e:
+                # Offline o Supabase non raggiungibile: la replica continua a servire le letture
+                self.status['last_error'] = str(e)
+
+    def sync(self, full=False):
+        """Push the outbox, then pull the changes made on Supabase"""
+        with self._lock:
+            push_error = None
+            try:
+                self._push()
+            except Exception as e:
+                # Una scrittura rifiutata non blocca la ricezione: le righe in attesa non vengono toccate
+                push_error = e
+            changed = self._pull(full)
+            if changed:
+                self.cache.invalidate(*changed)
+            if push_error is not None:
+                raise push_error
+            self.status['last_error'] = None
+
+    def _push(self):
+        """Send the pending writes in order; stop at the first failure to keep the order"""
+        while True:
+            with self.pool.connection() as conn:
+                row = conn.execute("""SELECT seq, tabella, operazione, chiave, dati FROM replica_outbox
+                                      WHERE tentativi < ? ORDER BY seq LIMIT 1""", (MAX_ATTEMPTS,)).fetchone()
+            if row is None:
+                return
+            seq, table_name, operation, key, data = row
+
+            try:
+                rows = _push_operation(table_name, operation, key, _loads(data))
+            except Exception as e:
+                with self.pool.connection() as conn:
+                    conn.execute("UPDATE replica_outbox SET tentativi = tentativi + 1, errore = ? WHERE seq = ?",
+                                 (str(e), seq))
+                    conn.commit()
+                raise
+
+            with self.pool.connection() as conn:
+                if operation == 'insert' and rows and table_name != 'libri_disponibili':
+                    _remap_id(conn, table_name, key, rows[0]['id'])
+                conn.execute("DELETE FROM replica_outbox WHERE seq = ?", (seq,))
+                conn.commit()
+            self.cache.invalidate(table_name, *[child for child, _ in REFERENCES.get(table_name, ())])
+            self.status['pushed'] += 1
+
+    def _pull(self, full=False):
+        """Apply the rows changed on Supabase since the last sync; return the changed tables"""
+        with self.pool.connection() as conn:
+            meta = dict(conn.execute("SELECT chiave, valore FROM replica_meta").fetchall())
+
+        now = datetime.now(timezone.utc)
+        last_sync = meta.get('last_sync')
+        if full or last_sync is None or now - datetime.fromisoformat(last_sync) > supabase_db.DELTA_SYNC_MAX_AGE:
+            full = True
+            tombstones = supabase_db._init_tombstone_watermark()
+        else:
+            tombstones = meta.get(supabase_db.TOMBSTONE_TABLE)
+        # Senza tabella delle eliminazioni si ricarica tutto per rilevare le cancellazioni
+        full = full or tombstones is None
+
+        jobs = {'libri_disponibili': (supabase_db._fetch_libri_disponibili,)}
+        if not full:
+            jobs[supabase_db.TOMBSTONE_TABLE] = (supabase_db._fetch_tombstones, tombstones)
+        for table_name in SYNCED_TABLES:
+            since = None if full else meta.get(f'watermark:{table_name}')
+            jobs[table_name] = (supabase_db._fetch_table, table_name, since)
+
+        with ThreadPoolExecutor(max_workers=supabase_db.LOAD_MAX_WORKERS) as executor:
+            futures = {name: executor.submit(*job) for name, job in jobs.items()}
+        # Un errore interrompe la sincronizzazione: la replica resta coerente con l'ultima riuscita
+        results = {name: future.result() for name, future in futures.items()}
+
+        deleted = {}
+        if not full:
+            deleted, tombstones = results.pop(supabase_db.TOMBSTONE_TABLE)
+
+        changed = []
+        with self.pool.connection() as conn:
+            # Le scritture non ancora inviate hanno la precedenza sui dati remoti
+            pending = {(table_name, str(key)) for table_name, key
+                       in conn.execute("SELECT tabella, chiave FROM replica_outbox").fetchall()}
+            # Il server è la fonte di verità: i suoi dati si copiano senza ricontrollare i vincoli
+            conn.execute("PRAGMA foreign_keys = OFF")
+            try:
+                for table_name in SYNCED_TABLES:
+                    before = conn.total_changes
+                    self._apply_table(conn, table_name, results[table_name][0],
+                                      deleted.get(table_name, ()), pending, full, meta)
+                    if conn.total_changes != before:
+                        changed.append(table_name)
+
+                before = conn.total_changes
+                self._apply_libri(conn, results['libri_disponibili'], pending)
+                if conn.total_changes != before:
+                    changed.append('libri_disponibili')
+
+                meta['last_sync'] = now.isoformat()
+                meta[supabase_db.TOMBSTONE_TABLE] = tombstones
+                conn.executemany("INSERT OR REPLACE INTO replica_meta (chiave, valore) VALUES (?, ?)",
+                                 [(key, value) for key, value in meta.items() if value is not None])
+                conn.commit()
+            finally:
+                conn.execute("PRAGMA foreign_keys = ON")
+
+        self.status['last_sync'] = now
+        self.status['pulled'] += sum(len(results[table_name][0]) for table_name in SYNCED_TABLES)
+        return changed
+
+    def _apply_table(self, conn, table_name, rows, deleted_ids, pending, full, meta):
+        """Upsert the fetched rows of a table and drop the deleted ones"""
+        local_columns = [row[1] for row in conn.execute(f"PRAGMA table_info({table_name})")]
+        if not rows.empty:
+            rows = rows[~rows['id'].astype(str).map(lambda id: (table_name, id) in pending)]
+            columns = [column for column in local_columns if column in rows.columns]
+            updates = ', '.join(f"{column} = excluded.{column}" for column in columns if column != 'id')
+            # ON CONFLICT DO UPDATE e non INSERT OR REPLACE: un replace cancellerebbe i figli a cascata
+            conn.executemany(f"""INSERT INTO {table_name} ({', '.join(columns)})
+                                 VALUES ({', '.join('?' * len(columns))})
+                                 ON CONFLICT (id) DO UPDATE SET {updates}""", _records(rows, columns))
+            if 'updated_at' in rows.columns:
+                meta[f'watermark:{table_name}'] = (supabase_db._max_timestamp(rows['updated_at'])
+                                                   or meta.get(f'watermark:{table_name}'))
+
+        if full:
+            server_ids = set(rows['id'].astype(str)) if not rows.empty else set()
+            deleted_ids = {str(id) for (id,) in conn.execute(f"SELECT id FROM {table_name}").fetchall()
+                           if str(id) not in server_ids and not str(id).startswith(LOCAL_ID_PREFIX)}
+        conn.executemany(f"DELETE FROM {table_name} WHERE CAST(id AS TEXT) = ?",
+                         [(id,) for id in deleted_ids if (table_name, id) not in pending])
+
+    def _apply_libri(self, conn, libri, pending):
+        """Replace the available books with the remote set, keeping the unsent changes"""
+        local = {nome for (nome,) in conn.execute("SELECT nome FROM libri_disponibili").fetchall()}
+        conn.executemany("INSERT OR IGNORE INTO libri_disponibili (nome) VALUES (?)",
+                         [(nome,) for nome in libri - local if ('libri_disponibili', nome) not in pending])
+        conn.executemany("DELETE FROM libri_disponibili WHERE nome = ?",
+                         [(nome,) for nome in local - libri if ('libri_disponibili', nome) not in pending])
+
+    def pending(self):
+        """Return the number of writes waiting to be sent and of those given up after MAX_ATTEMPTS"""
+        with self.pool.connection() as conn:
+            return conn.execute("""SELECT COUNT(*), COALESCE(SUM(tentativi >= ?), 0)
+                                   FROM replica_outbox""", (MAX_ATTEMPTS,)).fetchone()
+
+
+@st.cache_resource
+def _get_worker():
+    """Create the replica schema and start the shared sync worker (once per process)"""
+    pool = get_pool(REPLICA_PATH)
+    with pool.connection() as conn:
+        create_schema(conn, REPLICA_ID_COLUMN)
+        for ddl in REPLICA_DDL:
+            conn.execute(ddl)
+        conn.commit()
+    worker = SyncWorker(pool, get_table_cache('replica'))
+    worker.start()
+    return worker
+
+def _connection():
+    """Borrow a connection to the local replica"""
+    return get_pool(REPLICA_PATH).connection()
+
+def get_sync_status():
+    """Return the state of the replica: last sync, last error, pushed/pulled rows and outbox size"""
+    worker = _get_worker()
+    pending, failed = worker.pending()
+    return {**worker.status, 'pending': pending, 'failed': failed}
+
+def init_db():
+    """Open the local replica, syncing it from Supabase the first time, and load the session"""
+    worker = _get_worker()
+    if worker.status['last_sync'] is None:
+        try:
+            with st.spinner("Sincronizzazione con la nuvola..."):
+                worker.sync()
+        except Exception as e:
+            worker.status['last_error'] = str(e)
+            st.warning(f"🌧️ Nuvola non raggiungibile, uso i dati locali: {str(e)}")
+
+    for table_name, columns in supabase_db.TABLE_COLUMNS.items():
+        if table_name not in st.session_state:
+            st.session_state[table_name] = pd.DataFrame(columns=columns)
+    load_data()
+
+def load_data():
+    """Load the session DataFrames from the local replica, through the shared table cache"""
+    cache = get_table_cache('replica')
+    try:
+        with cache.lock, _connection() as conn:
+            for table_name in SYNCED_TABLES:
+                snapshot = cache.get(table_name)
+                if snapshot is None:
+                    data = pd.read_sql_query(f"SELECT * FROM {table_name}", conn)
+                    record_loaded_size(table_name, data)
+                    snapshot = cache.put(table_name, compact(table_name, data))
+                st.session_state[table_name] = snapshot.data
+
+            snapshot = cache.get('libri_disponibili')
+            if snapshot is None:
+                libri = conn.execute("SELECT nome FROM libri_disponibili").fetchall()
+                snapshot = cache.put('libri_disponibili', {nome for (nome,) in libri})
+            st.session_state.libri_disponibili = snapshot.data
+    except Exception as e:
+        st.error(f"Errore nel caricamento dei dati: {str(e)}")
+
+def iter_table(table_name, columns='*', filters=None):
+    """Yield a replica table as DataFrame chunks read with an SQLite cursor"""
+    return database.iter_table(table_name, columns, filters, connection=_connection)
+
+def get_statistiche_pagamenti(vista):
+    """Return payment statistics computed with GROUP BY on the replica: 'mensili' or 'studenti'"""
+    return database.get_statistiche_pagamenti(vista, connection=_connection)
+
+def ricostruisci_pagamenti_mensili():
+    """Rebuild the monthly payments rollup of the replica from the payments"""
+    return database.ricostruisci_pagamenti_mensili(connection=_connection)
+
+def verifica_pagamenti_mensili():
+    """Return the rows where the replica monthly rollup disagrees with the payments"""
+    return database.verifica_pagamenti_mensili(connection=_connection)
+
+def cerca_risorse(query):
+    """Return the ids of the library resources matching query, from the local full-text index"""
+    return database.cerca_risorse(query, connection=_connection)
+
+def _local_id():
+    """Return a provisional id for a row created locally"""
+    return f"{LOCAL_ID_PREFIX}{uuid.uuid4()}"
+
+def _enqueue(conn, table_name, operation, key, data=None):
+    """Record a local write to be sent to Supabase"""
+    conn.execute("INSERT INTO replica_outbox (tabella, operazione, chiave, dati) VALUES (?, ?, ?, ?)",
+                 (table_name, operation, key, _dumps(data) if data is not None else None))
+
+def _resolve(conn, id):
+    """Return the Supabase id of a provisional id that has already been sent, else id itself"""
+    if not str(id).startswith(LOCAL_ID_PREFIX):
+        return id
+    row = conn.execute("SELECT definitivo FROM replica_id_map WHERE locale = ?", (id,)).fetchone()
+    return row[0] if row else id
+
+def _insert(conn, table_name, data):
+    """Insert a row with a provisional id and queue it; return the id"""
+    data = {column: _resolve(conn, value) if column in ('studente_id', 'contenuto_id') else value
+            for column, value in data.items()}
+    id = _local_id()
+    columns = ['id', *data]
+    conn.execute(f"INSERT INTO {table_name} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})",
+                 (id, *data.values()))
+    _enqueue(conn, table_name, 'insert', id, data)
+    return id
+
+def _update(conn, table_name, id, data):
+    """Update a row and queue the change"""
+    id = _resolve(conn, id)
+    assignments = ', '.join(f"{column} = ?" for column in data)
+    conn.execute(f"UPDATE {table_name} SET {assignments} WHERE id = ?", (*data.values(), id))
+    _enqueue(conn, table_name, 'update', id, data)
+
+def _delete(conn, table_name, id):
+    """Delete a row; a row never sent to Supabase just leaves the outbox"""
+    id = _resolve(conn, id)
+    conn.execute(f"DELETE FROM {table_name} WHERE id = ?", (id,))
+    if str(id).startswith(LOCAL_ID_PREFIX):
+        conn.execute("DELETE FROM replica_outbox WHERE tabella = ? AND chiave = ?", (table_name, id))
+        # Le scritture in coda dei figli seguono i vincoli del server, come le righe locali
+        for child_table, column in REFERENCES.get(table_name, ()):
+            if (child_table, column) in SET_NULL_REFERENCES:
+                conn.execute(f"""UPDATE replica_outbox SET dati = json_set(dati, '$.{column}', null)
+                                 WHERE tabella = ? AND json_extract(dati, '$.{column}') = ?""", (child_table, id))
+            else:
+                conn.execute(f"""DELETE FROM replica_outbox
+                                 WHERE tabella = ? AND json_extract(dati, '$.{column}') = ?""", (child_table, id))
+    else:
+        _enqueue(conn, table_name, 'delete', id)
+
+def _write(tables, func, error_text, success="💾 Salvato, in sincronizzazione con la nuvola ✅"):
+    """Run func(conn) in one local transaction, then refresh the session and wake the sync worker"""
+    try:
+        with _connection() as conn:
+            result = func(conn)
+            conn.commit()
+    except Exception as e:
+        st.error(f"🌧️ Piove ❌ {error_text}: {str(e)}")
+        return False
+    get_table_cache('replica').invalidate(*tables)
+    load_data()
+    _get_worker().wake()
+    if result is not False:
+        st.success(success)
+    return result is not False
+
+def bulk_insert(table_name, rows):
+    """Insert a list of rows in one local transaction and queue them; return how many were written"""
+    with _connection() as conn:
+        for row in rows:
+            _insert(conn, table_name, row)
+        conn.commit()
+    get_table_cache('replica').invalidate(table_name)
+    _get_worker().wake()
+    return len(rows)
+
+def get_icone(links):
+    """Return {link id: base64 icon}; the replica keeps icons locally"""
+    if links.empty:
+        return {}
+    return dict(zip(links['id'], links['icona']))
+
+def get_logo(variant=None):
+    """Return the logo from the local replica; a variant never generated is None, not the original"""
+    return database.get_logo(variant)
+
+def get_branding_settings(variant=None):
+    """Get (logo, welcome_message) from the local replica"""
+    return database.get_branding_settings(variant)
+
+def add_studente(nome, cognome, canale, livello, metodologia, durata_lezione, prezzo_lezione,
+                commenti, data_iscrizione, slides_url, classroom_url, meet_url, giorni_lezione=None):
+    """Add a student and its lesson days to the replica"""
+    studente_data = {
+        'nome': nome,
+        'cognome': cognome,
+        'canale': canale,
+        'livello': livello,
+        'metodologia': metodologia,
+        'durata_lezione': durata_lezione,
+        'prezzo_lezione': prezzo_lezione,
+        'commenti': commenti,
+        'data_iscrizione': data_iscrizione.isoformat(),
+        'slides_url': slides_url,
+        'classroom_url': classroom_url,
+        'meet_url': meet_url
+    }
+    # Come in modalità diretta, i campi vuoti non vengono inviati
+    studente_data = {k: v for k, v in studente_data.items() if v is not None and v != ""}
+
+    def write(conn):
+        studente_id = _insert(conn, 'studenti', studente_data)
+        for giorno in giorni_lezione or []:
+            _insert(conn, 'giorni_lezione', {'studente_id': studente_id, 'giorno': giorno})
+    return _write(('studenti', 'giorni_lezione'), write, "Errore nell'aggiunta dello studente")
+
+def update_studente(id, nome, cognome, canale, livello, durata_lezione, prezzo_lezione):
+    """Update student info in the replica"""
+    data = {
+        'nome': nome,
+        'cognome': cognome,
+        'canale': canale,
+        'livello': livello,
+        'durata_lezione': durata_lezione,
+        'prezzo_lezione': prezzo_lezione
+    }
+    return _write(('studenti',), lambda conn: _update(conn, 'studenti', id, data),
+                  "Errore nell'aggiornamento dello studente")
+
+def delete_studenti(ids):
+    """Delete students from the replica; related rows follow through ON DELETE CASCADE"""
+    def write(conn):
+        for id in ids:
+            _delete(conn, 'studenti', id)
+    return _write(('studenti', *supabase_db.STUDENT_CHILD_TABLES), write,
+                  "Errore nell'eliminazione degli studenti", "💾 Eliminati, in sincronizzazione con la nuvola ✅")
+
+def delete_studente(id):
+    """Delete a student and related records from the replica"""
+    return delete_studenti([id])
+
+def add_progresso(studente_id, data, contenuto_id, descrizione, in_background=False):
+    """Add a progress record to the replica (already pushed in background: in_background is accepted for API parity)"""
+    row = {'studente_id': studente_id, 'data': data.isoformat(), 'contenuto_id': contenuto_id,
+           'descrizione': descrizione}
+    return _write(('progressi',), lambda conn: _insert(conn, 'progressi', row),
+                  "Errore nell'aggiunta del progresso")
+
+def delete_progresso(id, in_background=False):
+    """Delete a progress record from the replica (already pushed in background: in_background is accepted for API parity)"""
+    return _write(('progressi',), lambda conn: _delete(conn, 'progressi', id),
+                  "Errore nell'eliminazione del progresso", "💾 Eliminato, in sincronizzazione con la nuvola ✅")
+
+def add_pagamento(studente_id, data, importo, mese, anno, commenti, in_background=False):
+    """Add a payment to the replica (already pushed in background: in_background is accepted for API parity)"""
+    row = {'studente_id': studente_id, 'data': data.isoformat(), 'importo': importo, 'mese': mese,
+           'anno': anno, 'commenti': commenti}
+    return _write(('pagamenti',), lambda conn: _insert(conn, 'pagamenti', row),
+                  "Errore nell'aggiunta del pagamento")
+
+def delete_pagamento(id, in_background=False):
+    """Delete a payment from the replica (already pushed in background: in_background is accepted for API parity)"""
+    return _write(('pagamenti',), lambda conn: _delete(conn, 'pagamenti', id),
+                  "Errore nell'eliminazione del pagamento", "💾 Eliminato, in sincronizzazione con la nuvola ✅")
+
+def add_risorsa(libro, titolo, url, categoria, livello, descrizione):
+    """Add a resource to the replica library"""
+    row = {'libro': libro, 'titolo': titolo, 'url': url, 'categoria': categoria, 'livello': livello,
+           'descrizione': descrizione}
+    return _write(('libreria',), lambda conn: _insert(conn, 'libreria', row),
+                  "Errore nell'aggiunta della risorsa")
+
+def delete_risorsa(id):
+    """Delete a resource from the replica library"""
+    return _write(('libreria', 'progressi'), lambda conn: _delete(conn, 'libreria', id),
+                  "Errore nell'eliminazione della risorsa", "💾 Eliminata, in sincronizzazione con la nuvola ✅")
+
+def add_custom_link(titolo, url, icona, ordine):
+    """Add a custom link to the replica"""
+    row = {'titolo': titolo, 'url': url, 'icona': icona, 'ordine': ordine}
+    return _write(('custom_links',), lambda conn: _insert(conn, 'custom_links', row),
+                  "Errore nell'aggiunta del link")
+
+def update_custom_link(id, titolo, url, icona, ordine):
+    """Update a custom link in the replica"""
+    row = {'titolo': titolo, 'url': url, 'icona': icona, 'ordine': ordine}
+    return _write(('custom_links',), lambda conn: _update(conn, 'custom_links', id, row),
+                  "Errore nell'aggiornamento del link")
+
+def delete_custom_link(id):
+    """Delete a custom link from the replica"""
+    return _write(('custom_links',), lambda conn: _delete(conn, 'custom_links', id),
+                  "Errore nell'eliminazione del link", "💾 Eliminato, in sincronizzazione con la nuvola ✅")
+
+def save_branding_settings(logo_bytes=None, welcome_message=None):
+    """Save branding settings in the replica"""
+    data = {'logo': logo_bytes, 'welcome_message': welcome_message}
+
+    # Le varianti locali non vanno in coda: Supabase le rigenera al salvataggio
+    variants = database._logo_variants(logo_bytes) or dict.fromkeys(database.LOGO_VARIANTS.values())
+
+    def write(conn):
+        row = conn.execute("SELECT id FROM branding_settings LIMIT 1").fetchone()
+        if row is None:
+            id = _insert(conn, 'branding_settings', data)
+        else:
+            id = row[0]
+            _update(conn, 'branding_settings', id, data)
+        assignments = ', '.join(f"{column} = ?" for column in variants)
+        conn.execute(f"UPDATE branding_settings SET {assignments} WHERE id = ?", (*variants.values(), id))
+    return _write(('branding_settings',), write, "Errore nel salvataggio delle impostazioni")
+
+def add_libro_disponibile(nome):
+    """Add a book to the available books list of the replica"""
+    def write(conn):
+        if conn.execute("SELECT 1 FROM libri_disponibili WHERE nome = ?", (nome,)).fetchone():
+            return False  # Book already exists
+        conn.execute("INSERT INTO libri_disponibili (nome) VALUES (?)", (nome,))
+        _enqueue(conn, 'libri_disponibili', 'insert', nome, {'nome': nome})
+    return _write(('libri_disponibili',), write, "Errore nell'aggiunta del libro")
+
+def get_libri_disponibili():
+    """Get available books from the replica"""
+    return sorted(st.session_state.get('libri_disponibili', set()))
+
+def delete_libro_disponibile(nome):
+    """Delete a book from the available books list of the replica"""
+    def write(conn):
+        conn.execute("DELETE FROM libri_disponibili WHERE nome = ?", (nome,))
+        _enqueue(conn, 'libri_disponibili', 'delete', nome)
+    return _write(('libri_disponibili',), write, "Errore nell'eliminazione del libro",
+                  "💾 Eliminato, in sincronizzazione con la nuvola ✅")
@@ -0,0 +1,106 @@
+import os
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+import streamlit as st
+
+# Connessioni aperte al massimo per ogni file di database
+POOL_SIZE = int(os.environ.get("SQLITE_POOL_SIZE", 4))
+
+# Millisecondi di attesa su un database bloccato da un'altra scrittura
+BUSY_TIMEOUT = int(os.environ.get("SQLITE_BUSY_TIMEOUT", 5000))
+
+# Statement preparati tenuti in cache da ogni connessione
+CACHED_STATEMENTS = 256
+
+# Impostazioni applicate a ogni nuova connessione: WAL permette letture
+# concorrenti durante una scrittura, e con WAL synchronous=NORMAL è sicuro
+PRAGMAS = (
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA cache_size = -16000",  # KiB (16 MB)
+    "PRAGMA mmap_size = 268435456",  # 256 MB
+    "PRAGMA temp_store = MEMORY",
+    f"PRAGMA busy_timeout = {BUSY_TIMEOUT}",
+    "PRAGMA foreign_keys = ON",
+)
+
+
+class ConnectionPool:
+    """Small thread-safe pool of configured connections to one SQLite file"""
+
+    def __init__(self, path, size=POOL_SIZE):
+        self.path = path
+        self.size = size
+        self._idle = queue.LifoQueue()
+        self._opened = 0
+        self._lock = threading.Lock()
+
+    def _open(self):
+        """Open a new connection with the pool pragmas"""
+        conn = sqlite3.connect(
+            self.path,
+            timeout=BUSY_TIMEOUT / 1000,
+            check_same_thread=False,
+            cached_statements=CACHED_STATEMENTS,
+        )
+        for pragma in PRAGMAS:
+            conn.execute(pragma)
+        return conn
+
+    def _acquire(self):
+        """Take an idle connection, opening one if the pool is not full yet"""
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._opened < self.size:
+                self._opened += 1
+                try:
+                    return self._open()
+                except Exception:
+                    self._opened -= 1
+                    raise
+        # Pool pieno: si aspetta che un'altra sessione restituisca una connessione
+        return self._idle.get(timeout=BUSY_TIMEOUT / 1000)
+
+    @contextmanager
+    def connection(self):
+        """Borrow a connection; an unfinished transaction is rolled back on return"""
+        conn = self._acquire()
+        try:
+            yield conn
+        finally:
+            self._release(conn)
+
+    def _release(self, conn):
+        """Put a connection back in the pool, discarding it if it is unusable"""
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            conn.close()
+            with self._lock:
+                self._opened -= 1
+            return
+        self._idle.put(conn)
+
+    def close(self):
+        """Close the idle connections of the pool"""
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            conn.close()
+            with self._lock:
+                self._opened -= 1
+
+
+@st.cache_resource
+def get_pool(path):
+    """Return the shared ConnectionPool of a database file"""
+    return ConnectionPool(path)
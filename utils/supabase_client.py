@@ -0,0 +1,264 @@
+import collections
+import logging
+import math
+import os
+import random
+import threading
+import time
+
+import httpx
+from postgrest.exceptions import APIError
+from supabase import create_client, ClientOptions
+
+# Secondi per aprire una connessione e per attendere la risposta di una richiesta
+CONNECT_TIMEOUT = float(os.environ.get("SUPABASE_CONNECT_TIMEOUT", 5))
+READ_TIMEOUT = float(os.environ.get("SUPABASE_READ_TIMEOUT", 30))
+
+# Connessioni HTTP aperte al massimo, e quante restano vive tra una richiesta e l'altra
+MAX_CONNECTIONS = int(os.environ.get("SUPABASE_MAX_CONNECTIONS", 20))
+MAX_KEEPALIVE_CONNECTIONS = 10
+KEEPALIVE_EXPIRY = 60
+
+# Nuovi tentativi per le letture (GET/HEAD, ripetibili senza effetti collaterali)
+READ_RETRIES = int(os.environ.get("SUPABASE_READ_RETRIES", 3))
+RETRY_BASE_DELAY = 0.25
+RETRY_MAX_DELAY = 4
+
+# Risposte del gateway che indicano un backend momentaneamente irraggiungibile
+RETRY_STATUSES = (502, 503, 504)
+IDEMPOTENT_METHODS = ('GET', 'HEAD')
+
+# Il circuito si apre dopo BREAKER_THRESHOLD errori di fila e per BREAKER_COOLDOWN
+# secondi rifiuta subito le richieste; poi ne lascia passare una di prova
+BREAKER_THRESHOLD = int(os.environ.get("SUPABASE_BREAKER_THRESHOLD", 5))
+BREAKER_COOLDOWN = float(os.environ.get("SUPABASE_BREAKER_COOLDOWN", 30))
+
+# Durate delle ultime richieste usate per i percentili
+LATENCY_SAMPLES = 500
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitOpenError(httpx.TransportError):
+    """Raised without contacting Supabase while the circuit breaker is open"""
+
+
+class CircuitBreaker:
+    """Count consecutive backend failures and reject requests while the backend is down"""
+
+    def __init__(self, threshold=BREAKER_THRESHOLD, cooldown=BREAKER_COOLDOWN):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.trips = 0
+        self._opened_at = None
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        """Return 'closed', 'open' or 'half-open'"""
+        with self._lock:
+            if self._opened_at is None:
+                return 'closed'
+            return 'open' if time.monotonic() - self._opened_at < self.cooldown else 'half-open'
+
+    def before_request(self):
+        """Raise CircuitOpenError while open; after the cooldown let one trial request through"""
+        with self._lock:
+            if self._opened_at is None:
+                return
+            wait = self.cooldown - (time.monotonic() - self._opened_at)
+            if wait > 0:
+                raise CircuitOpenError(f"Supabase non raggiungibile, nuovo tentativo tra {math.ceil(wait)} secondi")
+            # Le altre richieste restano bloccate finché la prova non ha un esito
+            self._opened_at = time.monotonic()
+
+    def record_success(self):
+        """Close the circuit after a request that reached a healthy backend"""
+        with self._lock:
+            self.failures = 0
+            self._opened_at = None
+
+    def record_failure(self):
+        """Count a failed request, opening the circuit at the threshold"""
+        with self._lock:
+            self.failures += 1
+            if self.failures >= self.threshold:
+                if self._opened_at is None:
+                    self.trips += 1
+                self._opened_at = time.monotonic()
+
+
+class ClientStats:
+    """Thread-safe request, retry and latency counters of the Supabase client"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.failures = 0
+        self.retries = 0
+        self.rejected = 0
+        self._latencies = collections.deque(maxlen=LATENCY_SAMPLES)
+
+    def record(self, seconds, failed):
+        """Count one attempt and its duration"""
+        with self._lock:
+            self.requests += 1
+            self.failures += failed
+            self._latencies.append(seconds)
+
+    def record_retry(self):
+        """Count one retried attempt"""
+        with self._lock:
+            self.retries += 1
+
+    def record_rejected(self):
+        """Count one request rejected by the open circuit"""
+        with self._lock:
+            self.rejected += 1
+
+    def snapshot(self):
+        """Return the counters and the latency percentiles in milliseconds"""
+        with self._lock:
+            latencies = sorted(self._latencies)
+            counters = {
+                'requests': self.requests,
+                'failures': self.failures,
+                'retries': self.retries,
+                'rejected': self.rejected,
+            }
+        for name, quantile in (('p50_ms', 0.5), ('p95_ms', 0.95)):
+            counters[name] = round(latencies[int(quantile * (len(latencies) - 1))] * 1000, 1) if latencies else None
+        counters['max_ms'] = round(latencies[-1] * 1000, 1) if latencies else None
+        return counters
+
+
+class ResilientTransport(httpx.HTTPTransport):
+    """HTTP transport with a circuit breaker, retries of idempotent reads and latency counters"""
+
+    def __init__(self, breaker, stats, **kwargs):
+        super().__init__(**kwargs)
+        self.breaker = breaker
+        self.stats = stats
+
+    def handle_request(self, request):
+        """Send request, retrying idempotent reads on network errors and gateway errors"""
+        try:
+            self.breaker.before_request()
+        except CircuitOpenError:
+            self.stats.record_rejected()
+            raise
+        retries = READ_RETRIES if request.method in IDEMPOTENT_METHODS else 0
+        for attempt in range(retries + 1):
+            start = time.monotonic()
+            error, response = None, None
+            try:
+                response = super().handle_request(request)
+            except httpx.TransportError as e:
+                error = e
+            failed = error is not None or response.status_code in RETRY_STATUSES
+            self.stats.record(time.monotonic() - start, failed)
+            if not failed:
+                self.breaker.record_success()
+                return response
+            self.breaker.record_failure()
+            if attempt == retries or self.breaker.state == 'open':
+                if error is not None:
+                    raise error
+                return response
+            if response is not None:
+                response.close()
+            self.stats.record_retry()
+            time.sleep(backoff_delay(attempt))
+
+
+def backoff_delay(attempt):
+    """Return the wait before retry number attempt: exponential backoff with full jitter"""
+    return random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** attempt))
+
+def is_connection_error(error):
+    """Tell whether error means Supabase could not be reached (network, timeout, open circuit)"""
+    if isinstance(error, APIError):
+        # Classe SQLSTATE 08: connessione al database persa o rifiutata
+        return str(error.code or '').startswith('08')
+    return isinstance(error, httpx.TransportError)
+
+_breaker = CircuitBreaker()
+_stats = ClientStats()
+# Vero se il client Supabase passa dal ResilientTransport (e quindi da _stats)
+_resilient = False
+
+def create_transport():
+    """Return the resilient transport with the keep-alive pool limits"""
+    limits = httpx.Limits(
+        max_connections=MAX_CONNECTIONS,
+        max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=KEEPALIVE_EXPIRY,
+    )
+    return ResilientTransport(_breaker, _stats, http2=True, limits=limits)
+
+def create_http_client():
+    """Return an httpx client with keep-alive pooling, timeouts and the resilient transport"""
+    return httpx.Client(
+        transport=create_transport(),
+        timeout=httpx.Timeout(READ_TIMEOUT, connect=CONNECT_TIMEOUT),
+        follow_redirects=True,
+    )
+
+def mount_postgrest_transport(client, transport):
+    """Make client send its PostgREST requests through transport.
+
+    For supabase-py releases without the httpx_client option (such as the
+    2.13.0 in uv.lock). The client builds a new PostgREST session after every
+    auth event: each one gets the same transport, so they share its
+    connection pool, retries and circuit breaker. Returns False if the client
+    does not build its PostgREST session the expected way.
+    """
+    init_postgrest_client = getattr(client, '_init_postgrest_client', None)
+    if init_postgrest_client is None:
+        return False
+
+    def init_with_transport(*args, **kwargs):
+        postgrest = init_postgrest_client(*args, **kwargs)
+        session = postgrest.session
+        # Stessi URL, header e timeout della sessione creata da postgrest, sul trasporto condiviso
+        postgrest.session = type(session)(base_url=session.base_url, headers=session.headers,
+                                          timeout=session.timeout, transport=transport, follow_redirects=True)
+        session.close()
+        return postgrest
+
+    client._init_postgrest_client = init_with_transport
+    client._postgrest = None
+    return True
+
+def create_supabase_client(url, key):
+    """Create the Supabase client on top of the resilient transport.
+
+    Newer supabase-py releases take create_http_client() as httpx_client;
+    older ones get the transport mounted on their PostgREST session. If
+    neither works the client only gets the request timeout and a warning
+    is logged.
+    """
+    global _resilient
+    timeout = httpx.Timeout(READ_TIMEOUT, connect=CONNECT_TIMEOUT)
+    try:
+        options = ClientOptions(httpx_client=create_http_client(), postgrest_client_timeout=timeout)
+    except TypeError:
+        options = None
+    if options is not None:
+        _resilient = True
+        return create_client(url, key, options=options)
+
+    client = create_client(url, key, options=ClientOptions(postgrest_client_timeout=timeout))
+    _resilient = mount_postgrest_transport(client, create_transport())
+    if not _resilient:
+        logger.warning("supabase-py does not accept httpx_client: the Supabase client runs without "
+                       "retries, circuit breaker and request stats")
+    return client
+
+def get_client_stats():
+    """Return the request counters and the circuit breaker state of the Supabase client,
+    or None if the client was created without the resilient transport"""
+    if not _resilient:
+        return None
+    return {**_stats.snapshot(), 'breaker': _breaker.state, 'breaker_trips': _breaker.trips}
@@ -1,10 +1,23 @@
 
 import streamlit as st
 import pandas as pd
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
 import os
+import base64
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
-from supabase import create_client, Client
+from supabase import Client
+from postgrest.exceptions import APIError
+from utils.table_cache import get_table_cache
+from utils.table_types import compact, record_loaded_size
+from utils.helpers import STATISTICHE_PAGAMENTI_COLUMNS, aggrega_pagamenti, ordina_per_mese
+from utils.indici import COLONNE_RICERCA_LIBRERIA, cerca_testo, parole
+from utils.supabase_client import create_supabase_client, get_client_stats, is_connection_error
+from utils.image_processor import create_logo_variants, LOGO_VARIANT_WIDTHS
+from utils.write_queue import WriteQueue, Write, Result, pending_id, is_pending_id, is_transient, with_retries
 
 # Try to load from .env file (for local development)
 load_dotenv()
@@ -22,33 +35,92 @@ else:
 if not supabase_url or not supabase_key:
     raise ValueError("SUPABASE_URL and SUPABASE_KEY must be set in environment variables or Streamlit secrets")
 
-supabase: Client = create_client(supabase_url, supabase_key)
+# Connessioni riusate (keep-alive), timeout, nuovi tentativi sulle letture e circuit breaker
+supabase: Client = create_supabase_client(supabase_url, supabase_key)
 
-def create_tables():
-    """Verify database tables exist"""
-    tables_exist = True
-    missing_tables = []
-    
-    # Lista di tutte le tabelle necessarie
-    required_tables = [
-        "studenti", "giorni_lezione", "libreria", "progressi", 
-        "pagamenti", "custom_links", "branding_settings", "libri_disponibili"
-    ]
-    
-    # Verifica ogni tabella
-    for table_name in required_tables:
+# Funzioni RPC non installate sul database (si usa il fallback lato client)
+_missing_rpcs = set()
+
+# Tabelle senza colonne hash dei blob (si scaricano con select('*'))
+_missing_projections = set()
+
+# Tabelle senza le colonne delle varianti ridimensionate (si usa il blob originale)
+_missing_variants = set()
+
+# Viste non installate sul database (si aggrega in pandas)
+_missing_views = set()
+
+# Tabelle necessarie all'applicazione
+REQUIRED_TABLES = [
+    "studenti", "giorni_lezione", "libreria", "progressi",
+    "pagamenti", "custom_links", "branding_settings", "libri_disponibili"
+]
+
+# Secondi tra due verifiche dello schema (0 = una sola volta per processo)
+SCHEMA_CHECK_INTERVAL = float(os.environ.get("SCHEMA_CHECK_INTERVAL", 0))
+
+@st.cache_resource
+def _schema_status():
+    """Process-wide result of the last schema verification"""
+    return {'lock': threading.Lock(), 'checked_at': None, 'missing': [], 'errors': {}}
+
+def _probe_table(table_name):
+    """Check that a table exists by selecting a single id"""
+    # Evita l'uso di funzioni come count(*) che non sono supportate direttamente
+    supabase.table(table_name).select("id").limit(1).execute()
+
+def _check_schema():
+    """Return (missing tables, {table: error}) with one introspection query.
+
+    Uses the tabelle_mancanti RPC when installed, otherwise probes the tables
+    concurrently.
+    """
+    response = _rpc('tabelle_mancanti', {'nomi': REQUIRED_TABLES})
+    if response is not None:
+        return list(response.data or []), {}
+
+    errors = {}
+    with ThreadPoolExecutor(max_workers=LOAD_MAX_WORKERS) as executor:
+        futures = {table_name: executor.submit(_probe_table, table_name) for table_name in REQUIRED_TABLES}
+    for table_name, future in futures.items():
         try:
-            # Verifica che la tabella esista tentando di selezionare solo l'id
-            # Evita l'uso di funzioni come count(*) che non sono supportate direttamente
-            response = supabase.table(table_name).select("id").limit(1).execute()
-            # Se arriviamo qui senza eccezioni, la tabella esiste
+            future.result()
         except Exception as e:
-            tables_exist = False
-            missing_tables.append(table_name)
-            st.error(f"Errore nella verifica della tabella {table_name}: {str(e)}")
+            errors[table_name] = str(e)
+    return list(errors), errors
+
+def get_schema_status():
+    """Return the cached schema verification: checked_at, missing tables and errors"""
+    status = _schema_status()
+    return {'checked_at': status['checked_at'], 'missing': list(status['missing']),
+            'errors': dict(status['errors'])}
+
+def create_tables(force=False):
+    """Verify database tables exist.
+
+    The check runs once per process (or every SCHEMA_CHECK_INTERVAL seconds)
+    and its result is shared by all sessions and reruns.
+    """
+    status = _schema_status()
+    with status['lock']:
+        checked_at = status['checked_at']
+        expired = checked_at is None or (
+            SCHEMA_CHECK_INTERVAL > 0 and time.time() - checked_at > SCHEMA_CHECK_INTERVAL
+        )
+        # Una verifica fallita viene ripetuta al rerun successivo
+        if force or expired or status['missing']:
+            try:
+                status['missing'], status['errors'] = _check_schema()
+            except Exception as e:
+                status['missing'], status['errors'] = list(REQUIRED_TABLES), {'schema': str(e)}
+            status['checked_at'] = time.time()
+        missing_tables, errors = status['missing'], status['errors']
+
+    for table_name, error in errors.items():
+        st.error(f"Errore nella verifica della tabella {table_name}: {error}")
     
     # Se mancano tabelle, mostra un messaggio
-    if not tables_exist:
+    if missing_tables:
         st.error(f"""
             Le seguenti tabelle non sono state trovate: {', '.join(missing_tables)}
             
@@ -58,36 +130,69 @@ def create_tables():
         
     return True
 
+# Colonne attese per le tabelle tenute in session state
+TABLE_COLUMNS = {
+    'studenti': [
+        'id', 'nome', 'cognome', 'canale', 'livello',
+        'metodologia', 'durata_lezione', 'prezzo_lezione', 'commenti',
+        'data_iscrizione', 'slides_url', 'classroom_url', 'meet_url'
+    ],
+    'progressi': ['id', 'studente_id', 'data', 'contenuto_id', 'descrizione'],
+    'libreria': ['id', 'libro', 'titolo', 'url', 'categoria', 'livello', 'descrizione'],
+    'pagamenti': ['id', 'studente_id', 'data', 'importo', 'mese', 'anno', 'commenti'],
+    'custom_links': ['id', 'titolo', 'url', 'ordine', 'icona_hash'],
+    'giorni_lezione': ['id', 'studente_id', 'giorno'],
+    'branding_settings': ['id', 'welcome_message', 'logo_hash'],
+}
+
+# Colonne scaricate da load_data per le tabelle con blob: logo e icone restano
+# sul server e li leggono solo le pagine che li mostrano (get_icone, get_logo)
+TABLE_PROJECTIONS = {
+    'custom_links': 'id, titolo, url, ordine, icona_hash, updated_at',
+    'branding_settings': 'id, welcome_message, logo_hash, updated_at',
+}
+
+# Colonne blob e relativo hash del contenuto, per tabella
+BLOB_COLUMNS = {
+    'custom_links': ('icona', 'icona_hash'),
+    'branding_settings': ('logo', 'logo_hash'),
+}
+
+# Varianti ridimensionate di un blob (PNG in base64): condividono l'hash
+# dell'originale, perché vengono riscritte insieme a lui
+BLOB_VARIANTS = {
+    'branding_settings': {width: f'logo_{width}' for width in LOGO_VARIANT_WIDTHS},
+}
+
+# Tabelle collegate a uno studente (eliminate a cascata con lo studente)
+STUDENT_CHILD_TABLES = ('progressi', 'pagamenti', 'giorni_lezione')
+
+# Tabella dei record eliminati, alimentata dai trigger lato Supabase
+TOMBSTONE_TABLE = 'eliminazioni'
+
+# Oltre questo intervallo senza sincronizzare si rifà un caricamento completo
+DELTA_SYNC_MAX_AGE = timedelta(days=1)
+
+# Ogni sincronizzazione rilegge anche le modifiche di questo intervallo prima
+# del watermark: una transazione iniziata prima della sincronizzazione e
+# confermata dopo ha updated_at/deleted_at più vecchi delle righe già viste
+DELTA_SYNC_OVERLAP = timedelta(seconds=float(os.environ.get("DELTA_SYNC_OVERLAP", 120)))
+
+# Richieste contemporanee massime verso Supabase durante load_data
+LOAD_MAX_WORKERS = int(os.environ.get("LOAD_MAX_WORKERS", 4))
+
+# Righe per pagina nel caricamento delle tabelle (il max-rows di default di Supabase)
+FETCH_PAGE_SIZE = 1000
+
 def init_db():
     """Initialize session state variables"""
     # Verifica che le tabelle esistano
     tables_ok = create_tables()
     
     # Initialize session states
-    if 'studenti' not in st.session_state:
-        st.session_state.studenti = pd.DataFrame(columns=[
-            'id', 'nome', 'cognome', 'canale', 'livello', 
-            'metodologia', 'durata_lezione', 'prezzo_lezione', 'commenti', 
-            'data_iscrizione', 'slides_url', 'classroom_url', 'meet_url'
-        ])
-    if 'progressi' not in st.session_state:
-        st.session_state.progressi = pd.DataFrame(columns=[
-            'id', 'studente_id', 'data', 'contenuto_id', 'descrizione'
-        ])
-    if 'libreria' not in st.session_state:
-        st.session_state.libreria = pd.DataFrame(columns=[
-            'id', 'libro', 'titolo', 'url', 'categoria', 'livello', 'descrizione'
-        ])
-    if 'pagamenti' not in st.session_state:
-        st.session_state.pagamenti = pd.DataFrame(columns=[
-            'id', 'studente_id', 'data', 'importo', 'mese', 'anno', 'commenti'
-        ])
-    if 'custom_links' not in st.session_state:
-        st.session_state.custom_links = pd.DataFrame(columns=[
-            'id', 'titolo', 'url', 'icona', 'ordine'
-        ])
-    if 'branding_settings' not in st.session_state:
-        st.session_state.branding_settings = pd.DataFrame(columns=['id', 'logo', 'welcome_message'])
+    for table_name, columns in TABLE_COLUMNS.items():
+        if table_name not in st.session_state:
+            st.session_state[table_name] = pd.DataFrame(columns=columns)
     
     # Carica i dati solo se le tabelle esistono
     if tables_ok:
@@ -97,56 +202,576 @@ def init_db():
             st.error(f"Errore nel caricamento dei dati: {str(e)}")
             st.info("Prova a rigenerare le tabelle nel database Supabase con i nomi e i campi corretti.")
 
-def load_data():
-    """Load data from Supabase into session state"""
-    try:
-        # Load studenti
-        response = supabase.table('studenti').select('*').execute()
-        if response.data:
-            st.session_state.studenti = pd.DataFrame(response.data)
-        
-        # Load progressi
-        response = supabase.table('progressi').select('*').execute()
-        if response.data:
-            st.session_state.progressi = pd.DataFrame(response.data)
-        
-        # Load libreria
-        response = supabase.table('libreria').select('*').execute()
-        if response.data:
-            st.session_state.libreria = pd.DataFrame(response.data)
-        
-        # Load pagamenti
-        response = supabase.table('pagamenti').select('*').execute()
-        if response.data:
-            st.session_state.pagamenti = pd.DataFrame(response.data)
-        
-        # Load custom_links
-        response = supabase.table('custom_links').select('*').execute()
-        if response.data:
-            st.session_state.custom_links = pd.DataFrame(response.data)
-        
-        # Load giorni_lezione
-        response = supabase.table('giorni_lezione').select('id,studente_id,giorno').execute()
-        if response.data:
-            st.session_state.giorni_lezione = pd.DataFrame(response.data)
+def _max_timestamp(values):
+    """Return the latest ISO timestamp in values, or None"""
+    timestamps = pd.to_datetime(pd.Series(values), utc=True, format='ISO8601').dropna()
+    return timestamps.max().isoformat() if not timestamps.empty else None
+
+def _overlap(since):
+    """Return the watermark since moved back by DELTA_SYNC_OVERLAP, for the gte filters"""
+    return (pd.Timestamp(since) - DELTA_SYNC_OVERLAP).isoformat()
+
+def _merge_rows(df, rows, deleted_ids=()):
+    """Merge changed rows (dicts or a DataFrame) into df, replacing by id, and drop deleted ids"""
+    if len(rows):
+        changed = rows if isinstance(rows, pd.DataFrame) else pd.DataFrame(rows)
+        if df.empty:
+            df = changed
         else:
-            st.session_state.giorni_lezione = pd.DataFrame(columns=['id', 'studente_id', 'giorno'])
-        
-        # Load libri_disponibili
-        response = supabase.table('libri_disponibili').select('nome').execute()
-        if response.data:
-            st.session_state.libri_disponibili = set([item['nome'] for item in response.data])
+            unchanged = df[~df['id'].isin(changed['id'])]
+            df = pd.concat([unchanged, changed], ignore_index=True)
+    if deleted_ids and not df.empty:
+        df = df[~df['id'].astype(str).isin(deleted_ids)].reset_index(drop=True)
+    return df
+
+def _fetch_tombstones(since):
+    """Return {table: set(record ids)} deleted after since (minus the overlap), and the new watermark"""
+    response = supabase.table(TOMBSTONE_TABLE).select('tabella, record_id, deleted_at')\
+        .gte('deleted_at', _overlap(since)).execute()
+    deleted = {}
+    for row in response.data or []:
+        deleted.setdefault(row['tabella'], set()).add(str(row['record_id']))
+    return deleted, _max_timestamp([row['deleted_at'] for row in response.data or []]) or since
+
+def _init_tombstone_watermark():
+    """Return the current tombstone watermark, or None if delta sync is not supported"""
+    try:
+        response = supabase.table(TOMBSTONE_TABLE).select('deleted_at')\
+            .order('deleted_at', desc=True).limit(1).execute()
+    except Exception:
+        # Senza tabella delle eliminazioni non possiamo rilevare le cancellazioni
+        return None
+    if response.data:
+        return response.data[0]['deleted_at']
+    return '1970-01-01T00:00:00+00:00'
+
+def _fetch_table(table_name, since=None, columns='*'):
+    """Fetch table_name page by page and build its DataFrame once at the end.
+
+    Pages are walked with keyset pagination on id, so the result is not capped
+    by PostgREST's max-rows limit. Rows are streamed into per-column buffers
+    sized from the exact count returned with the first page. If since is given
+    only rows updated after the watermark (minus DELTA_SYNC_OVERLAP) are
+    fetched; rows seen again are merged by id, so the overlap is harmless.
+    Returns the DataFrame and {'rows': ..., 'pages': ...}.
+    """
+    buffers, size, filled, pages, last_id = {}, 0, 0, 0, None
+    while True:
+        query = supabase.table(table_name).select(columns, count='exact' if pages == 0 else None)
+        if since:
+            query = query.gte('updated_at', _overlap(since))
+        if last_id is not None:
+            query = query.gt('id', last_id)
+        response = query.order('id').limit(FETCH_PAGE_SIZE).execute()
+        rows = response.data or []
+        pages += 1
+
+        if pages == 1:
+            size = max(response.count or 0, len(rows))
+            buffers = {column: [None] * size for column in (rows[0] if rows else ())}
+        for row in rows:
+            if filled == size:
+                # La tabella è cresciuta durante la lettura
+                for buffer in buffers.values():
+                    buffer.append(None)
+                size += 1
+            for column, value in row.items():
+                buffers[column][filled] = value
+            filled += 1
+
+        # Una pagina corta non basta: il server può limitare le righe per richiesta
+        if not rows or (len(rows) < FETCH_PAGE_SIZE and filled >= size):
+            break
+        last_id = rows[-1]['id']
+
+    data = pd.DataFrame({column: buffer[:filled] for column, buffer in buffers.items()})
+    return data, {'rows': filled, 'pages': pages}
+
+def iter_table(table_name, columns='*', filters=None):
+    """Yield table_name as DataFrame pages, walked with keyset pagination on id.
+
+    filters maps a column to a value or to a list of accepted values, like
+    helpers.filter_dataframe. Only one page is held in memory at a time.
+    """
+    last_id = None
+    while True:
+        query = supabase.table(table_name).select(columns)
+        for column, value in (filters or {}).items():
+            if isinstance(value, (list, tuple, set)):
+                query = query.in_(column, list(value))
+            else:
+                query = query.eq(column, value)
+        if last_id is not None:
+            query = query.gt('id', last_id)
+        rows = query.order('id').limit(FETCH_PAGE_SIZE).execute().data or []
+        # Una pagina corta non indica la fine: il server può limitare le righe per richiesta
+        if not rows:
+            return
+        yield pd.DataFrame(rows)
+        last_id = rows[-1]['id']
+
+def _fetch_projected(table_name, since=None):
+    """Fetch table_name with its column projection, falling back to '*' without hash columns"""
+    columns = TABLE_PROJECTIONS.get(table_name, '*')
+    if table_name in _missing_projections:
+        columns = '*'
+    try:
+        return _fetch_table(table_name, since, columns)
+    except APIError as e:
+        # 42703: colonna inesistente, migrazione degli hash non ancora applicata
+        if columns == '*' or e.code != '42703':
+            raise
+        _missing_projections.add(table_name)
+        return _fetch_table(table_name, since)
+
+def _fetch_libri_disponibili():
+    """Fetch the set of available book names"""
+    response = supabase.table('libri_disponibili').select('nome').execute()
+    return set([item['nome'] for item in response.data or []])
+
+def _sync_tables(cache, full=False):
+    """Refresh the shared cache from Supabase, fetching all tables concurrently.
+
+    Returns {table: exception} for the tables that could not be fetched; those
+    keep their previous snapshot and are retried on the next refresh.
+    """
+    last_sync = cache.meta.get('last_sync')
+    now = datetime.now(timezone.utc)
+    if full or last_sync is None or now - last_sync > DELTA_SYNC_MAX_AGE:
+        cache.meta[TOMBSTONE_TABLE] = _init_tombstone_watermark()
+        full = True
+
+    delta = cache.meta[TOMBSTONE_TABLE] is not None
+    watermarks = {}
+    jobs = {'libri_disponibili': (_fetch_libri_disponibili,)}
+    if delta:
+        jobs[TOMBSTONE_TABLE] = (_fetch_tombstones, cache.meta[TOMBSTONE_TABLE])
+    for table_name in TABLE_COLUMNS:
+        previous = cache.peek(table_name)
+        watermarks[table_name] = previous.watermark if delta and previous is not None and not full else None
+        jobs[table_name] = (_fetch_projected, table_name, watermarks[table_name])
+
+    # Le richieste partono in parallelo: il tempo di caricamento è quello della più lenta
+    results, errors = {}, {}
+    with ThreadPoolExecutor(max_workers=LOAD_MAX_WORKERS) as executor:
+        futures = {name: executor.submit(*job) for name, job in jobs.items()}
+    for name, future in futures.items():
+        try:
+            results[name] = future.result()
+        except Exception as e:
+            errors[name] = e
+
+    deleted = {}
+    if TOMBSTONE_TABLE in results:
+        deleted, cache.meta[TOMBSTONE_TABLE] = results.pop(TOMBSTONE_TABLE)
+    elif delta and not full:
+        # Senza l'elenco delle eliminazioni un merge parziale perderebbe i record cancellati
+        return errors
+
+    report = {}
+    for table_name in TABLE_COLUMNS:
+        if table_name not in results:
+            continue
+        (rows, report[table_name]), since = results[table_name], watermarks[table_name]
+
+        if since:
+            data = _merge_rows(cache.peek(table_name).data, rows, deleted.get(table_name, ()))
+        elif not rows.empty:
+            data = rows
         else:
-            st.session_state.libri_disponibili = set()
-            
-        # Load branding settings
-        response = supabase.table('branding_settings').select('*').execute()
-        if response.data and len(response.data) > 0:
-            st.session_state.branding_settings = pd.DataFrame([response.data[0]])
+            data = pd.DataFrame(columns=TABLE_COLUMNS[table_name])
+
+        # branding_settings contiene al massimo una riga
+        if table_name == 'branding_settings':
+            data = data.head(1)
+
+        # Le tabelle senza updated_at vengono sempre ricaricate per intero
+        watermark = since
+        if not rows.empty and 'updated_at' in rows.columns:
+            watermark = _max_timestamp(rows['updated_at']) or since
+        if not since:
+            # Solo un caricamento completo ha la tabella intera come arriva dal JSON
+            record_loaded_size(table_name, data)
+        cache.put(table_name, compact(table_name, data), watermark)
+
+    if 'libri_disponibili' in results:
+        cache.put('libri_disponibili', results['libri_disponibili'])
+
+    cache.meta['fetch_report'] = report
+    if not errors:
+        cache.meta['last_sync'] = now
+    return errors
+
+def get_fetch_report():
+    """Return {table: {'rows': ..., 'pages': ...}} for the last refresh from Supabase"""
+    return dict(get_table_cache('supabase').meta.get('fetch_report', {}))
+
+def load_data(full=False):
+    """Load data from Supabase into session state.
+
+    Tables come from a process-wide cache shared by all sessions and are
+    refreshed once their TTL expires: the first refresh downloads every table,
+    later ones only fetch rows whose updated_at is newer than the table
+    watermark and drop the rows recorded in the tombstone table.
+    Pass full=True to force a full reload.
+    """
+    try:
+        cache = get_table_cache('supabase')
+        with cache.lock:
+            tables = list(TABLE_COLUMNS) + ['libri_disponibili']
+            errors = {}
+            if full or any(cache.get(table_name) is None for table_name in tables):
+                errors = _sync_tables(cache, full)
+
+            for table_name in tables:
+                snapshot = cache.peek(table_name)
+                if snapshot is not None:
+                    st.session_state[table_name] = snapshot.data
+
+        for table_name, error in errors.items():
+            st.error(f"Errore nel caricamento della tabella {table_name}: {str(error)}")
     
     except Exception as e:
         st.error(f"Errore nel caricamento dei dati: {str(e)}")
 
+# Viste e tabelle con le statistiche dei pagamenti, per tipo di statistica:
+# pagamenti_mensili è il riepilogo per mese e canale aggiornato dai trigger
+STATISTICHE_PAGAMENTI_VIEWS = {
+    'mensili': 'statistiche_pagamenti_mensili',
+    'canali': 'pagamenti_mensili',
+    'studenti': 'statistiche_pagamenti_studenti',
+}
+
+def get_statistiche_pagamenti(vista):
+    """Return payment statistics computed by Supabase: 'mensili' (per month),
+    'canali' (per month and channel) or 'studenti' (per student).
+
+    Monthly totals are summed from the pagamenti_mensili rollup, O(months)
+    rows. The small result is cached like a table and fetched again when its
+    TTL expires or when payments or students are written through this
+    process. Without the views, the statistics are computed from the session.
+    """
+    if vista == 'mensili' and 'pagamenti_mensili' not in _missing_views:
+        canali = get_statistiche_pagamenti('canali')
+        # Il riepilogo potrebbe essersi appena rivelato mancante
+        if 'pagamenti_mensili' not in _missing_views:
+            return ordina_per_mese(canali.groupby(['anno', 'mese'], as_index=False)[['totale', 'n_pagamenti']].sum())
+
+    view = STATISTICHE_PAGAMENTI_VIEWS[vista]
+    cache = get_table_cache('supabase')
+    # Le versioni si leggono prima della richiesta: una scrittura concorrente
+    # rende subito vecchio il risultato
+    versions = (cache.version('pagamenti'), cache.version('studenti'))
+    snapshot = cache.get(view)
+    # Copie: le pagine rinominano e aggiungono colonne al risultato
+    if snapshot is not None and snapshot.watermark == versions:
+        return snapshot.data.copy()
+
+    if view not in _missing_views:
+        try:
+            rows = supabase.table(view).select(','.join(STATISTICHE_PAGAMENTI_COLUMNS[vista])).execute().data
+            stats = pd.DataFrame(rows or [], columns=STATISTICHE_PAGAMENTI_COLUMNS[vista])
+            # numeric arriva come numero o come testo, secondo la configurazione
+            stats['totale'] = stats['totale'].astype(float)
+        except APIError as e:
+            if e.code not in ('PGRST205', '42P01'):
+                raise
+            _missing_views.add(view)
+    if view in _missing_views:
+        stats = aggrega_pagamenti(st.session_state.pagamenti, st.session_state.studenti, vista)
+    if vista != 'studenti':
+        stats = ordina_per_mese(stats)
+    return cache.put(view, stats, watermark=versions).data.copy()
+
+def ricostruisci_pagamenti_mensili():
+    """Rebuild the pagamenti_mensili rollup from the payments; return its rows, or None if not installed"""
+    response = _rpc('ricostruisci_pagamenti_mensili', {})
+    if response is None:
+        return None
+    get_table_cache('supabase').invalidate('pagamenti_mensili')
+    return response.data
+
+def verifica_pagamenti_mensili():
+    """Return the rows where the pagamenti_mensili rollup disagrees with the payments, or None if not installed"""
+    response = _rpc('verifica_pagamenti_mensili', {})
+    if response is None:
+        return None
+    return ordina_per_mese(pd.DataFrame(response.data or [], columns=[
+        'anno', 'mese', 'canale', 'totale_riepilogo', 'totale_pagamenti', 'n_riepilogo', 'n_pagamenti']))
+
+def cerca_risorse(query):
+    """Return the ids of the library resources containing every word of query
+    (also as a word prefix), best match first.
+
+    Ranked by the Postgres full-text index (cerca_libreria RPC); without it,
+    by the in-memory index of the session library.
+    """
+    if not parole(query):
+        return []
+    response = _rpc('cerca_libreria', {'query': query})
+    if response is None:
+        return cerca_testo(st.session_state.libreria, query, COLONNE_RICERCA_LIBRERIA)
+    return [row['id'] for row in response.data or []]
+
+def _write_through(table_name, rows, deleted=False):
+    """Apply the rows returned by a Supabase mutation to the cached and session DataFrames.
+
+    Inserted and updated rows replace the existing ones by id (or are appended),
+    deleted rows are dropped, so a write does not need a full load_data().
+    The shared snapshot gets a new version, so every session sees the change.
+    """
+    if table_name in BLOB_COLUMNS and table_name not in _missing_projections:
+        # Il blob resta fuori dalla sessione come in load_data
+        blob_columns = {BLOB_COLUMNS[table_name][0], *BLOB_VARIANTS.get(table_name, {}).values()}
+        rows = [{k: v for k, v in row.items() if k not in blob_columns} for row in rows or []]
+    if deleted:
+        _patch_table(table_name, lambda df: _merge_rows(df, [], {str(row['id']) for row in rows or []}))
+    else:
+        _patch_table(table_name, lambda df: _merge_rows(df, rows or []))
+
+@st.cache_resource
+def _blob_cache():
+    """Process-wide cache of blob values: {(table, column, id): (content hash, value)}"""
+    return {}
+
+def _get_blobs(table_name, df, blob_column=None):
+    """Return {id: blob} for the rows of df, fetching only blobs not cached yet.
+
+    Blobs are keyed by row id and content hash: a changed logo or icon gets a
+    new hash and is fetched again, everything else is served from memory.
+    All missing blobs of the table are fetched with a single request.
+    blob_column selects a variant column instead of the original blob.
+    """
+    original_column, hash_column = BLOB_COLUMNS[table_name]
+    blob_column = blob_column or original_column
+    if df.empty:
+        return {}
+    if blob_column in df.columns:
+        # Caricamento completo (senza colonne hash): il blob è già in sessione
+        return dict(zip(df['id'], df[blob_column]))
+
+    cache = _blob_cache()
+    blobs, missing = {}, []
+    for id, content_hash in zip(df['id'], df[hash_column]):
+        if content_hash is None or pd.isna(content_hash):
+            blobs[id] = None
+        elif cache.get((table_name, blob_column, id), (None,))[0] == content_hash:
+            blobs[id] = cache[(table_name, blob_column, id)][1]
+        else:
+            missing.append(id)
+
+    if missing:
+        response = supabase.table(table_name).select(f'id, {blob_column}, {hash_column}')\
+            .in_('id', missing).execute()
+        for row in response.data or []:
+            cache[(table_name, blob_column, row['id'])] = (row[hash_column], row[blob_column])
+            blobs[row['id']] = row[blob_column]
+    return blobs
+
+def get_icone(links):
+    """Return {link id: base64 icon} for a custom_links DataFrame, loading icons lazily"""
+    try:
+        return _get_blobs('custom_links', links)
+    except Exception as e:
+        st.error(f"Errore nel recupero delle icone: {str(e)}")
+        return {}
+
+def _get_logo_variant(branding, width):
+    """Return the PNG bytes of the logo resized to width, or None if not available"""
+    column = BLOB_VARIANTS['branding_settings'].get(width)
+    if column is None or 'branding_settings' in _missing_variants:
+        return None
+    if column not in branding.columns and 'logo_hash' not in branding.columns:
+        # Caricamento completo senza la colonna della variante
+        return None
+    try:
+        value = _get_blobs('branding_settings', branding, column).get(branding['id'].iloc[0])
+    except APIError as e:
+        if e.code != '42703':
+            raise
+        _missing_variants.add('branding_settings')
+        return None
+    return base64.b64decode(value) if value else None
+
+def get_logo(variant=None):
+    """Return the logo from the cached branding settings.
+
+    variant is one of LOGO_VARIANT_WIDTHS and selects the copy pre-sized at
+    save time; it is None if that copy was never generated (the original is
+    never returned in its place). The logo is only downloaded when its content
+    hash changes.
+    """
+    branding = st.session_state.get('branding_settings')
+    if branding is None or branding.empty:
+        return None
+    if variant:
+        return _get_logo_variant(branding, variant)
+    return _get_blobs('branding_settings', branding).get(branding['id'].iloc[0])
+
+def _patch_table(table_name, func):
+    """Replace the cached and session copy of table_name with func(data), with compact types"""
+    patch = lambda data: compact(table_name, func(data))
+    snapshot = get_table_cache('supabase').update(table_name, patch)
+    if snapshot is not None:
+        st.session_state[table_name] = snapshot.data
+    elif table_name == 'libri_disponibili':
+        st.session_state.libri_disponibili = func(st.session_state.get('libri_disponibili', set()))
+    else:
+        current = st.session_state.get(table_name, pd.DataFrame(columns=TABLE_COLUMNS[table_name]))
+        st.session_state[table_name] = patch(current)
+
+def _rpc(name, params):
+    """Call a Supabase RPC, returning None if the function is not installed.
+
+    A missing function is remembered for the whole process, so callers fall
+    back to plain table requests without paying a failed round-trip each time.
+    """
+    if name in _missing_rpcs:
+        return None
+    try:
+        return supabase.rpc(name, params).execute()
+    except APIError as e:
+        if e.code != 'PGRST202':
+            raise
+        _missing_rpcs.add(name)
+        return None
+
+# Secondi tra un controllo e l'altro delle scritture in background ancora in corso
+WRITE_POLL_INTERVAL = 2
+
+# Id definitivi delle righe inserite in background, per id provvisorio
+_queued_ids = {}
+
+def _flush_writes(table_name, operation, writes):
+    """Run a batch of queued writes on table_name and apply the outcome to the shared cache.
+
+    Inserts go in one request; if a row is rejected the batch is retried row
+    by row, so only the invalid rows fail. Deletes go in one request too.
+    """
+    if operation == 'insert':
+        try:
+            rows = with_retries(lambda: supabase.table(table_name).insert([write.row for write in writes]).execute().data)
+        except Exception as e:
+            if len(writes) > 1 and not is_transient(e):
+                return [result for write in writes for result in _flush_writes(table_name, operation, [write])]
+            return [_write_result(write, False, e, lambda df, key=str(write.key): _merge_rows(df, [], {key}))
+                    for write in writes]
+        results = []
+        for write, row in zip(writes, rows):
+            _queued_ids[write.key] = row['id']
+            results.append(_write_result(write, True, None, lambda df, key=str(write.key), row=row: _merge_rows(df, [row], {key})))
+        # Righe non restituite dal server: l'id definitivo non è noto, la riga provvisoria sparisce
+        for write in writes[len(rows or []):]:
+            results.append(_write_result(write, False, "Il server non ha restituito la riga inserita",
+                                         lambda df, key=str(write.key): _merge_rows(df, [], {key})))
+        return results
+
+    ids = [_queued_ids.get(write.key, write.key) for write in writes]
+    # Una riga provvisoria mai inserita (inserimento fallito) non va eliminata dal server
+    ids = [id for id in ids if not is_pending_id(id)]
+    try:
+        if ids:
+            with_retries(lambda: supabase.table(table_name).delete().in_('id', ids).execute())
+    except Exception as e:
+        return [_write_result(write, False, e, lambda df, row=write.row: _merge_rows(df, [row])) for write in writes]
+    # Le righe provvisorie eliminate non servono più
+    for write in writes:
+        _queued_ids.pop(write.key, None)
+    return [_write_result(write, True, None, lambda df: _merge_rows(df, [], {str(id) for id in ids})) for write in writes]
+
+def _write_result(write, ok, error, apply):
+    """Apply the outcome of a queued write to the shared cache and wrap it in a Result"""
+    get_table_cache('supabase').update(write.table, lambda data: compact(write.table, apply(data)))
+    return Result(write, ok, str(error) if error else None, apply)
+
+@st.cache_resource
+def _write_queue():
+    """Process-wide queue of the writes run in background"""
+    return WriteQueue(_flush_writes)
+
+def _write_session():
+    """Return the id of this browser session in the write queue"""
+    return st.session_state.setdefault('write_queue_session', uuid.uuid4().hex)
+
+def _queue_insert(table_name, row):
+    """Show row in the session right away and insert it in background"""
+    key = pending_id()
+    _patch_table(table_name, lambda df: _merge_rows(df, [{**row, 'id': key}]))
+    _write_queue().submit(Write(_write_session(), table_name, 'insert', key, row))
+
+def _queue_delete(table_name, id):
+    """Hide row id from the session right away and delete it in background"""
+    current = st.session_state.get(table_name, pd.DataFrame(columns=TABLE_COLUMNS[table_name]))
+    rows = current[current['id'].astype(str) == str(id)].to_dict('records')
+    _patch_table(table_name, lambda df: _merge_rows(df, [], {str(id)}))
+    _write_queue().submit(Write(_write_session(), table_name, 'delete', id, rows[0] if rows else {'id': id}))
+
+def report_writes():
+    """Bring the session up to date with its finished background writes and show their outcome.
+
+    While writes are still running, a fragment polls the queue and reruns
+    the page as soon as they are all done.
+    """
+    if 'write_queue_session' not in st.session_state:
+        return
+    session = st.session_state['write_queue_session']
+    write_queue = _write_queue()
+    inserted = []
+    for result in write_queue.take_results(session):
+        table_name = result.write.table
+        if result.write.operation == 'insert':
+            inserted.append(result.write.key)
+        snapshot = get_table_cache('supabase').peek(table_name)
+        if snapshot is not None:
+            st.session_state[table_name] = snapshot.data
+        elif result.apply is not None:
+            st.session_state[table_name] = compact(table_name, result.apply(st.session_state[table_name]))
+        if result.ok:
+            st.toast("🌞 Eliminato dalla nuvola ✅" if result.write.operation == 'delete' else "🌞 Salvato nella nuvola ✅")
+        else:
+            action = "nell'eliminazione" if result.write.operation == 'delete' else "nel salvataggio"
+            st.error(f"🌧️ Piove ❌ Errore {action} ({table_name}): {result.error}")
+    if write_queue.pending(session):
+        _watch_writes()
+    else:
+        # La sessione ora mostra gli id definitivi e nessuna sua scrittura in coda usa quelli provvisori
+        for key in inserted:
+            _queued_ids.pop(key, None)
+
+@st.fragment(run_every=WRITE_POLL_INTERVAL)
+def _watch_writes():
+    """Show the writes still running and rerun the page once they are done"""
+    pending = _write_queue().pending(st.session_state['write_queue_session'])
+    if not pending:
+        st.rerun()
+    st.caption(f"⏳ {pending} salvataggi in corso verso la nuvola...")
+
+def _insert_studente(studente_data, giorni_lezione):
+    """Insert a student and its lesson days, returning the inserted rows of both tables.
+
+    Uses the crea_studente RPC (one request, one transaction) when installed;
+    otherwise inserts the student and then all the days with a single bulk
+    request, deleting the student again if the days cannot be saved.
+    """
+    response = _rpc('crea_studente', {'studente': studente_data, 'giorni': giorni_lezione})
+    if response is not None:
+        return [response.data['studente']], response.data['giorni_lezione']
+
+    response = supabase.table('studenti').insert(studente_data).execute()
+    if not response.data or not giorni_lezione:
+        return response.data or [], []
+
+    studente_id = response.data[0]['id']
+    try:
+        giorni_response = supabase.table('giorni_lezione').insert([
+            {'studente_id': studente_id, 'giorno': giorno} for giorno in giorni_lezione
+        ]).execute()
+    except Exception:
+        # Niente studenti a metà: annulla l'inserimento
+        supabase.table('studenti').delete().eq('id', studente_id).execute()
+        raise
+    return response.data, giorni_response.data or []
+
 def add_studente(nome, cognome, canale, livello, metodologia, durata_lezione, prezzo_lezione, 
                 commenti, data_iscrizione, slides_url, classroom_url, meet_url, giorni_lezione=None):
     """Add a new student to Supabase"""
@@ -201,41 +826,26 @@ def add_studente(nome, cognome, canale, livello, metodologia, durata_lezione, pr
                 with debug_container:
                     st.write(f"⚙️ DEBUG: Errore: {str(e)}")
         
-        response = supabase.table('studenti').insert(studente_data).execute()
+        studenti_rows, giorni_rows = _insert_studente(studente_data, giorni_lezione or [])
         if debug_container:
             with debug_container:
-                st.write(f"⚙️ DEBUG: Risposta Supabase: {response}")
+                st.write(f"⚙️ DEBUG: Righe inserite: {studenti_rows} - giorni lezione: {giorni_rows}")
         
-        if response and response.data:
-            studente_id = response.data[0]['id']
+        if studenti_rows:
+            studente_id = studenti_rows[0]['id']
             
             # Mostra info di debug solo se attivo
             if debug_container:
                 with debug_container:
                     st.write(f"⚙️ DEBUG: Studente inserito con ID: {studente_id}")
             
-            # Insert giorni_lezione if provided
-            if giorni_lezione:
-                if debug_container:
-                    with debug_container:
-                        st.write(f"⚙️ DEBUG: Inserimento giorni lezione: {giorni_lezione}")
-                
-                for giorno in giorni_lezione:
-                    giorno_response = supabase.table('giorni_lezione').insert({
-                        'studente_id': studente_id,
-                        'giorno': giorno
-                    }).execute()
-                    
-                    if debug_container:
-                        with debug_container:
-                            st.write(f"⚙️ DEBUG: Giorno {giorno} inserito con risposta: {giorno_response}")
-            
-            # Ricarica i dati
+            # Aggiorna i dati in sessione con le righe restituite da Supabase
             if debug_container:
                 with debug_container:
-                    st.write("⚙️ DEBUG: Ricaricamento dati...")
+                    st.write("⚙️ DEBUG: Aggiornamento dati in sessione...")
             
-            load_data()
+            _write_through('studenti', studenti_rows)
+            _write_through('giorni_lezione', giorni_rows)
             
             # Verifica finale solo in modalità debug
             if debug_container:
@@ -274,7 +884,7 @@ def add_studente(nome, cognome, canale, livello, metodologia, durata_lezione, pr
             error_text = "Studente già esistente nel database"
         elif "foreign key constraint" in error_msg.lower():
             error_text = "Riferimento a dati non esistenti"
-        elif "timeout" in error_msg.lower() or "connection" in error_msg.lower():
+        elif is_connection_error(e):
             error_text = "Problema di connessione con il database"
         elif "permission" in error_msg.lower() or "not authorized" in error_msg.lower():
             error_text = "Permessi insufficienti per questa operazione"
@@ -292,23 +902,33 @@ def add_studente(nome, cognome, canale, livello, metodologia, durata_lezione, pr
         st.error(f"🌧️ Piove ❌ {error_text}")
         return False
 
+def bulk_insert(table_name, rows):
+    """Insert a list of rows with a single request and return how many were written.
+
+    The session is not updated row by row: the table is marked stale and the
+    next load_data() fetches the new rows with one delta sync.
+    """
+    response = supabase.table(table_name).insert(rows).execute()
+    get_table_cache('supabase').expire(table_name)
+    return len(response.data or [])
+
 def add_custom_link(titolo, url, icona, ordine):
     """Add a new custom link to Supabase"""
     try:
-        supabase.table('custom_links').insert({
+        response = supabase.table('custom_links').insert({
             'titolo': titolo,
             'url': url,
             'icona': icona,
             'ordine': ordine
         }).execute()
-        load_data()
+        _write_through('custom_links', response.data)
         st.success("🌞 Salvato nella nuvola ✅")
         return True
     except Exception as e:
         error_msg = str(e)
         if "duplicate key" in error_msg.lower():
             st.error("🌧️ Piove ❌ Link già esistente nel database")
-        elif "timeout" in error_msg.lower() or "connection" in error_msg.lower():
+        elif is_connection_error(e):
             st.error("🌧️ Piove ❌ Problema di connessione con il database")
         else:
             st.error(f"🌧️ Piove ❌ Errore nell'aggiunta del link: {error_msg}")
@@ -317,18 +937,18 @@ def add_custom_link(titolo, url, icona, ordine):
 def update_custom_link(id, titolo, url, icona, ordine):
     """Update a custom link in Supabase"""
     try:
-        supabase.table('custom_links').update({
+        response = supabase.table('custom_links').update({
             'titolo': titolo,
             'url': url,
             'icona': icona,
             'ordine': ordine
         }).eq('id', id).execute()
-        load_data()
+        _write_through('custom_links', response.data)
         st.success("🌞 Salvato nella nuvola ✅")
         return True
     except Exception as e:
         error_msg = str(e)
-        if "timeout" in error_msg.lower() or "connection" in error_msg.lower():
+        if is_connection_error(e):
             st.error("🌧️ Piove ❌ Problema di connessione con il database")
         elif "not found" in error_msg.lower():
             st.error("🌧️ Piove ❌ Link non trovato nel database")
@@ -339,31 +959,35 @@ def update_custom_link(id, titolo, url, icona, ordine):
 def delete_custom_link(id):
     """Delete a custom link from Supabase"""
     try:
-        supabase.table('custom_links').delete().eq('id', id).execute()
-        load_data()
+        response = supabase.table('custom_links').delete().eq('id', id).execute()
+        _write_through('custom_links', response.data, deleted=True)
         st.success("🌞 Eliminato dalla nuvola ✅")
         return True
     except Exception as e:
         st.error(f"🌧️ Piove ❌ Errore nell'eliminazione del link: {str(e)}")
         return False
 
-def add_progresso(studente_id, data, contenuto_id, descrizione):
-    """Add a new progress record to Supabase"""
+def add_progresso(studente_id, data, contenuto_id, descrizione, in_background=False):
+    """Add a new progress record to Supabase (in_background: queue it and return at once)"""
+    progresso = {
+        'studente_id': studente_id,
+        'data': data.isoformat(),
+        'contenuto_id': contenuto_id,
+        'descrizione': descrizione
+    }
+    if in_background:
+        _queue_insert('progressi', progresso)
+        return True
     try:
-        supabase.table('progressi').insert({
-            'studente_id': studente_id,
-            'data': data.isoformat(),
-            'contenuto_id': contenuto_id,
-            'descrizione': descrizione
-        }).execute()
-        load_data()
+        response = supabase.table('progressi').insert(progresso).execute()
+        _write_through('progressi', response.data)
         st.success("🌞 Salvato nella nuvola ✅")
         return True
     except Exception as e:
         error_msg = str(e)
         if "foreign key constraint" in error_msg.lower():
             st.error("🌧️ Piove ❌ Studente non trovato nel database")
-        elif "timeout" in error_msg.lower() or "connection" in error_msg.lower():
+        elif is_connection_error(e):
             st.error("🌧️ Piove ❌ Problema di connessione con il database")
         else:
             st.error(f"🌧️ Piove ❌ Errore nell'aggiunta del progresso: {error_msg}")
@@ -372,7 +996,7 @@ def add_progresso(studente_id, data, contenuto_id, descrizione):
 def add_risorsa(libro, titolo, url, categoria, livello, descrizione):
     """Add a new resource to Supabase library"""
     try:
-        supabase.table('libreria').insert({
+        response = supabase.table('libreria').insert({
             'libro': libro,
             'titolo': titolo,
             'url': url,
@@ -380,14 +1004,14 @@ def add_risorsa(libro, titolo, url, categoria, livello, descrizione):
             'livello': livello,
             'descrizione': descrizione
         }).execute()
-        load_data()
+        _write_through('libreria', response.data)
         st.success("🌞 Salvato nella nuvola ✅")
         return True
     except Exception as e:
         error_msg = str(e)
         if "duplicate key" in error_msg.lower():
             st.error("🌧️ Piove ❌ Risorsa già esistente nel database")
-        elif "timeout" in error_msg.lower() or "connection" in error_msg.lower():
+        elif is_connection_error(e):
             st.error("🌧️ Piove ❌ Problema di connessione con il database")
         else:
             st.error(f"🌧️ Piove ❌ Errore nell'aggiunta della risorsa: {error_msg}")
@@ -396,33 +1020,37 @@ def add_risorsa(libro, titolo, url, categoria, livello, descrizione):
 def delete_risorsa(id):
     """Delete a resource from Supabase library"""
     try:
-        supabase.table('libreria').delete().eq('id', id).execute()
-        load_data()
+        response = supabase.table('libreria').delete().eq('id', id).execute()
+        _write_through('libreria', response.data, deleted=True)
         st.success("🌞 Eliminato dalla nuvola ✅")
         return True
     except Exception as e:
         st.error(f"🌧️ Piove ❌ Errore nell'eliminazione della risorsa: {str(e)}")
         return False
 
-def add_pagamento(studente_id, data, importo, mese, anno, commenti):
-    """Add a new payment to Supabase"""
+def add_pagamento(studente_id, data, importo, mese, anno, commenti, in_background=False):
+    """Add a new payment to Supabase (in_background: queue it and return at once)"""
+    pagamento = {
+        'studente_id': studente_id,
+        'data': data.isoformat(),
+        'importo': importo,
+        'mese': mese,
+        'anno': anno,
+        'commenti': commenti
+    }
+    if in_background:
+        _queue_insert('pagamenti', pagamento)
+        return True
     try:
-        supabase.table('pagamenti').insert({
-            'studente_id': studente_id,
-            'data': data.isoformat(),
-            'importo': importo,
-            'mese': mese,
-            'anno': anno,
-            'commenti': commenti
-        }).execute()
-        load_data()
+        response = supabase.table('pagamenti').insert(pagamento).execute()
+        _write_through('pagamenti', response.data)
         st.success("🌞 Salvato nella nuvola ✅")
         return True
     except Exception as e:
         error_msg = str(e)
         if "foreign key constraint" in error_msg.lower():
             st.error("🌧️ Piove ❌ Studente non trovato nel database")
-        elif "timeout" in error_msg.lower() or "connection" in error_msg.lower():
+        elif is_connection_error(e):
             st.error("🌧️ Piove ❌ Problema di connessione con il database")
         elif "invalid input syntax" in error_msg.lower():
             st.error("🌧️ Piove ❌ Formato dei dati non valido")
@@ -433,7 +1061,7 @@ def add_pagamento(studente_id, data, importo, mese, anno, commenti):
 def update_studente(id, nome, cognome, canale, livello, durata_lezione, prezzo_lezione):
     """Update student info in Supabase"""
     try:
-        supabase.table('studenti').update({
+        response = supabase.table('studenti').update({
             'nome': nome,
             'cognome': cognome,
             'canale': canale,
@@ -441,61 +1069,99 @@ def update_studente(id, nome, cognome, canale, livello, durata_lezione, prezzo_l
             'durata_lezione': durata_lezione,
             'prezzo_lezione': prezzo_lezione
         }).eq('id', id).execute()
-        load_data()
+        _write_through('studenti', response.data)
         st.success("🌞 Salvato nella nuvola ✅")
         return True
     except Exception as e:
         st.error(f"🌧️ Piove ❌ Errore nell'aggiornamento dello studente: {str(e)}")
         return False
 
+def _delete_studenti(ids):
+    """Delete students in one request; related rows go with them through ON DELETE CASCADE"""
+    try:
+        response = supabase.table('studenti').delete().in_('id', ids).execute()
+    except APIError as e:
+        if e.code != '23503':
+            raise
+        # Foreign key senza cascata (migrazione non ancora applicata): elimina prima i figli
+        for table_name in STUDENT_CHILD_TABLES:
+            supabase.table(table_name).delete().in_('studente_id', ids).execute()
+        response = supabase.table('studenti').delete().in_('id', ids).execute()
+
+    _write_through('studenti', response.data, deleted=True)
+    deleted_ids = {str(row['id']) for row in response.data or []}
+    for table_name in STUDENT_CHILD_TABLES:
+        _patch_table(table_name, lambda df: df[~df['studente_id'].astype(str).isin(deleted_ids)]
+                     .reset_index(drop=True) if not df.empty else df)
+
 def delete_studente(id):
     """Delete a student and related records from Supabase"""
     try:
-        # Delete child records first to maintain referential integrity
-        supabase.table('progressi').delete().eq('studente_id', id).execute()
-        supabase.table('pagamenti').delete().eq('studente_id', id).execute()
-        supabase.table('giorni_lezione').delete().eq('studente_id', id).execute()
-        
-        # Then delete the student
-        supabase.table('studenti').delete().eq('id', id).execute()
-        load_data()
+        _delete_studenti([id])
         st.success("🌞 Eliminato dalla nuvola ✅")
         return True
     except Exception as e:
         st.error(f"🌧️ Piove ❌ Errore nell'eliminazione dello studente: {str(e)}")
         return False
 
-def save_branding_settings(logo_bytes=None, welcome_message=None):
-    """Save branding settings to Supabase"""
+def delete_studenti(ids):
+    """Delete several students and their related records from Supabase"""
     try:
-        # Check if settings exist
+        _delete_studenti(list(ids))
+        st.success("🌞 Eliminati dalla nuvola ✅")
+        return True
+    except Exception as e:
+        st.error(f"🌧️ Piove ❌ Errore nell'eliminazione degli studenti: {str(e)}")
+        return False
+
+def _save_branding(logo_bytes, welcome_message, existing_id=None):
+    """Write the branding row with its pre-sized logo variants and return the saved rows"""
+    data = {'logo': logo_bytes, 'welcome_message': welcome_message}
+    if 'branding_settings' not in _missing_variants:
+        variants = create_logo_variants(logo_bytes)
+        for width, column in BLOB_VARIANTS['branding_settings'].items():
+            data[column] = base64.b64encode(variants[width]).decode() if width in variants else None
+
+    # Check if settings exist
+    if existing_id is None:
         response = supabase.table('branding_settings').select('id').execute()
-        if response.data and len(response.data) > 0:
+        existing_id = response.data[0]['id'] if response.data else None
+
+    def save(data):
+        if existing_id is not None:
             # Update existing record
-            supabase.table('branding_settings').update({
-                'logo': logo_bytes,
-                'welcome_message': welcome_message
-            }).eq('id', response.data[0]['id']).execute()
-        else:
-            # Insert new record
-            supabase.table('branding_settings').insert({
-                'logo': logo_bytes,
-                'welcome_message': welcome_message
-            }).execute()
-        load_data()
+            return supabase.table('branding_settings').update(data).eq('id', existing_id).execute()
+        # Insert new record
+        return supabase.table('branding_settings').insert(data).execute()
+
+    try:
+        return save(data).data
+    except APIError as e:
+        # Colonne delle varianti assenti: si salva solo il logo originale
+        if e.code not in ('PGRST204', '42703') or 'branding_settings' in _missing_variants:
+            raise
+        _missing_variants.add('branding_settings')
+        return save({'logo': logo_bytes, 'welcome_message': welcome_message}).data
+
+def save_branding_settings(logo_bytes=None, welcome_message=None):
+    """Save branding settings to Supabase, with the pre-sized logo variants"""
+    try:
+        branding = st.session_state.get('branding_settings')
+        existing_id = branding['id'].iloc[0] if branding is not None and not branding.empty else None
+        _write_through('branding_settings', _save_branding(logo_bytes, welcome_message, existing_id))
         st.success("🌞 Salvato nella nuvola ✅")
         return True
     except Exception as e:
         st.error(f"🌧️ Piove ❌ Errore nel salvataggio delle impostazioni: {str(e)}")
         return False
 
-def get_branding_settings():
-    """Get branding settings from Supabase"""
+def get_branding_settings(variant=None):
+    """Get (logo, welcome_message) from the cached branding settings, without a request per rerun"""
     try:
-        response = supabase.table('branding_settings').select('logo, welcome_message').execute()
-        if response.data and len(response.data) > 0:
-            return response.data[0]['logo'], response.data[0]['welcome_message']
-        return None, None
+        branding = st.session_state.get('branding_settings')
+        if branding is None or branding.empty:
+            return None, None
+        return get_logo(variant), branding['welcome_message'].iloc[0]
     except Exception as e:
         st.error(f"Errore nel recupero delle impostazioni: {str(e)}")
         return None, None
@@ -509,7 +1175,7 @@ def add_libro_disponibile(nome):
             return False  # Book already exists
         
         supabase.table('libri_disponibili').insert({'nome': nome}).execute()
-        load_data()
+        _patch_table('libri_disponibili', lambda libri: libri | {nome})
         st.success("🌞 Salvato nella nuvola ✅")
         return True
     except Exception as e:
@@ -529,29 +1195,37 @@ def delete_libro_disponibile(nome):
     """Delete a book from Supabase available books list"""
     try:
         supabase.table('libri_disponibili').delete().eq('nome', nome).execute()
-        load_data()
+        _patch_table('libri_disponibili', lambda libri: libri - {nome})
         st.success("🌞 Eliminato dalla nuvola ✅")
         return True
     except Exception as e:
         st.error(f"🌧️ Piove ❌ Errore nell'eliminazione del libro: {str(e)}")
         return False
     
-def delete_pagamento(id):
-    """Delete a payment from Supabase"""
+def delete_pagamento(id, in_background=False):
+    """Delete a payment from Supabase (in_background: queue it and return at once)"""
+    # Una riga ancora in attesa di inserimento va eliminata dopo, nella stessa coda
+    if in_background or is_pending_id(id):
+        _queue_delete('pagamenti', id)
+        return True
     try:
-        supabase.table('pagamenti').delete().eq('id', id).execute()
-        load_data()
+        response = supabase.table('pagamenti').delete().eq('id', id).execute()
+        _write_through('pagamenti', response.data, deleted=True)
         st.success("🌞 Eliminato dalla nuvola ✅") 
         return True
     except Exception as e:
         st.error(f"🌧️ Piove ❌ Errore nell'eliminazione del pagamento: {str(e)}")
         return False
     
-def delete_progresso(id):
-    """Delete a progress record from Supabase"""
+def delete_progresso(id, in_background=False):
+    """Delete a progress record from Supabase (in_background: queue it and return at once)"""
+    # Una riga ancora in attesa di inserimento va eliminata dopo, nella stessa coda
+    if in_background or is_pending_id(id):
+        _queue_delete('progressi', id)
+        return True
     try:
-        supabase.table('progressi').delete().eq('id', id).execute()
-        load_data()
+        response = supabase.table('progressi').delete().eq('id', id).execute()
+        _write_through('progressi', response.data, deleted=True)
         st.success("🌞 Eliminato dalla nuvola ✅")
         return True
     except Exception as e:
@@ -0,0 +1,82 @@
+import os
+import threading
+import time
+from collections import namedtuple
+
+import streamlit as st
+
+# Secondi dopo i quali una tabella in cache viene considerata scaduta
+DEFAULT_TTL = float(os.environ.get("TABLE_CACHE_TTL", 60))
+
+# Una versione immutabile di una tabella: i DataFrame in cache non vanno mai
+# modificati sul posto, ogni scrittura ne crea uno nuovo con put()/update()
+Snapshot = namedtuple("Snapshot", ["data", "version", "loaded_at", "watermark"])
+
+
+class TableCache:
+    """Process-wide table snapshots shared by every Streamlit session"""
+
+    def __init__(self, ttl=DEFAULT_TTL):
+        self.ttl = ttl
+        # RLock: chi aggiorna la cache può rileggerla senza bloccarsi
+        self.lock = threading.RLock()
+        self.meta = {}
+        self._snapshots = {}
+        self._versions = {}
+
+    def get(self, name):
+        """Return the snapshot of name if it is still fresh, otherwise None"""
+        snapshot = self._snapshots.get(name)
+        if snapshot is None or time.monotonic() - snapshot.loaded_at > self.ttl:
+            return None
+        return snapshot
+
+    def peek(self, name):
+        """Return the last snapshot of name even if expired (base for delta syncs)"""
+        return self._snapshots.get(name)
+
+    def put(self, name, data, watermark=None):
+        """Store a new snapshot of name and bump its data version"""
+        with self.lock:
+            version = self._versions.get(name, 0) + 1
+            self._versions[name] = version
+            self._snapshots[name] = Snapshot(data, version, time.monotonic(), watermark)
+            return self._snapshots[name]
+
+    def update(self, name, func):
+        """Replace the data of name with func(data), keeping its watermark and age"""
+        with self.lock:
+            snapshot = self._snapshots.get(name)
+            if snapshot is None:
+                return None
+            version = snapshot.version + 1
+            self._versions[name] = version
+            self._snapshots[name] = snapshot._replace(data=func(snapshot.data), version=version)
+            return self._snapshots[name]
+
+    def expire(self, *names):
+        """Mark the snapshots of names as stale, keeping them as base for a delta sync"""
+        with self.lock:
+            for name in names:
+                snapshot = self._snapshots.get(name)
+                if snapshot is not None:
+                    self._snapshots[name] = snapshot._replace(loaded_at=float("-inf"))
+
+    def invalidate(self, *names):
+        """Drop the snapshots of names (all tables if none given)"""
+        with self.lock:
+            for name in names or list(self._snapshots):
+                if self._snapshots.pop(name, None) is not None:
+                    self._versions[name] = self._versions.get(name, 0) + 1
+            if not names:
+                self.meta.clear()
+
+    def version(self, name):
+        """Return the current data version of name"""
+        return self._versions.get(name, 0)
+
+
+@st.cache_resource
+def get_table_cache(namespace):
+    """Return the shared TableCache for a backend ('supabase', 'sqlite', ...)"""
+    return TableCache()
@@ -0,0 +1,90 @@
+import pandas as pd
+
+# Tipi compatti delle colonne delle tabelle in sessione:
+# - category: enumerazioni con pochi valori ripetuti, salvati una volta sola
+# - date: date ISO (con o senza orario) convertite una volta in datetime64
+# - Int16/Int32: interi nullable. Gli id restano come arrivano se non sono
+#   tutti interi (id provvisori delle scritture in coda, UUID della replica)
+#   o se superano l'intervallo del tipo
+# Gli importi restano float64: in float32 i totali perdono i centesimi
+TABLE_TYPES = {
+    'studenti': {
+        'id': 'Int32',
+        'canale': 'category',
+        'livello': 'category',
+        'data_iscrizione': 'date',
+    },
+    'progressi': {
+        'id': 'Int32',
+        'studente_id': 'Int32',
+        'contenuto_id': 'Int32',
+        'data': 'date',
+    },
+    'pagamenti': {
+        'id': 'Int32',
+        'studente_id': 'Int32',
+        'data': 'date',
+        'mese': 'category',
+        'anno': 'Int16',
+    },
+    'libreria': {
+        'id': 'Int32',
+        'libro': 'category',
+        'categoria': 'category',
+        'livello': 'category',
+    },
+}
+
+
+def _compact_column(column, kind):
+    """Convert one column to its compact type, leaving it unchanged if the values do not fit"""
+    if kind == 'category':
+        return column if isinstance(column.dtype, pd.CategoricalDtype) else column.astype('category')
+    if kind == 'date':
+        if pd.api.types.is_datetime64_dtype(column):
+            return column
+        # Solo la parte di data: gli orari e i fusi orari non servono
+        return pd.to_datetime(column.astype('string').str[:10], format='%Y-%m-%d', errors='coerce')
+    try:
+        return column.astype(kind)
+    except (TypeError, ValueError, OverflowError):
+        return column
+
+def compact(table_name, df):
+    """Return df with the compact column types of TABLE_TYPES (other tables are returned as they are).
+
+    Called whenever a table is loaded or patched, so rows added as dicts
+    (object columns after the concat) get the compact types back.
+    """
+    types = TABLE_TYPES.get(table_name)
+    if types is None or not isinstance(df, pd.DataFrame):
+        return df
+    return df.assign(**{column: _compact_column(df[column], kind)
+                        for column, kind in types.items() if column in df.columns})
+
+# Byte per riga delle tabelle come le costruisce il caricamento (da JSON o da
+# SQLite), prima di compact(): il riferimento di memory_report
+_loaded_row_bytes = {}
+
+def record_loaded_size(table_name, df):
+    """Record the memory per row of a table as loaded, before compact() converts it"""
+    if table_name in TABLE_TYPES and len(df):
+        _loaded_row_bytes[table_name] = int(df.memory_usage(deep=True).sum()) / len(df)
+
+def memory_report(tables):
+    """Return the rows and bytes of each DataFrame in tables ({name: df}), with the
+    compact types and as built by the last full load (scaled to the current rows).
+
+    The loaded size is None for tables never loaded in this process.
+    """
+    report = pd.DataFrame.from_dict({
+        table_name: {
+            'righe': len(df),
+            'byte_caricati': (round(_loaded_row_bytes[table_name] * len(df))
+                              if table_name in _loaded_row_bytes else None),
+            'byte_compatti': int(df.memory_usage(deep=True).sum()),
+        }
+        for table_name, df in tables.items()
+    }, orient='index').astype({'byte_caricati': 'Int64'})
+    report['riduzione_%'] = (100 * (1 - report['byte_compatti'] / report['byte_caricati'])).round(1)
+    return report
@@ -0,0 +1,144 @@
+import os
+import queue
+import threading
+import time
+import uuid
+from collections import Counter, namedtuple
+
+import httpx
+from postgrest.exceptions import APIError
+
+# Secondi di attesa per raccogliere altre scritture nello stesso blocco
+WRITE_BATCH_WINDOW = float(os.environ.get("WRITE_BATCH_WINDOW", 0.2))
+
+# Tentativi ripetuti su un errore temporaneo (connessione non riuscita, conflitto)
+WRITE_RETRIES = 3
+
+# Attesa prima del primo nuovo tentativo, raddoppiata a ogni tentativo
+WRITE_RETRY_DELAY = 0.5
+
+# Prefisso degli id provvisori delle righe inserite in attesa di conferma
+PENDING_ID_PREFIX = 'pending-'
+
+# Classi SQLSTATE degli errori temporanei: connessione, rollback per conflitto,
+# risorse esaurite, intervento dell'operatore (es. riavvio del database)
+TRANSIENT_SQLSTATES = ('08', '40', '53', '57')
+
+# Una scrittura in coda: key è l'id provvisorio (insert) o l'id da eliminare (delete),
+# row i dati da inserire o la riga eliminata (per ripristinarla se l'eliminazione fallisce)
+Write = namedtuple('Write', 'session table operation key row')
+
+# Esito di una scrittura: apply porta i DataFrame della sessione allo stato confermato
+Result = namedtuple('Result', 'write ok error apply')
+
+
+def pending_id():
+    """Return a new provisional id for an optimistic row"""
+    return f"{PENDING_ID_PREFIX}{uuid.uuid4().hex}"
+
+def is_pending_id(value):
+    """Tell whether value is a provisional id not yet replaced by the server one"""
+    return str(value).startswith(PENDING_ID_PREFIX)
+
+def is_transient(error):
+    """Tell whether a failed write is worth retrying.
+
+    Only errors where the server surely did not apply the write: a read
+    timeout after the request was sent could repeat an insert.
+    """
+    if isinstance(error, APIError):
+        return str(error.code or '')[:2] in TRANSIENT_SQLSTATES
+    return isinstance(error, (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout))
+
+def with_retries(func, retries=WRITE_RETRIES, delay=WRITE_RETRY_DELAY):
+    """Call func, retrying transient errors with exponential backoff"""
+    for attempt in range(retries + 1):
+        try:
+            return func()
+        except Exception as e:
+            if attempt == retries or not is_transient(e):
+                raise
+            time.sleep(delay * 2 ** attempt)
+
+
+def batch_writes(writes):
+    """Split writes, in arrival order, into runs of consecutive writes on the same table and operation.
+
+    Batches keep FIFO order: a delete never runs before an earlier insert of the same row.
+    """
+    batches = []
+    for write in writes:
+        if batches and (batches[-1][0].table, batches[-1][0].operation) == (write.table, write.operation):
+            batches[-1].append(write)
+        else:
+            batches.append([write])
+    return batches
+
+
+class WriteQueue:
+    """Background thread running queued writes in batches of consecutive writes
+    on the same table and operation.
+
+    flush(table, operation, writes) runs one batch and returns a Result per
+    write. Results are kept per session until the session takes them, so
+    every page shows the outcome of its own writes.
+    """
+
+    def __init__(self, flush):
+        self._flush = flush
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._pending = Counter()
+        self._results = {}
+        self._thread = None
+
+    def submit(self, write):
+        """Queue a write, starting the worker thread if needed"""
+        with self._lock:
+            self._pending[write.session] += 1
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="write-queue", daemon=True)
+                self._thread.start()
+        self._queue.put(write)
+
+    def pending(self, session):
+        """Return how many writes of session are still queued or running"""
+        with self._lock:
+            return self._pending[session]
+
+    def take_results(self, session):
+        """Return and forget the results of session collected so far"""
+        with self._lock:
+            return self._results.pop(session, [])
+
+    def _run(self):
+        """Wait for writes and run them in batches"""
+        while True:
+            writes = [self._queue.get()]
+            deadline = time.monotonic() + WRITE_BATCH_WINDOW
+            while (remaining := deadline - time.monotonic()) > 0:
+                try:
+                    writes.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            for batch in batch_writes(writes):
+                self._run_batch(batch)
+
+    def _run_batch(self, batch):
+        """Flush one batch and record a Result for every write of it"""
+        try:
+            results = list(self._flush(batch[0].table, batch[0].operation, batch))
+        except Exception as e:
+            results = [Result(write, False, str(e), None) for write in batch]
+        # Una scrittura senza esito conta come fallita, così pending() torna a zero
+        reported = Counter(id(result.write) for result in results)
+        for write in batch:
+            if reported[id(write)]:
+                reported[id(write)] -= 1
+            else:
+                results.append(Result(write, False, "Nessun esito per la scrittura", None))
+        with self._lock:
+            for result in results:
+                self._pending[result.write.session] -= 1
+                self._results.setdefault(result.write.session, []).append(result)